@@ -29,6 +29,7 @@ setup(
     license="MIT",
     package_dir={"": "src"},
     install_requires=requirements,
+    extras_require={"stats": ["scipy>=1.5"]},
     python_requires=">=3.8",
     classifiers=[
         "Intended Audience :: Science/Research",
@@ -7,11 +7,22 @@ logger.init(LoggerStream=sys.stdout)
 log = logging.getLogger("ma5_expert")
 log.setLevel(logging.INFO)
 
+from ma5_expert import aio
 from ma5_expert import cutflow
 from ma5_expert import histogram
 from ma5_expert import pad
+from ma5_expert import sample
+from ma5_expert import scan
+from ma5_expert import statistics
 from ma5_expert.backend import BackendManager, PADType
 from ._version import __version__
 
-
-__all__ = cutflow.__all__ + histogram.__all__ + pad.__all__ + ["BackendManager", "PADType"]
+__all__ = (
+    aio.__all__
+    + cutflow.__all__
+    + histogram.__all__
+    + pad.__all__
+    + sample.__all__
+    + scan.__all__
+    + ["BackendManager", "PADType"]
+)
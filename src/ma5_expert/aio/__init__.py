@@ -0,0 +1,3 @@
+from .runner import AsyncRunner
+
+__all__ = ["AsyncRunner"]
@@ -0,0 +1,186 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import (
+    Text,
+    Optional,
+    Callable,
+    Any,
+    Mapping,
+    Iterable,
+    Awaitable,
+    AsyncIterator,
+    Tuple,
+    Union,
+    Hashable,
+)
+
+from ma5_expert.backend import PADType
+from ma5_expert.cutflow import Collection as CutFlowCollection
+from ma5_expert.histogram import Collection as HistogramCollection
+from ma5_expert.pad import PADInterface
+from ma5_expert.sample import SampleCollection
+
+log = logging.getLogger("ma5_expert")
+
+
+class AsyncRunner:
+    """
+    Awaitable counterparts of the blocking ma5_expert API.
+
+    Blocking calls are executed on an executor while at most ``max_concurrency`` of them run
+    at the same time, hence thousands of tasks can be scheduled at once. Cancelling an
+    awaiting task releases its slot; a call which is already running on the executor can
+    not be interrupted and its result is discarded.
+
+    Parameters
+    ----------
+    executor: Optional[concurrent.futures.Executor]
+        executor of the blocking calls. If None, a thread pool with ``max_concurrency``
+        workers is created. Process pools require picklable arguments.
+    max_concurrency: int
+        maximum number of calls running at the same time.
+    """
+
+    def __init__(self, executor: Optional[Executor] = None, max_concurrency: int = 4):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency should be at least one.")
+        self.max_concurrency = max_concurrency
+        self._executor = executor
+        self._own_executor = executor is None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def executor(self) -> Executor:
+        """Executor of the blocking calls"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_concurrency, thread_name_prefix="ma5_expert"
+            )
+        return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            # semaphores are bound to the event loop they are used in
+            self._semaphore, self._loop = asyncio.Semaphore(self.max_concurrency), loop
+        return self._semaphore
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Execute a blocking function on the executor
+
+        Parameters
+        ----------
+        func: Callable
+            blocking function
+        *args, **kwargs:
+            arguments of the function
+
+        Returns
+        -------
+        Output of the function
+        """
+        async with self._get_semaphore():
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, functools.partial(func, *args, **kwargs)
+            )
+
+    async def compute_exclusion(
+        self, interface: PADInterface, analysis: Text, xsection: float, padtype: PADType, **kwargs
+    ) -> dict:
+        """
+        Awaitable ``PADInterface.compute_exclusion``
+
+        Parameters
+        ----------
+        interface: ma5_expert.pad.PADInterface
+            PAD interface of the sample, remote interfaces are also accepted.
+        analysis: Text
+            name of the analysis
+        xsection: float
+            cross section value in pb.
+        padtype: ma5_expert.backend.PADType
+            detector backend of the analysis
+        **kwargs:
+            see ``PADInterface.compute_exclusion``
+
+        Returns
+        -------
+        Dictionary including exclusion information on each region
+        """
+        return await self.run(interface.compute_exclusion, analysis, xsection, padtype, **kwargs)
+
+    async def load_cutflows(self, cutflow_path: Text, **kwargs) -> CutFlowCollection:
+        """Awaitable ``ma5_expert.cutflow.Collection``"""
+        return await self.run(CutFlowCollection, cutflow_path, **kwargs)
+
+    async def load_histograms(self, original_file: Text, **kwargs) -> HistogramCollection:
+        """Awaitable ``ma5_expert.histogram.Collection``"""
+        return await self.run(HistogramCollection, original_file, **kwargs)
+
+    async def load_sample(self, sample_path: Text, **kwargs) -> SampleCollection:
+        """Awaitable ``ma5_expert.sample.SampleCollection``"""
+        return await self.run(SampleCollection, sample_path, **kwargs)
+
+    async def as_completed(
+        self,
+        tasks: Union[Mapping[Hashable, Awaitable], Iterable[Awaitable]],
+        return_exceptions: bool = False,
+    ) -> AsyncIterator[Tuple[Hashable, Any]]:
+        """
+        Yield results in completion order
+
+        Parameters
+        ----------
+        tasks: Union[Mapping[Hashable, Awaitable], Iterable[Awaitable]]
+            awaitables to be executed, e.g. ``runner.load_sample(path)``. If a mapping is
+            given results are labelled by its keys, otherwise by the position of the
+            awaitable.
+        return_exceptions: bool
+            if True, exceptions are yielded as results, otherwise the first exception is
+            raised and the remaining tasks are cancelled.
+
+        Yields
+        ------
+        label and result of each task. Tasks which are not completed are cancelled when
+        the generator is closed.
+        """
+        items = tasks.items() if isinstance(tasks, Mapping) else enumerate(tasks)
+        pending = {}
+        for label, awaitable in items:
+            pending[asyncio.ensure_future(awaitable)] = label
+
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    label = pending.pop(task)
+                    if task.cancelled():
+                        result = asyncio.CancelledError()
+                    else:
+                        result = task.exception()
+                        if result is None:
+                            result = task.result()
+                        elif not return_exceptions:
+                            raise result
+                    yield label, result
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending.keys(), return_exceptions=True)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Shut down the executor if it has been created by the runner"""
+        if self._own_executor and self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.shutdown(wait=False)
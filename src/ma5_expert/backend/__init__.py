@@ -11,6 +11,8 @@ class BackendManager:
         dev_mode: bool = False,
         enforce_pad: bool = False,
         enforce_padforsfs: bool = False,
+        use_snapshot: bool = False,
+        snapshot_path: str = None,
     ) -> None:
         """
         madanalysis_path: str
@@ -23,6 +25,10 @@ class BackendManager:
             Enforce PAD. Note that this assumes that PAD is installed.
         enforce_padforsfs: Optional[bool]
             Enforce PADForSFS. Note that this assumes that PADForSFS is installed.
+        use_snapshot: Optional[bool]
+            Reuse the MadAnalysis 5 configuration checked during a previous start.
+        snapshot_path: Optional[str]
+            Path of the configuration snapshot.
         """
         BackendManager.MadAnalysis5 = MadAnalysisBackend(
             madanalysis_path,
@@ -30,4 +36,6 @@ class BackendManager:
             dev_mode,
             enforce_pad,
             enforce_padforsfs,
+            use_snapshot,
+            snapshot_path,
         )
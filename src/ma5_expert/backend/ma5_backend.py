@@ -2,8 +2,12 @@ from dataclasses import dataclass
 import os, sys
 
 from ma5_expert.system.exceptions import MadAnalysisPath
+from .snapshot import default_snapshot_path, fingerprint, load_snapshot, save_snapshot
 from typing import Optional, Text, Union
 from enum import Enum, auto
+import logging
+
+log = logging.getLogger("ma5_expert")
 
 
 class PADType(Enum):
@@ -53,6 +57,12 @@ class MadAnalysisBackend:
         Enforce PAD. Note that this assumes that PAD is installed.
     enforce_padforsfs: Optional[bool]
         Enforce PADForSFS. Note that this assumes that PADForSFS is installed.
+    use_snapshot: Optional[bool]
+        Reuse the configuration checked during a previous start. The configuration is
+        checked and stored after the first start and the snapshot is invalidated when the
+        MadAnalysis 5 tree changes.
+    snapshot_path: Optional[str]
+        Path of the configuration snapshot. Default is under ``~/.cache/ma5_expert``.
     """
 
     madanalysis_path: str
@@ -60,6 +70,8 @@ class MadAnalysisBackend:
     dev_mode: Optional[bool] = False
     enforce_pad: Optional[bool] = False
     enforce_padforsfs: Optional[bool] = False
+    use_snapshot: Optional[bool] = False
+    snapshot_path: Optional[str] = None
 
     def __post_init__(self):
         # Setup MadAnalysis 5
@@ -90,8 +102,22 @@ class MadAnalysisBackend:
         self.ma5_main.InitObservables(self.ma5_main.mode)
         self.ma5_main.archi_info.ma5dir = self.madanalysis_path
 
-        self.ma5_main.CheckConfig(debug=self.debug_mode)
-        self.ma5_main.CheckConfig2(debug=self.debug_mode)
+        if not (self.use_snapshot and self._restore_config()):
+            environ, syspath = dict(os.environ), list(sys.path)
+            checked = [
+                self.ma5_main.CheckConfig(debug=self.debug_mode),
+                self.ma5_main.CheckConfig2(debug=self.debug_mode),
+            ]
+            # only a successfully checked configuration is stored
+            if self.use_snapshot and False not in checked:
+                save_snapshot(
+                    self.snapshot_path,
+                    self._fingerprint(),
+                    self.ma5_main.archi_info,
+                    self.ma5_main.session_info,
+                    {k: v for k, v in os.environ.items() if environ.get(k, None) != v},
+                    [x for x in sys.path if x not in syspath],
+                )
         self.ma5_main.recast = "on"
         # Enforce pad note that this requires PAD to be downloaded otherwise the code will crash
         if not self.ma5_main.session_info.has_pad:
@@ -99,6 +125,35 @@ class MadAnalysisBackend:
         if not self.ma5_main.session_info.has_padsfs:
             self.ma5_main.session_info.has_padsfs = self.enforce_padforsfs
 
+    def _fingerprint(self) -> Text:
+        return fingerprint(
+            self.madanalysis_path, debug_mode=self.debug_mode, dev_mode=self.dev_mode
+        )
+
+    def _restore_config(self) -> bool:
+        """
+        Restore the checked configuration from the snapshot
+
+        Returns
+        -------
+        bool:
+            True if the configuration has been restored
+        """
+        if self.snapshot_path is None:
+            self.snapshot_path = default_snapshot_path(self.madanalysis_path)
+        snapshot = load_snapshot(self.snapshot_path, self._fingerprint())
+        if snapshot is None:
+            return False
+
+        vars(self.ma5_main.archi_info).update(snapshot["archi_info"])
+        vars(self.ma5_main.session_info).update(snapshot["session_info"])
+        os.environ.update(snapshot["environ"])
+        for path in reversed(snapshot["syspath"]):
+            if path not in sys.path:
+                sys.path.insert(0, path)
+        log.debug(f"MadAnalysis 5 configuration has been restored from {self.snapshot_path}")
+        return True
+
     def get_run_recast(
         self,
         sample_path: Text,
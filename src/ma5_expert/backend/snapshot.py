@@ -0,0 +1,119 @@
+import hashlib
+import logging
+import os
+import pickle
+import sys
+from typing import Text, Dict, Optional, Any
+
+from ma5_expert._version import __version__
+
+log = logging.getLogger("ma5_expert")
+
+# Entries of the MadAnalysis 5 tree whose modification invalidates the snapshot
+_TRACKED = [
+    "",
+    "version.txt",
+    "bin",
+    "madanalysis",
+    "madanalysis/input",
+    "tools",
+    "tools/PAD",
+    "tools/PADForSFS",
+    "tools/SampleAnalyzer",
+    "tools/SampleAnalyzer/Lib",
+    "tools/SampleAnalyzer/Bin",
+]
+
+
+def default_snapshot_path(madanalysis_path: Text) -> Text:
+    """Default location of the configuration snapshot of a MadAnalysis 5 installation"""
+    cache_dir = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    name = hashlib.sha256(os.path.realpath(madanalysis_path).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, "ma5_expert", f"backend-{name}.pkl")
+
+
+def fingerprint(madanalysis_path: Text, **settings) -> Text:
+    """
+    Fingerprint of a MadAnalysis 5 installation, changes whenever the tree is modified,
+    e.g. a tool is installed, as well as with the python and ma5_expert versions.
+    """
+    digest = hashlib.sha256()
+    digest.update(os.path.realpath(madanalysis_path).encode())
+    digest.update(f"{sys.version}|{__version__}|{sorted(settings.items())}".encode())
+    for entry in _TRACKED:
+        path = os.path.join(madanalysis_path, entry)
+        try:
+            stat = os.stat(path)
+            digest.update(f"{entry}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+        except FileNotFoundError:
+            digest.update(f"{entry}:missing".encode())
+    return digest.hexdigest()
+
+
+def save_snapshot(
+    snapshot_path: Text,
+    fingerprint_value: Text,
+    archi_info: Any,
+    session_info: Any,
+    environ: Dict[Text, Text],
+    syspath: list,
+) -> bool:
+    """
+    Save checked configuration of MadAnalysis 5
+
+    Parameters
+    ----------
+    snapshot_path: Text
+        snapshot file
+    fingerprint_value: Text
+        fingerprint of the installation
+    archi_info: Any
+        architecture information of MadAnalysis 5 main
+    session_info: Any
+        session information of MadAnalysis 5 main
+    environ: Dict[Text, Text]
+        environment variables set during the configuration check
+    syspath: list
+        entries added to ``sys.path`` during the configuration check
+
+    Returns
+    -------
+    bool:
+        True if the snapshot has been written
+    """
+    snapshot = {
+        "fingerprint": fingerprint_value,
+        "archi_info": vars(archi_info),
+        "session_info": vars(session_info),
+        "environ": environ,
+        "syspath": syspath,
+    }
+    try:
+        os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+        tmp = f"{snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(snapshot, f)
+        os.replace(tmp, snapshot_path)
+    except Exception as err:
+        log.debug(f"Can not write MadAnalysis 5 configuration snapshot: {err}")
+        return False
+    return True
+
+
+def load_snapshot(snapshot_path: Text, fingerprint_value: Text) -> Optional[Dict]:
+    """
+    Load the checked configuration of MadAnalysis 5, None if the snapshot does not exist or
+    the installation has changed since it has been written.
+    """
+    if not os.path.isfile(snapshot_path):
+        return None
+    try:
+        with open(snapshot_path, "rb") as f:
+            snapshot = pickle.load(f)
+    except Exception as err:
+        log.debug(f"Can not read MadAnalysis 5 configuration snapshot: {err}")
+        return None
+    if snapshot.get("fingerprint", None) != fingerprint_value:
+        log.debug("MadAnalysis 5 installation has changed, snapshot is invalid.")
+        return None
+    return snapshot
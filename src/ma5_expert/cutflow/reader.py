@@ -28,6 +28,9 @@ class Collection:
                 Name of the collection. The default is SR-Collection
             lumi : FLOAT
                 Luminosity overwrite. The Default is 1e-3
+            files : LIST
+                Cutflow files to be read, e.g. taken from ``ma5_expert.scan.Catalogue``.
+                The default is all the saf files in the collection path.
 
         Raises
         ------
@@ -54,7 +57,7 @@ class Collection:
         if cutflow_path != "":
             if os.path.isdir(cutflow_path):
                 self.cutflow_path = os.path.normpath(cutflow_path)
-                self._readCollection(xsec, nevents)
+                self._readCollection(xsec, nevents, kwargs.get("files", None))
             else:
                 raise ValueError("Can't find the collection path! " + cutflow_path)
 
@@ -65,9 +68,20 @@ class Collection:
             if key == item:
                 return sr
 
-    def _readCollection(self, xsec: Optional[float] = None, nevents: Optional[float] = None):
-        for sr in [x for x in os.listdir(self.cutflow_path) if x.endswith(".saf")]:
-            fl = os.path.join(self.cutflow_path, sr)
+    def _readCollection(
+        self,
+        xsec: Optional[float] = None,
+        nevents: Optional[float] = None,
+        files: Optional[Sequence[Text]] = None,
+    ):
+        if files is None:
+            files = [
+                os.path.join(self.cutflow_path, x)
+                for x in os.listdir(self.cutflow_path)
+                if x.endswith(".saf")
+            ]
+        for fl in files:
+            sr = os.path.basename(fl)
             with open(fl, "r") as f:
                 cutflow = f.readlines()
 
@@ -185,5 +199,5 @@ class Collection:
     def regiondata(self):
         regdat = {}
         for k, i in self.items():
-            regdat[k] = i.regiondata[i.name]
+            regdat[k] = i.regiondata[i.id]
         return regdat
@@ -1,3 +1,5 @@
 from .reader import Collection
+from .cube import HistogramCube
+from .optimise import CutResult, optimise_cuts
 
-__all__ = ["Collection"]
+__all__ = ["Collection", "HistogramCube", "CutResult", "optimise_cuts"]
@@ -0,0 +1,228 @@
+from dataclasses import dataclass, field
+from typing import Text, Sequence, Optional, MutableSequence
+
+import numpy as np
+
+from ma5_expert.system.exceptions import InvalidInput
+from .histo import Histogram
+from .reader import Collection
+
+
+def _flow(histogram: Histogram, attr: Text) -> float:
+    flow = getattr(histogram, attr, None)
+    return 0.0 if flow is None else flow.sumW
+
+
+@dataclass
+class HistogramCube:
+    """
+    One histogram gathered from many samples, e.g. the points of a scan, with shared bin
+    edges. Bin contents are stored as a ``(samples, bins)`` array so that normalisations and
+    comparisons across samples are single vectorised operations.
+
+    Parameters
+    ----------
+    name: Text
+        histogram name
+    edges: np.ndarray
+        bin edges, shape ``(nbins + 1,)``
+    sumw: np.ndarray
+        sum of weights of each bin, shape ``(nsamples, nbins)``
+    underflow: np.ndarray
+        sum of weights of the underflow bin of each sample
+    overflow: np.ndarray
+        sum of weights of the overflow bin of each sample
+    normalisation: np.ndarray
+        weight normalisation of each sample, see ``Histogram.weight_normalisation``
+    sumw2: np.ndarray
+        sum of squared weights of each sample
+    xsection: np.ndarray
+        cross section of each sample in pb
+    lumi: np.ndarray
+        luminosity of each sample in 1/fb
+    labels: MutableSequence[Text]
+        label of each sample
+    """
+
+    name: Text
+    edges: np.ndarray = field(repr=False)
+    sumw: np.ndarray = field(repr=False)
+    underflow: np.ndarray = field(repr=False)
+    overflow: np.ndarray = field(repr=False)
+    normalisation: np.ndarray = field(repr=False)
+    sumw2: np.ndarray = field(repr=False)
+    xsection: np.ndarray = field(repr=False)
+    lumi: np.ndarray = field(repr=False)
+    labels: MutableSequence[Text] = field(default_factory=list)
+
+    @classmethod
+    def from_collections(
+        cls,
+        name: Text,
+        collections: Sequence[Collection],
+        labels: Optional[Sequence[Text]] = None,
+    ) -> "HistogramCube":
+        """
+        Gather a histogram from histogram collections
+
+        Parameters
+        ----------
+        name: Text
+            histogram name
+        collections: Sequence[ma5_expert.histogram.Collection]
+            histogram collections, one per sample
+        labels: Optional[Sequence[Text]]
+            label of each sample, default the path of each collection.
+
+        Raises
+        ------
+        InvalidInput:
+            if a collection does not have the histogram or the bin edges do not match.
+        """
+        if len(collections) == 0:
+            raise InvalidInput("At least one collection is required.")
+        labels = [c.original_file for c in collections] if labels is None else list(labels)
+        if len(labels) != len(collections):
+            raise InvalidInput("Number of labels does not match the number of collections.")
+
+        histograms = []
+        for label, collection in zip(labels, collections):
+            if name not in collection.histo_names:
+                raise InvalidInput(f"Can not find histogram {name} in {label}")
+            histograms.append(collection[name])
+
+        edges = histograms[0].bins.astype(np.float64)
+        for label, histogram in zip(labels, histograms):
+            if histogram.size != len(edges) - 1 or not np.allclose(histogram.bins, edges):
+                raise InvalidInput(f"Bin edges of {name} in {label} do not match.")
+
+        return cls(
+            name=name,
+            edges=edges,
+            sumw=np.array([[b.sumW for b in h._bins] for h in histograms], dtype=np.float64),
+            underflow=np.array([_flow(h, "_underflow") for h in histograms], dtype=np.float64),
+            overflow=np.array([_flow(h, "_overflow") for h in histograms], dtype=np.float64),
+            normalisation=np.array([h.weight_normalisation for h in histograms], dtype=np.float64),
+            sumw2=np.array([h._sumWeightsSq for h in histograms], dtype=np.float64),
+            xsection=np.array([c.xsection for c in collections], dtype=np.float64),
+            lumi=np.array([c.luminosity for c in collections], dtype=np.float64),
+            labels=labels,
+        )
+
+    @property
+    def shape(self):
+        """Shape of the cube, ``(nsamples, nbins)``"""
+        return self.sumw.shape
+
+    @property
+    def xbins(self) -> np.ndarray:
+        """Central location of each bin"""
+        return (self.edges[:-1] + self.edges[1:]) / 2.0
+
+    def _scale(self, factor: np.ndarray) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(
+                self.normalisation[:, None] > 0.0,
+                self.sumw * (factor / self.normalisation)[:, None],
+                np.inf,
+            )
+
+    @property
+    def weights(self) -> np.ndarray:
+        """Normalised bin weights of each sample, see ``Histogram.weights``"""
+        return self._scale(np.ones(len(self.sumw)))
+
+    @property
+    def norm_weights(self) -> np.ndarray:
+        """Bin weights normalised to the cross section of each sample"""
+        return self._scale(self.xsection)
+
+    @property
+    def lumi_weights(self) -> np.ndarray:
+        """Bin weights normalised to the cross section and luminosity of each sample"""
+        return self._scale(self.xsection * 1000.0 * self.lumi)
+
+    @property
+    def variances(self) -> np.ndarray:
+        """
+        Variance of the luminosity normalised bin weights. MadAnalysis 5 does not store the
+        sum of squared weights per bin, hence the average squared weight of the histogram is
+        assumed for every entry of a bin.
+        """
+        total = self.sumw.sum(axis=1) + self.underflow + self.overflow
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean_weight = np.where(total > 0.0, self.sumw2 / total, 0.0)
+            scale = np.where(
+                self.normalisation > 0.0,
+                self.xsection * 1000.0 * self.lumi / self.normalisation,
+                0.0,
+            )
+        return self.sumw * (mean_weight * scale**2)[:, None]
+
+    @property
+    def shapes(self) -> np.ndarray:
+        """Bin weights of each sample normalised to unit area, zero for empty samples"""
+        area = self.sumw.sum(axis=1, keepdims=True)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(area > 0.0, self.sumw / area, 0.0)
+
+    def shape_distance(self, reference: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Kolmogorov-Smirnov distance between the shape of each sample and a reference shape
+
+        Parameters
+        ----------
+        reference: Optional[np.ndarray]
+            reference bin weights, default the average shape of all samples.
+
+        Returns
+        -------
+        np.ndarray:
+            distance of each sample, between zero and one.
+        """
+        shapes = self.shapes
+        if reference is None:
+            reference = shapes.mean(axis=0)
+        reference = np.asarray(reference, dtype=np.float64)
+        if reference.sum() > 0.0:
+            reference = reference / reference.sum()
+        return np.abs(np.cumsum(shapes, axis=1) - np.cumsum(reference)[None, :]).max(axis=1)
+
+    def interpolate(
+        self, parameters: Sequence[float], at: Sequence[float], normalised: bool = True
+    ) -> np.ndarray:
+        """
+        Linearly interpolate the bin weights along a one dimensional parameter of the samples,
+        e.g. a mass of a scan
+
+        Parameters
+        ----------
+        parameters: Sequence[float]
+            parameter value of each sample
+        at: Sequence[float]
+            parameter values to be interpolated to, values outside of the grid are clipped.
+        normalised: bool
+            interpolate luminosity normalised weights, otherwise normalised weights.
+
+        Returns
+        -------
+        np.ndarray:
+            interpolated bin weights with shape ``(len(at), nbins)``
+        """
+        parameters = np.asarray(parameters, dtype=np.float64)
+        if parameters.shape != (len(self.sumw),):
+            raise InvalidInput("A parameter value is required for each sample.")
+        order = np.argsort(parameters)
+        grid = parameters[order]
+        values = (self.lumi_weights if normalised else self.weights)[order]
+        if len(grid) == 1:
+            return np.repeat(values, len(np.atleast_1d(at)), axis=0)
+
+        at = np.clip(np.atleast_1d(np.asarray(at, dtype=np.float64)), grid[0], grid[-1])
+        upper = np.clip(np.searchsorted(grid, at, side="right"), 1, len(grid) - 1)
+        lower = upper - 1
+        with np.errstate(divide="ignore", invalid="ignore"):
+            frac = np.where(
+                grid[upper] > grid[lower], (at - grid[lower]) / (grid[upper] - grid[lower]), 0.0
+            )
+        return values[lower] * (1.0 - frac)[:, None] + values[upper] * frac[:, None]
@@ -1,7 +1,7 @@
 import numpy as np
 from copy import deepcopy
 from .bin import Bin
-from typing import Text, Union, MutableSequence
+from typing import Text, Union, MutableSequence, Optional
 from dataclasses import dataclass, field
 
 
@@ -26,6 +26,7 @@ class Histogram:
     _xmax: float = field(init=False, default=0, repr=False)
     _bins: MutableSequence[Bin] = field(default_factory=list, init=False, repr=False)
     _normalisation_frac: Union[float, Text] = field(init=False, default="_normEwEvents", repr=False)
+    _prefix: Optional[np.ndarray] = field(init=False, default=None, repr=False, compare=False)
 
     def __str__(self) -> Text:
         return (
@@ -68,6 +69,7 @@ class Histogram:
         AssertionError:
             If the histogram name and ID information does not match the info can not be added.
         """
+        self._prefix = None
         if self.ID == -1 and self.name == "__unknown_histo__" and len(self._bins) == 0:
             self.ID = int(bin_info["ID"])
             self.name = bin_info["name"]
@@ -207,3 +209,64 @@ class Histogram:
             bins.remove(self._bins[idx])
         bins[-1] = last_bin
         self._bins = bins
+        self._prefix = None
+
+    @property
+    def prefix_sums(self) -> np.ndarray:
+        """
+        Cumulative sum of weights starting from the underflow bin, shape ``(size + 3,)``.
+        The first entry is zero, entry ``k + 1`` is the sum of weights below the ``k``-th
+        bin edge (underflow included) and the last entry is the total sum of weights
+        including the overflow. The sums are computed once and cached.
+        """
+        if self._prefix is None:
+            flow = (
+                [getattr(self, "_underflow", None)]
+                + self._bins
+                + [getattr(self, "_overflow", None)]
+            )
+            sumw = np.array([0.0 if b is None else b.sumW for b in flow], dtype=np.float64)
+            self._prefix = np.concatenate([[0.0], np.cumsum(sumw)])
+            self._prefix.flags.writeable = False
+        return self._prefix
+
+    def _normalise(self, sumw: np.ndarray) -> np.ndarray:
+        norm = self.weight_normalisation
+        return sumw / norm if norm > 0 else np.full_like(sumw, np.inf)
+
+    def cumulative(self, above: bool = False) -> np.ndarray:
+        """
+        Normalised sum of weights below (or above) each bin edge, including the underflow
+        (overflow) bin.
+
+        Parameters
+        ----------
+        above: bool
+            if True return the weights above each bin edge, otherwise below.
+
+        Returns
+        -------
+        np.ndarray:
+            one entry per bin edge, see ``bins``.
+        """
+        prefix = self.prefix_sums
+        below = prefix[1 : self.size + 2]
+        return self._normalise(prefix[-1] - below if above else below)
+
+    def integral(self, xmin: Optional[float] = None, xmax: Optional[float] = None) -> float:
+        """
+        Normalised sum of weights between ``xmin`` and ``xmax``. Both limits are rounded to
+        the closest bin edge, a missing limit extends the range to the underflow or the
+        overflow bin.
+
+        Parameters
+        ----------
+        xmin: Optional[float]
+            lower limit
+        xmax: Optional[float]
+            upper limit
+        """
+        prefix, edges = self.prefix_sums, self.bins
+        low = 0 if xmin is None else int(np.argmin(np.abs(edges - xmin))) + 1
+        high = self.size + 2 if xmax is None else int(np.argmin(np.abs(edges - xmax))) + 1
+        return float(self._normalise(np.array(prefix[max(high, low)] - prefix[low])))
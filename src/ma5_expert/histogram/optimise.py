@@ -0,0 +1,189 @@
+from dataclasses import dataclass
+from typing import Text, Sequence, Optional, MutableSequence, Union, Callable, Dict
+
+import numpy as np
+
+from ma5_expert.system.exceptions import InvalidInput
+from .reader import Collection, Filter
+
+KINDS = ("above", "below", "window")
+
+
+def _asimov(nsignal: np.ndarray, nbkg: np.ndarray, sys: float = 0.0) -> np.ndarray:
+    """Vectorised version of ``FoM.asimovZ``, arXiv:1007.1727"""
+    tot = nsignal + nbkg
+    if sys <= 0.0:
+        return np.sqrt(2.0 * np.maximum(tot * np.log(tot / nbkg) - nsignal, 0.0))
+    varb = (nbkg * sys) ** 2
+    return np.sqrt(
+        np.maximum(
+            2.0
+            * (
+                tot * np.log((tot * (varb + nbkg)) / (nbkg**2 + tot * varb))
+                - (nbkg**2 / varb) * np.log(1.0 + (varb * nsignal) / (nbkg * (nbkg + varb)))
+            ),
+            0.0,
+        )
+    )
+
+
+FIGURES_OF_MERIT: Dict[Text, Callable] = {
+    "sig": lambda s, b, sys: s / np.sqrt(b + (b * sys) ** 2),
+    "S_B": lambda s, b, sys: s / b,
+    "S_SB": lambda s, b, sys: s / (s + b),
+    "S_sqSB": lambda s, b, sys: s / np.sqrt(s + b),
+    "asimovZ": _asimov,
+}
+
+
+@dataclass(frozen=True)
+class CutResult:
+    """
+    Best cut on a histogram
+
+    Parameters
+    ----------
+    histogram: Text
+        histogram name
+    kind: Text
+        ``above`` keeps the events above ``low``, ``below`` keeps the events below ``high``
+        and ``window`` keeps the events between ``low`` and ``high``.
+    low: Optional[float]
+        lower threshold, None if there is none
+    high: Optional[float]
+        upper threshold, None if there is none
+    signal: float
+        number of signal events passing the cut
+    background: float
+        number of background events passing the cut
+    fom: float
+        figure of merit
+    """
+
+    histogram: Text
+    kind: Text
+    low: Optional[float]
+    high: Optional[float]
+    signal: float
+    background: float
+    fom: float
+
+
+def _events(collection: Collection, name: Text, lumi: Optional[float]) -> np.ndarray:
+    """Prefix sums of a histogram in number of events"""
+    histogram = collection[name]
+    lumi = collection.lumi if lumi is None else lumi
+    return histogram._normalise(histogram.prefix_sums) * collection.xsection * 1000.0 * lumi
+
+
+def _candidates(prefix: np.ndarray, kind: Text) -> np.ndarray:
+    """Number of events passing each cut, one entry per cut on the bin edges"""
+    below = prefix[1:-1]
+    if kind == "above":
+        return prefix[-1] - below
+    elif kind == "below":
+        return below
+    low, high = np.triu_indices(len(below), k=1)
+    return below[high] - below[low]
+
+
+def optimise_cuts(
+    signal: Collection,
+    background: Union[Collection, Sequence[Collection]],
+    fom: Union[Text, Callable] = "asimovZ",
+    names: Filter = None,
+    kinds: Sequence[Text] = KINDS,
+    sys: float = 0.0,
+    min_background: float = 0.0,
+    lumi: Optional[float] = None,
+) -> MutableSequence[CutResult]:
+    """
+    Find the thresholds maximising a figure of merit for each histogram.
+
+    Every one-sided cut and every window on the bin edges of each histogram is evaluated
+    in one vectorised sweep using the cached prefix sums of the histograms, see
+    ``Histogram.prefix_sums``. Under and overflow bins are included in the one-sided
+    cuts. Signal and backgrounds are normalised to their cross sections and luminosities.
+
+    Parameters
+    ----------
+    signal: Collection
+        signal histograms
+    background: Union[Collection, Sequence[Collection]]
+        background histograms, multiple collections are summed.
+    fom: Union[Text, Callable]
+        figure of merit, one of ``FIGURES_OF_MERIT`` or a function taking the number of
+        signal events, the number of background events and ``sys`` as arrays.
+    names: Optional[Union[Text, Sequence[Text]]]
+        histogram names or regular expressions, default all histograms of the signal
+        collection that exist in all the background collections.
+    kinds: Sequence[Text]
+        types of cuts to be tested, see ``CutResult``.
+    sys: float
+        relative background systematic uncertainty.
+    min_background: float
+        cuts leaving this number of background events or less are ignored.
+    lumi: Optional[float]
+        luminosity in 1/fb, overwrites the luminosity of the collections.
+
+    Returns
+    -------
+    MutableSequence[CutResult]:
+        best cut of each histogram and kind, sorted by decreasing figure of merit.
+
+    Raises
+    ------
+    InvalidInput:
+        if the figure of merit or the kind of cut is unknown or the bin edges of the
+        signal and background histograms do not match.
+    """
+    if isinstance(fom, str):
+        if fom not in FIGURES_OF_MERIT:
+            raise InvalidInput(
+                f"Unknown figure of merit: {fom}. Available: {', '.join(FIGURES_OF_MERIT)}"
+            )
+        fom = FIGURES_OF_MERIT[fom]
+    if any(kind not in KINDS for kind in kinds):
+        raise InvalidInput(f"Unknown kind of cut, available: {', '.join(KINDS)}")
+    background = [background] if isinstance(background, Collection) else list(background)
+
+    histograms = signal.select(names) if names is not None else signal.histo_names
+    results = []
+    for name in histograms:
+        if any(name not in bkg.histo_names for bkg in background):
+            continue
+        edges = signal[name].bins
+        for bkg in background:
+            if not np.allclose(bkg[name].bins, edges):
+                raise InvalidInput(f"Bin edges of {name} do not match.")
+        sig_prefix = _events(signal, name, lumi)
+        bkg_prefix = np.sum([_events(bkg, name, lumi) for bkg in background], axis=0)
+
+        for kind in kinds:
+            nsig, nbkg = _candidates(sig_prefix, kind), _candidates(bkg_prefix, kind)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                values = fom(nsig, nbkg, sys)
+            values = np.where((nbkg > min_background) & np.isfinite(values), values, -np.inf)
+            if len(values) == 0 or not np.isfinite(values.max()):
+                continue
+            best = int(np.argmax(values))
+            if kind == "above":
+                low, high = edges[best], None
+            elif kind == "below":
+                low, high = None, edges[best]
+            else:
+                low_idx, high_idx = np.triu_indices(len(edges), k=1)
+                low, high = edges[low_idx[best]], edges[high_idx[best]]
+            results.append(
+                CutResult(
+                    histogram=name,
+                    kind=kind,
+                    low=None if low is None else float(low),
+                    high=None if high is None else float(high),
+                    signal=float(nsig[best]),
+                    background=float(nbkg[best]),
+                    fom=float(values[best]),
+                )
+            )
+
+    return sorted(results, key=lambda x: x.fom, reverse=True)
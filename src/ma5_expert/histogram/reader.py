@@ -1,10 +1,62 @@
-import os, re
+import io, os, re, tempfile, threading
 import numpy as np
 from decimal import Decimal
-from typing import Text, MutableSequence, Union, Iterable, Tuple, Optional
+from typing import Text, MutableSequence, Union, Iterable, Tuple, Optional, Sequence, Callable, Dict
 from dataclasses import dataclass, field
 from collections import OrderedDict
 from .histo import Histogram
+from .yoda_writer import write_yoda
+
+Filter = Optional[Union[Text, Sequence[Text]]]
+
+# guards the replacement of lazily decoded histograms
+_decode_lock = threading.Lock()
+
+
+def _matcher(patterns: Filter) -> Optional[Callable[[Text], bool]]:
+    """
+    Match a value against names or regular expressions. Exact names are checked first,
+    values which are not valid regular expressions, e.g. ``SRA_Mh(``, only match exactly.
+    """
+    if patterns is None:
+        return None
+    patterns = [patterns] if isinstance(patterns, str) else list(patterns)
+    exact, compiled = set(patterns), []
+    for pattern in patterns:
+        try:
+            compiled.append(re.compile(pattern))
+        except re.error:
+            continue
+    return lambda value: value in exact or any(x.fullmatch(value) for x in compiled)
+
+
+def histogram_filter(names: Filter = None, regions: Filter = None) -> Optional[Callable]:
+    """
+    Construct a histogram selection function
+
+    Parameters
+    ----------
+    names: Optional[Union[Text, Sequence[Text]]]
+        histogram names or regular expressions, a histogram is selected if one of them
+        matches its name.
+    regions: Optional[Union[Text, Sequence[Text]]]
+        region names or regular expressions, a histogram is selected if one of them
+        matches one of its regions.
+
+    Returns
+    -------
+    function taking the name and the regions of a histogram, None if there is no filter.
+    """
+    name_match, region_match = _matcher(names), _matcher(regions)
+    if name_match is None and region_match is None:
+        return None
+
+    def select(name: Text, histo_regions: Sequence[Text]) -> bool:
+        return (name_match is None or name_match(name)) and (
+            region_match is None or any(region_match(reg) for reg in histo_regions)
+        )
+
+    return select
 
 
 @dataclass
@@ -19,25 +71,58 @@ class Collection:
         Luminosity value in 1/fb
     original_file: Text
         exact path to MadAnalysis histogram output
+    names: Optional[Union[Text, Sequence[Text]]]
+        only load the histograms whose name matches one of these names or regular
+        expressions. Default all histograms.
+    regions: Optional[Union[Text, Sequence[Text]]]
+        only load the histograms defined in a region matching one of these names or
+        regular expressions. Default all histograms.
+    lazy: bool
+        if True, only the names, regions and positions of the histograms are read and each
+        histogram is decoded when it is accessed for the first time.
     """
 
     original_file: Text
     _histograms: OrderedDict = field(default_factory=OrderedDict, init=False, repr=False)
     xsection: float = field(default=1.0, init=True)
     lumi: float = field(default=1e-3, init=True)
+    names: Filter = field(default=None, repr=False)
+    regions: Filter = field(default=None, repr=False)
+    lazy: bool = field(default=False, repr=False)
+    _blocks: Dict[Text, Tuple[int, Tuple[int, int]]] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    _region_index: Dict[Text, MutableSequence[Text]] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    _normalisation: Optional[float] = field(default=None, init=False, repr=False)
+    _sums: Dict[Text, np.ndarray] = field(default_factory=dict, init=False, repr=False)
+    _statistics: Optional[Dict[Text, np.ndarray]] = field(default=None, init=False, repr=False)
 
     def __post_init__(self) -> None:
-        rows = self._readHistos(self.original_file)
-        for idx in np.unique([r["ID"] for r in rows]):
-            current_histo = Histogram()
-            for hbin in rows:
-                if hbin["ID"] == idx:
-                    current_histo._add_bin(hbin)
-            self.append(current_histo)
+        select = histogram_filter(self.names, self.regions)
+        if self.lazy:
+            for ID, name, regions, block in self._indexHistos(self.original_file, select):
+                if name in self._histograms:
+                    raise ValueError("Histogram already exists.")
+                self._histograms[name] = None
+                self._blocks[name] = (ID, block)
+                for region in regions:
+                    self._region_index.setdefault(region, []).append(name)
+            return
+
+        rows = self._readHistos(self.original_file, select)
+        histograms = OrderedDict()
+        for hbin in rows:
+            if hbin["ID"] not in histograms:
+                histograms[hbin["ID"]] = Histogram()
+            histograms[hbin["ID"]]._add_bin(hbin)
+        for histogram in histograms.values():
+            self.append(histogram)
 
     def __str__(self) -> Text:
         txt = f"Collection of {len(self.histo_names)} histograms from `{self.original_file}`"
-        for key, item in self._histograms.items():
+        for key, item in self.items():
             txt += "\n   * " + str(item)
         return txt
 
@@ -54,14 +139,132 @@ class Collection:
         sumW: float
             sum of weights
         """
-        for key, item in self.items():
-            item.weight_normalisation = sumW
+        self._normalisation = sumW
+        for key, item in self._histograms.items():
+            if item is not None:
+                item.weight_normalisation = sumW
 
     def append(self, histogram: Histogram):
         assert isinstance(histogram, Histogram), "Wrong type of input."
         if histogram.name in self.histo_names:
             raise ValueError("Histogram already exists.")
         self._histograms.update({histogram.name: histogram})
+        self._statistics = None
+        for region in histogram.regions:
+            self._region_index.setdefault(region, []).append(histogram.name)
+
+    @property
+    def region_index(self) -> Dict[Text, MutableSequence[Text]]:
+        """Names of the histograms defined in each region"""
+        return {key: list(item) for key, item in self._region_index.items()}
+
+    def select(self, names: Filter = None, regions: Filter = None) -> MutableSequence[Text]:
+        """
+        Names of the histograms matching the given names or regions, see ``Collection``.
+        """
+        if regions is not None:
+            region_match = _matcher(regions)
+            candidates = set(
+                name
+                for region, histos in self._region_index.items()
+                if region_match(region)
+                for name in histos
+            )
+        else:
+            candidates = self._histograms.keys()
+        name_match = _matcher(names)
+        return [
+            name
+            for name in self._histograms.keys()
+            if name in candidates and (name_match is None or name_match(name))
+        ]
+
+    def _statistic_sums(self, name: Text) -> np.ndarray:
+        """
+        Sum of weights over entries, sum of weights^2, sum of value*weight, sum of
+        value^2*weight, overflow and total sum of weights of a histogram. The sums of a
+        histogram which has not been decoded yet are read without decoding its bins.
+        """
+        if name not in self._sums:
+            histogram = self._histograms[name]
+            if histogram is None:
+                sums = self._readSums(self.original_file, self._blocks[name][1])
+            else:
+                sums = (
+                    histogram._normEwEntries,
+                    histogram._sumWeightsSq,
+                    histogram._sumValWeight,
+                    histogram._sumValSqWeight,
+                    histogram.prefix_sums[-1] - histogram.prefix_sums[-2],
+                    histogram.prefix_sums[-1],
+                )
+            self._sums[name] = np.array(sums, dtype=np.float64)
+        return self._sums[name]
+
+    def statistics(self, names: Filter = None) -> Dict[Text, np.ndarray]:
+        """
+        Summary statistics of the histograms computed from the sums stored in the
+        ``<Statistics>`` block of each histogram, hence they are not affected by the binning.
+        Undefined values, e.g. for empty histograms, are ``nan``. Histograms of a lazy
+        collection are not decoded and the statistics of all the histograms are computed
+        once, see ``means``, ``variances``, ``effective_entries`` and ``overflow_fractions``.
+
+        Parameters
+        ----------
+        names: Optional[Union[Text, Sequence[Text]]]
+            histogram names or regular expressions, default all histograms.
+
+        Returns
+        -------
+        Dict[Text, np.ndarray]:
+            ``names``, ``mean``, ``variance``, ``effective_entries`` and
+            ``overflow_fraction`` with one entry per histogram.
+        """
+        if names is None and self._statistics is not None:
+            return {key: item.copy() for key, item in self._statistics.items()}
+
+        selected = self.histo_names if names is None else self.select(names)
+        sums = np.array(
+            [self._statistic_sums(name) for name in selected], dtype=np.float64
+        ).reshape(-1, 6)
+        sumw, sumw2, sumxw, sumx2w, overflow, total = sums.T
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.where(sumw != 0.0, sumxw / sumw, np.nan)
+            variance = np.where(sumw != 0.0, np.maximum(sumx2w / sumw - mean**2, 0.0), np.nan)
+            effective_entries = np.where(sumw2 > 0.0, sumw**2 / sumw2, np.nan)
+            overflow_fraction = np.where(total != 0.0, overflow / total, np.nan)
+
+        statistics = {
+            "names": np.array(selected, dtype=str),
+            "mean": mean,
+            "variance": variance,
+            "effective_entries": effective_entries,
+            "overflow_fraction": overflow_fraction,
+        }
+        if names is None:
+            self._statistics = {key: item.copy() for key, item in statistics.items()}
+        return statistics
+
+    @property
+    def means(self) -> np.ndarray:
+        """Weighted mean of each histogram, see ``statistics``"""
+        return self.statistics()["mean"]
+
+    @property
+    def variances(self) -> np.ndarray:
+        """Weighted variance of each histogram, see ``statistics``"""
+        return self.statistics()["variance"]
+
+    @property
+    def effective_entries(self) -> np.ndarray:
+        """Effective number of entries, (sum w)^2 / sum w^2, of each histogram"""
+        return self.statistics()["effective_entries"]
+
+    @property
+    def overflow_fractions(self) -> np.ndarray:
+        """Fraction of the sum of weights in the overflow bin of each histogram"""
+        return self.statistics()["overflow_fraction"]
 
     @property
     def histo_names(self) -> MutableSequence[Text]:
@@ -72,17 +275,36 @@ class Collection:
         """Number of histograms"""
         return len(self.histo_names)
 
+    def _decode(self, name: Text) -> Histogram:
+        """
+        Decode a histogram of a lazy collection. Threads accessing the same histogram may
+        decode it concurrently but all of them get the same object.
+        """
+        ID, block = self._blocks[name]
+        histogram = Histogram()
+        for row in self._readHistos(self.original_file, block=block):
+            histogram._add_bin(dict(row, ID=ID))
+        if self._normalisation is not None:
+            histogram.weight_normalisation = self._normalisation
+        with _decode_lock:
+            if self._histograms[name] is None:
+                self._histograms[name] = histogram
+            return self._histograms[name]
+
     def __getitem__(self, item: Union[Text, int]) -> Histogram:
         if isinstance(item, int):
             if item < self.size:
-                return self._histograms[self.histo_names[item]]
+                item = self.histo_names[item]
             else:
                 raise ValueError("Input can not be larger than number of histograms.")
 
-        return self._histograms.get(item, Histogram())
+        histogram = self._histograms.get(item, Histogram())
+        if histogram is None:
+            histogram = self._decode(item)
+        return histogram
 
     def items(self) -> Iterable:
-        return self._histograms.items()
+        return [(name, self[name]) for name in self._histograms.keys()]
 
     def normalised_histogram(
         self, histo: Union[Text, int]
@@ -140,7 +362,9 @@ class Collection:
 
     def to_yoda(self, save: Optional[Text] = None) -> MutableSequence:
         """
-        Convert MadAnalysis 5 histograms to yoda histograms
+        Convert MadAnalysis 5 histograms to yoda histograms. The bin contents are built from
+        the weight arrays with ``write_yoda`` and read back by yoda in one pass instead of
+        filling each bin.
 
         Parameters
         ----------
@@ -156,22 +380,92 @@ class Collection:
         except ImportError as err:
             raise NotImplementedError("Please install yoda to enable this feature.")
 
-        yoda_histos = []
-        for name, histo in self._histograms.items():
-            yoda_histos.append(yoda.Histo1D(f"/madanalysis5/{name}"))
-            yoda_histos[-1].addBins(histo.bins)
-            for idx in range(len(histo.bins) - 1):
-                yoda_histos[-1].fillBin(
-                    idx, weight=histo.weights[idx], fraction=histo._normEwEntries
-                )
+        if save is not None and save.endswith(".yoda"):
+            self.write_yoda(save)
+            return yoda.read(save, asdict=False)
 
-        if save.endswith(".yoda"):
-            yoda.write(yoda_histos, save)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "histos.yoda")
+            self.write_yoda(path)
+            return yoda.read(path, asdict=False)
 
-        return yoda_histos
+    def write_yoda(self, path: Text) -> None:
+        """
+        Write histograms in YODA text format. This does not require the yoda library and
+        produces the same histograms as ``to_yoda``.
+
+        Parameters
+        ----------
+        path: Text
+            file path with yoda extension
+        """
+        write_yoda(self.items(), path)
+
+    @staticmethod
+    def _indexHistos(
+        fileLoc: Text, select: Optional[Callable[[Text, Sequence[Text]], bool]] = None
+    ) -> MutableSequence[Tuple[int, Text, MutableSequence[Text], Tuple[int, int]]]:
+        """
+        Record the ID, name, regions and byte range of each <Histo> block without decoding
+        statistics and data.
+
+        Returns: MutableSequence[Tuple[int, Text, MutableSequence[Text], Tuple[int, int]]]
+        """
+        if not os.path.isfile(fileLoc):
+            raise FileNotFoundError(f"Can not find {fileLoc}")
+
+        index, offset, start, description, ID = [], 0, None, None, 0
+        with open(fileLoc, "rb") as fh:
+            for l in fh:
+                tag = l.strip()
+                if tag == b"<Histo>":
+                    start, name, regions = offset, None, []
+                    ID += 1
+                elif tag == b"<Description>" and start is not None:
+                    description = []
+                elif tag == b"</Description>" and description is not None:
+                    name = description[0].decode().split('"')[1]
+                    regions = [x.split()[0].decode() for x in description[4:] if x.strip() != b""]
+                    description = None
+                elif description is not None:
+                    description.append(l)
+                offset += len(l)
+                if tag == b"</Histo>" and start is not None:
+                    # blocks without description can not be addressed by name
+                    if name is not None and (select is None or select(name, regions)):
+                        index.append((ID, name, regions, (start, offset)))
+                    start = None
+        return index
 
     @staticmethod
-    def _readHistos(fileLoc: Text) -> MutableSequence[dict]:
+    def _readSums(fileLoc: Text, block: Tuple[int, int]) -> Tuple[float, ...]:
+        """
+        Read the statistic sums of a <Histo> block without decoding its bins, see
+        ``_statistic_sums``. Values are rounded as in ``_readHistos``.
+        """
+        with open(fileLoc, "rb") as f:
+            f.seek(block[0])
+            lines = f.read(block[1] - block[0]).decode().splitlines()
+
+        def value(line: Text) -> float:
+            lhs, rhs = map(float, line.split()[0:2])
+            return float("%.6E" % Decimal(lhs - rhs))
+
+        tags = [line.strip() for line in lines]
+        stats = tags.index("<Statistics>") + 1
+        start, end = tags.index("<Data>") + 1, tags.index("</Data>")
+        data = np.cumsum([0.0] + [value(line) for line in lines[start:end]])
+        return tuple(value(line) for line in lines[stats + 3 : stats + 7]) + (
+            data[-1] - data[-2],
+            data[-1],
+        )
+
+    @staticmethod
+    def _readHistos(
+        fileLoc: Text,
+        select: Optional[Callable[[Text, Sequence[Text]], bool]] = None,
+        block: Optional[Tuple[int, int]] = None,
+    ) -> MutableSequence[dict]:
         """
         Utility function which parses a MadAnalysis5 *.saf file describing one
         or more histograms and is capable of translating them to a tidy format for
@@ -181,6 +475,10 @@ class Collection:
         a Tidy, denormalized table
         Keyword arguments:
         fileLoc -- the path and filename of the *.saf file
+        select -- function taking the name and the regions of a histogram, histograms for
+                  which it returns False are skipped without reading their statistics and
+                  data, see ``histogram_filter``.
+        block -- byte range of the file to be read, see ``_indexHistos``.
 
         Adapted from https://github.com/effofex/ma5-histo
 
@@ -199,6 +497,7 @@ class Collection:
         DESC = 3
         STATS = 4
         DATA = 5
+        SKIP = 6
 
         # both description and stats have some formatting too
         # to avoid nested state machines, we'll start with just keeping
@@ -223,7 +522,14 @@ class Collection:
         if not os.path.isfile(fileLoc):
             raise FileNotFoundError(f"Can not find {fileLoc}")
 
-        with open(fileLoc) as fh:
+        if block is None:
+            fh = open(fileLoc)
+        else:
+            with open(fileLoc, "rb") as f:
+                f.seek(block[0])
+                fh = io.StringIO(f.read(block[1] - block[0]).decode())
+
+        with fh:
             for l in fh:
                 # We could be more elegant, for example do this as a dictionary
                 # mapping of states and parse funcs.
@@ -261,6 +567,8 @@ class Collection:
                 elif readState == DESC:
                     if re.search("</Description>", l):
                         readState = HISTO
+                        if select is not None and not select(row["name"], row.get("region", [])):
+                            readState = SKIP
                     else:
                         # description elements contain a few lines, each of which
                         # describe different bits of the histogram. For a rough
@@ -281,6 +589,11 @@ class Collection:
                             else:
                                 row["region"].append(l.split()[0])
                         descLine = descLine + 1
+                # Skip a histogram which has not been selected
+                elif readState == SKIP:
+                    if l.strip() == "</Histo>":
+                        readState = NONHISTO
+                        row = {}
                 # Handle a <Statistics> element. Assumes we  go back to a parent
                 # <Histo> element when done.
                 elif readState == STATS:
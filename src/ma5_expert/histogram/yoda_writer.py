@@ -0,0 +1,75 @@
+import io
+from typing import Text, Iterable, Tuple
+
+import numpy as np
+
+from .histo import Histogram
+
+PREFIX = "/madanalysis5"
+
+
+def yoda_bins(histogram: Histogram) -> np.ndarray:
+    """
+    YODA bin contents of a histogram, as filled by ``Collection.to_yoda``: one fill per bin
+    at the bin center with the normalised bin weight and the weighted number of entries as
+    fraction.
+
+    Returns
+    -------
+    np.ndarray:
+        array with shape ``(nbins, 7)``, columns are ``xlow, xhigh, sumw, sumw2, sumwx,
+        sumwx2, numEntries``
+    """
+    edges = histogram.bins.astype(np.float64)
+    weights = histogram.weights.astype(np.float64)
+    fraction = float(histogram._normEwEntries)
+    centers = (edges[:-1] + edges[1:]) / 2.0
+    sumw = weights * fraction
+    return np.column_stack(
+        [
+            edges[:-1],
+            edges[1:],
+            sumw,
+            weights**2 * fraction,
+            sumw * centers,
+            sumw * centers**2,
+            np.full(len(weights), fraction),
+        ]
+    )
+
+
+def _histo1d(path: Text, table: np.ndarray) -> Text:
+    total = table[:, 2:].sum(axis=0)
+    mean = total[2] / total[0] if total[0] != 0.0 else 0.0
+    buffer = io.StringIO()
+    buffer.write(
+        f"BEGIN YODA_HISTO1D_V2 {path}\nPath: {path}\nTitle: \nType: Histo1D\n---\n"
+        f"# Mean: {mean:e}\n# Area: {total[0]:e}\n"
+        "# ID\t ID\t sumw\t sumw2\t sumwx\t sumwx2\t numEntries\n"
+        "Total   \tTotal   \t" + "\t".join(f"{x:e}" for x in total) + "\n"
+        "Underflow\tUnderflow\t" + "\t".join(["0.000000e+00"] * 5) + "\n"
+        "Overflow\tOverflow\t" + "\t".join(["0.000000e+00"] * 5) + "\n"
+        "# xlow\t xhigh\t sumw\t sumw2\t sumwx\t sumwx2\t numEntries\n"
+    )
+    np.savetxt(buffer, table, fmt="%e", delimiter="\t")
+    buffer.write("END YODA_HISTO1D_V2\n\n")
+    return buffer.getvalue()
+
+
+def write_yoda(histograms: Iterable[Tuple[Text, Histogram]], path: Text) -> None:
+    """
+    Write histograms in YODA text format without requiring the yoda library
+
+    Parameters
+    ----------
+    histograms: Iterable[Tuple[Text, Histogram]]
+        histogram names and histograms, e.g. ``Collection.items()``
+    path: Text
+        output file path
+    """
+    with open(path, "w") as f:
+        f.write(
+            "".join(
+                _histo1d(f"{PREFIX}/{name}", yoda_bins(histogram)) for name, histogram in histograms
+            )
+        )
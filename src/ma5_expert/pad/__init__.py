@@ -1,3 +1,18 @@
 from .interface import PADInterface
+from .cache import ExclusionCache
+from .info import AnalysisInfo, parse_info_file
+from .rescale import PreparedExclusion
+from .report import ExclusionReport
+from .server import RecastServer
+from .client import RemotePADInterface
 
-__all__ = ["PADInterface"]
+__all__ = [
+    "PADInterface",
+    "ExclusionCache",
+    "AnalysisInfo",
+    "parse_info_file",
+    "PreparedExclusion",
+    "ExclusionReport",
+    "RecastServer",
+    "RemotePADInterface",
+]
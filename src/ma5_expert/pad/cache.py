@@ -0,0 +1,197 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Text, Dict, Optional, Union
+
+from ma5_expert.backend import PADType
+from ma5_expert.backend.ma5_backend import ExpectationAssumption
+
+log = logging.getLogger("ma5_expert")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY, analysis TEXT NOT NULL, regiondata TEXT NOT NULL,
+    size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed);
+"""
+
+
+class ExclusionCache:
+    """
+    Persistent cache of exclusion results.
+
+    Results are keyed on a content hash of the cutflow files of the analysis together with
+    the analysis name, PAD type, cross section, luminosity and expectation assumption, hence
+    a result is only reused if none of them has changed. The cache is bounded in size, least
+    recently used results are evicted first.
+
+    Parameters
+    ----------
+    path: Text
+        path to the SQLite database. The default is an in-memory database.
+    max_size: int
+        maximum total size of the stored results in bytes. Default 256 MB.
+    """
+
+    def __init__(self, path: Text = ":memory:", max_size: int = 256 * 1024**2):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path != ":memory:" and os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    @staticmethod
+    def content_hash(cutflow_path: Union[Text, Dict]) -> Text:
+        """
+        Hash of the content of all cutflow files of an analysis
+
+        Parameters
+        ----------
+        cutflow_path: Union[Text, Dict]
+            path to the cutflow folder of the analysis or the region data of an already
+            loaded cutflow collection.
+        """
+        if isinstance(cutflow_path, dict):
+            content = json.dumps(cutflow_path, sort_keys=True, default=float)
+            return hashlib.sha256(content.encode()).hexdigest()
+        digest = hashlib.sha256()
+        for name in sorted(x for x in os.listdir(cutflow_path) if x.endswith(".saf")):
+            digest.update(name.encode())
+            with open(os.path.join(cutflow_path, name), "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+        return digest.hexdigest()
+
+    def key(
+        self,
+        cutflow_path: Union[Text, Dict],
+        analysis: Text,
+        padtype: PADType,
+        xsection: float,
+        luminosity: Optional[float] = None,
+        expectation_assumption: Union[ExpectationAssumption, Text] = "apriori",
+        info_file: Optional[Text] = None,
+        content: Optional[Text] = None,
+    ) -> Text:
+        """
+        Construct the cache key of an exclusion computation
+
+        Parameters
+        ----------
+        cutflow_path: Union[Text, Dict]
+            path to the cutflow folder of the analysis or region data, see ``content_hash``.
+        analysis: Text
+            analysis name
+        padtype: PADType
+            detector backend of the analysis
+        xsection: float
+            cross section value in pb.
+        luminosity: Optional[float]
+            luminosity value, None refers to the default luminosity of the analysis.
+        expectation_assumption: Text
+            assumption on expectation value computation.
+        info_file: Optional[Text]
+            user defined info file, its content is included in the key.
+        content: Optional[Text]
+            ``content_hash`` of the cutflows if it has already been computed.
+        """
+        settings = [
+            self.content_hash(cutflow_path) if content is None else content,
+            analysis,
+            str(padtype),
+            repr(float(xsection)),
+            "default" if luminosity is None else repr(float(luminosity)),
+            str(ExpectationAssumption.get(expectation_assumption)),
+        ]
+        if info_file is not None:
+            with open(info_file, "rb") as f:
+                settings.append(hashlib.sha256(f.read()).hexdigest())
+        return hashlib.sha256("\n".join(settings).encode()).hexdigest()
+
+    def get(self, key: Text) -> Optional[Dict]:
+        """Get stored regiondata, None if the key does not exist"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT regiondata FROM results WHERE key=?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self._connection:
+                self._connection.execute(
+                    "UPDATE results SET accessed=? WHERE key=?", (time.time(), key)
+                )
+        return json.loads(row[0])
+
+    def set(self, key: Text, regiondata: Dict, analysis: Text = "__unknown_analysis__") -> None:
+        """Store regiondata and evict old results if necessary"""
+        value = json.dumps(regiondata, default=float)
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (key, analysis, value, len(value), now, now),
+            )
+        self.evict()
+
+    def evict(self, max_size: Optional[int] = None) -> int:
+        """
+        Remove least recently used results until the cache fits into ``max_size`` bytes
+
+        Returns
+        -------
+        int:
+            number of removed results
+        """
+        max_size = self.max_size if max_size is None else max_size
+        removed = 0
+        with self._lock, self._connection:
+            size = self._connection.execute("SELECT TOTAL(size) FROM results").fetchone()[0]
+            if size <= max_size:
+                return 0
+            for key, entry_size in self._connection.execute(
+                "SELECT key, size FROM results ORDER BY accessed ASC"
+            ).fetchall():
+                if size <= max_size:
+                    break
+                self._connection.execute("DELETE FROM results WHERE key=?", (key,))
+                size -= entry_size
+                removed += 1
+        log.debug(f"{removed} results have been evicted from the exclusion cache.")
+        return removed
+
+    def clear(self) -> None:
+        """Remove all the stored results"""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM results")
+            self.hits, self.misses = 0, 0
+
+    @property
+    def stats(self) -> Dict[Text, Union[int, float]]:
+        """Cache statistics"""
+        with self._lock:
+            entries, size = self._connection.execute(
+                "SELECT COUNT(*), TOTAL(size) FROM results"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "size": int(size),
+            "max_size": self.max_size,
+        }
+
+    def __len__(self) -> int:
+        return self.stats["entries"]
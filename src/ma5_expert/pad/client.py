@@ -0,0 +1,106 @@
+import os
+from dataclasses import dataclass
+from multiprocessing.connection import Client
+from typing import Text, Dict, Optional, Union, Tuple, Any
+
+from ma5_expert.backend import PADType
+from ma5_expert.system.exceptions import PADException, BackendException, InvalidSamplePath
+from .cache import ExclusionCache
+
+Address = Union[Text, Tuple[Text, int]]
+
+_EXCEPTIONS = {
+    "PADException": PADException,
+    "BackendException": BackendException,
+    "InvalidSamplePath": InvalidSamplePath,
+}
+
+
+def _request(address: Address, authkey: Optional[bytes], request: Dict) -> Any:
+    with Client(address, authkey=authkey) as connection:
+        connection.send(request)
+        response = connection.recv()
+    if response["status"] != "ok":
+        exception = _EXCEPTIONS.get(response["type"], None)
+        if exception is None:
+            raise PADException(f"{response['type']} on recast server: {response['error']}")
+        raise exception(response["error"])
+    return response["result"]
+
+
+@dataclass
+class RemotePADInterface:
+    """
+    PAD Interface executed on a ``ma5_expert.pad.RecastServer``
+
+    sample_path: Text
+        Path to the executed sample, as seen by the server
+    dataset_name: Text
+        name of the dataset
+    address: Union[Text, Tuple[Text, int]]
+        address of the server
+    authkey: Optional[bytes]
+        secret key of the server
+    """
+
+    sample_path: Text
+    dataset_name: Text
+    address: Address
+    authkey: Optional[bytes] = None
+
+    def ping(self) -> bool:
+        """Check if the server is alive"""
+        return _request(self.address, self.authkey, {"method": "ping"}) == "pong"
+
+    def compute_exclusion(
+        self,
+        analysis: Text,
+        xsection: float,
+        padtype: PADType,
+        luminosity: Optional[float] = None,
+        info_file: Optional[Text] = None,
+        custom_cutflow_reader=None,
+        expectation_assumption: Text = "apriori",
+        cache: Optional[Union[ExclusionCache, Text]] = None,
+        collection=None,
+    ) -> Dict:
+        """
+        Compute exclusion limit on the server, see
+        ``ma5_expert.pad.PADInterface.compute_exclusion`` for the details. Custom cutflow
+        readers should be importable by the server, i.e. defined at module level. The
+        ``cache``, an ``ExclusionCache`` or the path of its database, is opened by the
+        server hence it can not be an in-memory database. If None, the cache of the server
+        is used.
+
+        Returns
+        -------
+        Dictionary including exclusion information on each region
+        """
+        if isinstance(cache, ExclusionCache):
+            cache = cache.path
+        if cache == ":memory:":
+            raise PADException("In-memory exclusion caches can not be shared with the server.")
+        return _request(
+            self.address,
+            self.authkey,
+            {
+                "method": "compute_exclusion",
+                "sample_path": self.sample_path,
+                "dataset_name": self.dataset_name,
+                "kwargs": {
+                    "analysis": analysis,
+                    "xsection": xsection,
+                    "padtype": padtype,
+                    "luminosity": luminosity,
+                    "info_file": info_file,
+                    "custom_cutflow_reader": custom_cutflow_reader,
+                    "expectation_assumption": expectation_assumption,
+                    "cache": None if cache is None else os.path.abspath(cache),
+                    "collection": collection,
+                },
+            },
+        )
+
+    def shutdown_server(self) -> None:
+        """Shut down the server"""
+        _request(self.address, self.authkey, {"method": "shutdown"})
@@ -0,0 +1,217 @@
+import logging
+import os
+import threading
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Text, Dict, Tuple, Sequence, Optional
+
+import numpy as np
+
+from ma5_expert.system.exceptions import PADException, InvalidInput
+
+log = logging.getLogger("ma5_expert")
+
+
+@dataclass(frozen=True)
+class AnalysisInfo:
+    """
+    Region definitions of a PAD analysis
+
+    Parameters
+    ----------
+    analysis: Text
+        analysis name
+    path: Text
+        path to the info file
+    lumi: float
+        luminosity in 1/fb
+    regions: Tuple[Text, ...]
+        signal region names
+    nobs: np.ndarray
+        number of observed events per region
+    nb: np.ndarray
+        expected number of background events per region
+    deltanb: np.ndarray
+        uncertainty on the number of background events per region
+    covariance: Dict[Text, Tuple[Tuple[Text, ...], np.ndarray]]
+        background covariance matrices, ``{subset: (regions, matrix)}``
+    pyhf: Dict[Text, Dict]
+        pyhf likelihood definitions, ``{id: {"name": json file, "regions": {channel: regions}}}``
+    """
+
+    analysis: Text
+    path: Text
+    lumi: float
+    regions: Tuple[Text, ...]
+    nobs: np.ndarray = field(repr=False)
+    nb: np.ndarray = field(repr=False)
+    deltanb: np.ndarray = field(repr=False)
+    covariance: Dict[Text, Tuple[Tuple[Text, ...], np.ndarray]] = field(repr=False)
+    pyhf: Dict[Text, Dict] = field(repr=False)
+
+    @property
+    def has_covariance(self) -> bool:
+        return len(self.covariance) > 0
+
+    @property
+    def has_pyhf(self) -> bool:
+        return len(self.pyhf) > 0
+
+    def regiondata(self, regions: Sequence[Text] = None) -> Dict[Text, Dict[Text, float]]:
+        """
+        Region data in MadAnalysis 5 format, a new dictionary is created for each call.
+
+        Parameters
+        ----------
+        regions: Sequence[Text]
+            regions to be included, default all regions.
+        """
+        regions = self.regions if regions is None else regions
+        index = {reg: idx for idx, reg in enumerate(self.regions)}
+        return {
+            reg: {
+                "nobs": float(self.nobs[index[reg]]),
+                "nb": float(self.nb[index[reg]]),
+                "deltanb": float(self.deltanb[index[reg]]),
+            }
+            for reg in regions
+        }
+
+
+def _float(element, tag: Text, path: Text) -> float:
+    child = element.find(tag)
+    try:
+        return float(child.text)
+    except (AttributeError, TypeError, ValueError):
+        raise PADException(
+            msg=f"Invalid `{tag}` for region {element.get('id')} in {path}",
+            details={"info_path": path, "region": element.get("id"), "tag": tag},
+        )
+
+
+def _parse(path: Text) -> AnalysisInfo:
+    try:
+        root = ET.parse(path).getroot()
+    except ET.ParseError as err:
+        raise PADException(
+            msg=f"Can not parse info file {path}: {err}", details={"info_path": path}
+        )
+    if root.tag != "analysis":
+        raise InvalidInput(f"Info file {path} does not start with an <analysis> tag.")
+
+    lumi = root.find("lumi")
+    try:
+        lumi = float(lumi.text)
+    except (AttributeError, TypeError, ValueError):
+        raise PADException(msg=f"Invalid luminosity in {path}", details={"info_path": path})
+
+    regions, nobs, nb, deltanb = [], [], [], []
+    subsets, covariance_entries = OrderedDict(), {}
+    for region in root.iter("region"):
+        if region.get("type", "signal") != "signal":
+            continue
+        name = region.get("id")
+        regions.append(name)
+        nobs.append(_float(region, "nobs", path))
+        nb.append(_float(region, "nb", path))
+        deltanb.append(_float(region, "deltanb", path))
+        if region.get("cov_subset") is not None:
+            subsets.setdefault(region.get("cov_subset"), []).append(name)
+            covariance_entries[name] = {
+                cov.get("region"): float(cov.text) for cov in region.findall("covariance")
+            }
+
+    covariance = {}
+    for subset, cov_regions in subsets.items():
+        matrix = np.array(
+            [[covariance_entries[i].get(j, 0.0) for j in cov_regions] for i in cov_regions],
+            dtype=np.float64,
+        )
+        matrix.flags.writeable = False
+        covariance[subset] = (tuple(cov_regions), matrix)
+
+    pyhf = {}
+    for likelihood in root.iter("pyhf"):
+        name = likelihood.find("name")
+        pyhf[likelihood.get("id")] = {
+            "name": name.text.strip() if name is not None and name.text else None,
+            "regions": {
+                channel.get("name"): (channel.text or "").split()
+                for channel in likelihood.iter("channel")
+            },
+        }
+
+    arrays = [np.array(x, dtype=np.float64) for x in [nobs, nb, deltanb]]
+    for array in arrays:
+        array.flags.writeable = False
+
+    return AnalysisInfo(
+        root.get("id", os.path.splitext(os.path.basename(path))[0]),
+        path,
+        lumi,
+        tuple(regions),
+        *arrays,
+        covariance=covariance,
+        pyhf=pyhf,
+    )
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+CACHE_SIZE = 256
+
+
+def parse_info_file(path: Text, analysis: Optional[Text] = None) -> AnalysisInfo:
+    """
+    Parse the region definitions of a PAD analysis info file.
+
+    Results are memoised per resolved path and modification time, hence each info file is
+    parsed once as long as it does not change on disk.
+
+    Parameters
+    ----------
+    path: Text
+        path to the info file
+    analysis: Optional[Text]
+        if given, the ``id`` of the analysis defined in the info file should match it.
+
+    Returns
+    -------
+    AnalysisInfo
+
+    Raises
+    ------
+    InvalidInput:
+        if the file does not define an analysis or defines a different analysis.
+    """
+    if not os.path.isfile(path):
+        raise PADException(f"Can not find info file: {path}", details={"info_path": path})
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        info = _cache.get(key, None)
+        if info is not None:
+            _cache.move_to_end(key)
+
+    if info is None:
+        info = _parse(path)
+        with _cache_lock:
+            for old in [x for x in _cache.keys() if x[0] == path]:
+                del _cache[old]
+            _cache[key] = info
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+
+    if analysis is not None and info.analysis != analysis:
+        raise InvalidInput(
+            f"Info file {path} defines analysis {info.analysis}, expected {analysis}."
+        )
+    return info
+
+
+def clear_info_cache() -> None:
+    """Remove all memoised info files"""
+    with _cache_lock:
+        _cache.clear()
@@ -1,14 +1,85 @@
 from ma5_expert.backend import PADType, BackendManager
-from ma5_expert.system.exceptions import PADException, InvalidSamplePath, BackendException
-from typing import Text, Dict, Optional, Callable, List
+from ma5_expert.backend.ma5_backend import ExpectationAssumption
+from ma5_expert.cutflow import Collection
+from ma5_expert.statistics import compute_combined_regiondata
+from ma5_expert.system.exceptions import (
+    PADException,
+    InvalidSamplePath,
+    BackendException,
+    InvalidInput,
+)
+from .cache import ExclusionCache
+from .info import AnalysisInfo, parse_info_file
+from .rescale import PreparedExclusion
+from .report import ExclusionReport
+from typing import Text, Dict, Optional, Callable, List, Tuple, Any, Sequence, Union
+import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from dataclasses import dataclass
 
+log = logging.getLogger("ma5_expert")
+
 CustomCutFlowReader = Callable[
     [Text, List[Text], Dict[Text, Dict[Text, float]]], Dict[Text, Dict[Text, float]]
 ]
 
 
+def clean_region_name(region: Text) -> Text:
+    """Region name as used in the cutflow file names by MadAnalysis 5"""
+    for old, new in [
+        ("/", "_slash_"),
+        ("->", "_to_"),
+        (">=", "_greater_than_or_equal_to_"),
+        (">", "_greater_than_"),
+        ("<=", "_smaller_than_or_equal_to_"),
+        ("<", "_smaller_than_"),
+        (" ", "_"),
+        (",", "_"),
+        ("+", "_"),
+        ("-", "_"),
+        ("(", "_lp_"),
+        (")", "_rp_"),
+    ]:
+        region = region.replace(old, new)
+    return region
+
+
+def collection_regiondata(
+    collection: Collection, regions: List[Text], regiondata: Dict[Text, Dict[Text, float]]
+) -> Dict[Text, Dict[Text, float]]:
+    """
+    Update region data with the final and initial sum of weights of an already loaded
+    cutflow collection.
+
+    Parameters
+    ----------
+    collection: ma5_expert.cutflow.Collection
+        cutflow collection of the analysis
+    regions: List[Text]
+        regions defined in the info file
+    regiondata: Dict[Text, Dict[Text, float]]
+        region data
+
+    Raises
+    ------
+    PADException:
+        if a region can not be found in the collection.
+    """
+    collection_data = collection.regiondata
+    for region in regions:
+        data = collection_data.get(region, collection_data.get(clean_region_name(region), None))
+        if data is None:
+            raise PADException(
+                msg=f"Can not find region {region} in the cutflow collection.",
+                details={"region": region, "available_regions": collection.SRnames},
+            )
+        regiondata[region].update({"Nf": data["Nf"], "N0": data["N0"]})
+    return regiondata
+
+
 @dataclass
 class PADInterface:
     """
@@ -26,42 +97,41 @@ class PADInterface:
     sample_path: Text
     dataset_name: Text
 
-    def compute_exclusion(
+    @staticmethod
+    def _native_info(
+        run_recast, analysis: Text, info_file: Optional[Text], covariance: bool = True
+    ) -> Optional[AnalysisInfo]:
+        """
+        Parse the info file natively, returns None if it requires the MadAnalysis 5 parser,
+        i.e. for pyhf likelihoods and, if ``covariance`` is False, for covariance matrices.
+        """
+        info_path = info_file or os.path.join(
+            run_recast.pad, "Build/SampleAnalyzer/User/Analyzer", analysis + ".info"
+        )
+        if not os.path.isfile(info_path):
+            return None
+        try:
+            info = parse_info_file(info_path, analysis)
+        except (PADException, InvalidInput) as err:
+            log.debug(f"Falling back to MadAnalysis info file parser: {err}")
+            return None
+        if info.has_pyhf or (info.has_covariance and not covariance):
+            return None
+        return info
+
+    def _recast_session(
         self,
-        analysis: Text,
-        xsection: float,
         padtype: PADType,
-        luminosity: Optional[float] = None,
-        info_file: Optional[Text] = None,
+        expectation_assumption: Text,
         custom_cutflow_reader: Optional[CustomCutFlowReader] = None,
-        expectation_assumption: Text = "apriori",
-    ) -> Dict:
+    ) -> Tuple[Any, Any]:
         """
-        Compute exclusion limit
-
-        Parameters
-        ----------
-        analysis: Text
-            For which analysis this computation to be held
-        xsection: float
-            cross section value in pb.
-        padtype: ma5_expert.backend.PADType
-            Indicates the detector backend of the analysis
-        luminosity: Optional[float]
-            if none, default value will be used.
-        info_file: Optional[Text]
-            Optional info file path. if None it will be read from PAD.
-        custom_cutflow_reader: Callable
-            A user defined function that takes cutflow path, list of regions and region data
-            and returns updated region data.
-        expectation_assumption: Text
-            assumption on expectation value computation.
+        Initialise a recasting session
 
         Returns
         -------
-        Dictionary including exclusion information on each region
+        recasting session and the xml parser module configured by MadAnalysis 5
         """
-
         if BackendManager.MadAnalysis5 is None:
             raise BackendException()
 
@@ -77,13 +147,55 @@ class PADInterface:
         ET = run_recast.check_xml_scipy_methods()
         run_recast.SetCLsCalculator()
 
+        return run_recast, ET
+
+    def _recast_inputs(
+        self,
+        run_recast,
+        ET,
+        analysis: Text,
+        cutflow_path: Text,
+        luminosity: Optional[float],
+        info_file: Optional[Text],
+        custom_cutflow_reader: Optional[CustomCutFlowReader],
+        collection: Optional[Collection],
+        cutflow_data: Optional[Dict[Text, Dict[Text, float]]] = None,
+        native_covariance: bool = True,
+    ) -> Tuple[float, List[Text], Dict[Text, Dict[Text, float]], Dict]:
+        """
+        Read the info file and the cutflows of an analysis. None of these depend on the
+        cross section.
+
+        Parameters
+        ----------
+        cutflow_data: Optional[Dict[Text, Dict[Text, float]]]
+            ``Nf`` and ``N0`` of each region if the cutflows have already been read.
+        native_covariance: bool
+            if True, covariance matrices of natively parsed info files are returned instead
+            of being configured in the MadAnalysis 5 session.
+
+        Returns
+        -------
+        luminosity, regions, region data and the covariance matrices to be combined
+        natively, see ``AnalysisInfo.covariance``.
+        """
         lumi: float
         regions: List[Text]
         regiondata: Dict[Text, Dict[Text, float]]
 
-        if info_file:
-            if not os.path.isfile(info_file):
-                raise PADException(f"Can not find info file: {info_file}")
+        if info_file and not os.path.isfile(info_file):
+            raise PADException(f"Can not find info file: {info_file}")
+        # sessions can be reused for several analyses
+        run_recast.cov_config, run_recast.pyhf_config = {}, {}
+
+        covariance = {}
+        info = self._native_info(run_recast, analysis, info_file, native_covariance)
+        if info is not None and luminosity is None:
+            # MadAnalysis parser is only needed to configure pyhf likelihoods or to project
+            # the region data to a different luminosity.
+            lumi, regions, regiondata = info.lumi, list(info.regions), info.regiondata()
+            covariance = dict(info.covariance)
+        elif info_file:
             with open(info_file, "r") as info_input:
                 info_tree = ET.parse(info_input)
             lumi, regions, regiondata = run_recast.header_info_file(
@@ -108,11 +220,12 @@ class PADInterface:
                 },
             )
 
-        cutflow_path = os.path.join(
-            self.sample_path, "Output/SAF", self.dataset_name, analysis, "Cutflows"
-        )
-
-        if custom_cutflow_reader is not None:
+        if cutflow_data is not None:
+            for region in regions:
+                regiondata[region].update(cutflow_data[region])
+        elif collection is not None:
+            regiondata = collection_regiondata(collection, regions, regiondata)
+        elif custom_cutflow_reader is not None:
             regiondata = custom_cutflow_reader(cutflow_path, regions, regiondata)
         else:
             if not os.path.isdir(cutflow_path):
@@ -126,6 +239,80 @@ class PADInterface:
                     details={"cutflow_path": cutflow_path},
                 )
 
+        return lumi, regions, regiondata, covariance
+
+    def compute_exclusion(
+        self,
+        analysis: Text,
+        xsection: float,
+        padtype: PADType,
+        luminosity: Optional[float] = None,
+        info_file: Optional[Text] = None,
+        custom_cutflow_reader: Optional[CustomCutFlowReader] = None,
+        expectation_assumption: Text = "apriori",
+        cache: Optional[ExclusionCache] = None,
+        collection: Optional[Collection] = None,
+    ) -> Dict:
+        """
+        Compute exclusion limit
+
+        Parameters
+        ----------
+        analysis: Text
+            For which analysis this computation to be held
+        xsection: float
+            cross section value in pb.
+        padtype: ma5_expert.backend.PADType
+            Indicates the detector backend of the analysis
+        luminosity: Optional[float]
+            if none, default value will be used.
+        info_file: Optional[Text]
+            Optional info file path. if None it will be read from PAD.
+        custom_cutflow_reader: Callable
+            A user defined function that takes cutflow path, list of regions and region data
+            and returns updated region data.
+        expectation_assumption: Text
+            assumption on expectation value computation.
+        cache: Optional[ExclusionCache]
+            if given, the result is taken from the cache when the cutflows and the settings
+            did not change, otherwise it is computed and stored. Results obtained through a
+            custom cutflow reader are not cached.
+        collection: Optional[ma5_expert.cutflow.Collection]
+            already loaded cutflow collection of the analysis. If given, cutflows are not read
+            from the sample folder.
+
+        Returns
+        -------
+        Dictionary including exclusion information on each region
+        """
+
+        return self.compute_exclusion_configurations(
+            analysis,
+            xsection,
+            padtype,
+            luminosities=[luminosity],
+            expectation_assumptions=[expectation_assumption],
+            info_file=info_file,
+            custom_cutflow_reader=custom_cutflow_reader,
+            cache=cache,
+            collection=collection,
+        )[(luminosity, expectation_assumption)]
+
+    @staticmethod
+    def _exclusion(
+        run_recast,
+        lumi: float,
+        regions: List[Text],
+        regiondata: Dict[Text, Dict[Text, float]],
+        xsection: float,
+        observed: bool,
+        covariance: Optional[Dict] = None,
+    ) -> Dict:
+        """
+        Compute the upper limits and the exclusion of each region. Regions with a covariance
+        matrix, see ``_recast_inputs``, are combined natively through a simplified
+        likelihood, see ``ma5_expert.statistics.compute_combined_regiondata``.
+        """
         regiondata = run_recast.extract_sig_cls(regiondata, regions, lumi, "exp")
         if run_recast.cov_config != {}:
             regiondata = run_recast.extract_sig_lhcls(regiondata, lumi, "exp")
@@ -134,12 +321,306 @@ class PADInterface:
             regiondata = run_recast.pyhf_sig95Wrapper(lumi, regiondata, "exp")
         regiondata = run_recast.extract_cls(regiondata, regions, xsection, lumi)
 
-        if luminosity is None:
+        if observed:
             if run_recast.cov_config != {}:
                 regiondata = run_recast.extract_sig_lhcls(regiondata, lumi, "obs")
             regiondata = run_recast.extract_sig_cls(regiondata, regions, lumi, "obs")
             regiondata = run_recast.pyhf_sig95Wrapper(lumi, regiondata, "obs")
 
         regiondata = run_recast.extract_cls(regiondata, regions, xsection, lumi)
-
+        for subset, (cov_regions, matrix) in (covariance or {}).items():
+            regiondata = compute_combined_regiondata(
+                regiondata, cov_regions, matrix, xsection, lumi, subset, observed
+            )
         return regiondata
+
+    def compute_exclusion_configurations(
+        self,
+        analysis: Text,
+        xsection: float,
+        padtype: PADType,
+        luminosities: Sequence[Optional[float]] = (None,),
+        expectation_assumptions: Sequence[Text] = ("apriori",),
+        info_file: Optional[Text] = None,
+        custom_cutflow_reader: Optional[CustomCutFlowReader] = None,
+        cache: Optional[ExclusionCache] = None,
+        collection: Optional[Collection] = None,
+    ) -> Dict[Tuple[Optional[float], Text], Dict]:
+        """
+        Compute exclusion limits for several luminosities and expectation assumptions in
+        one pass. The cutflows are read once, the info file is parsed once per luminosity
+        and one recasting session is used per expectation assumption.
+
+        Parameters
+        ----------
+        analysis: Text
+            For which analysis this computation to be held
+        xsection: float
+            cross section value in pb.
+        padtype: ma5_expert.backend.PADType
+            Indicates the detector backend of the analysis
+        luminosities: Sequence[Optional[float]]
+            luminosities in 1/fb, None stands for the default luminosity of the analysis.
+        expectation_assumptions: Sequence[Text]
+            assumptions on expectation value computation.
+        info_file: Optional[Text]
+            Optional info file path. if None it will be read from PAD.
+        custom_cutflow_reader: Callable
+            A user defined function that takes cutflow path, list of regions and region data
+            and returns updated region data.
+        cache: Optional[ExclusionCache]
+            results are taken from and stored in the cache, see ``compute_exclusion``.
+        collection: Optional[ma5_expert.cutflow.Collection]
+            already loaded cutflow collection of the analysis.
+
+        Returns
+        -------
+        Dictionary of region data indexed by ``(luminosity, expectation_assumption)``
+        """
+        return self._configurations(
+            analysis,
+            xsection,
+            padtype,
+            luminosities,
+            expectation_assumptions,
+            info_file,
+            custom_cutflow_reader,
+            cache,
+            collection,
+            sessions={},
+        )
+
+    def _configurations(
+        self,
+        analysis: Text,
+        xsection: float,
+        padtype: PADType,
+        luminosities: Sequence[Optional[float]],
+        expectation_assumptions: Sequence[Text],
+        info_file: Optional[Text],
+        custom_cutflow_reader: Optional[CustomCutFlowReader],
+        cache: Optional[ExclusionCache],
+        collection: Optional[Collection],
+        sessions: Dict[Tuple[PADType, Text], Tuple[Any, Any]],
+        backend_lock: Optional[threading.Lock] = None,
+    ) -> Dict[Tuple[Optional[float], Text], Dict]:
+        """
+        See ``compute_exclusion_configurations``. Recasting sessions are taken from and
+        stored in ``sessions`` and the backend computations are guarded by ``backend_lock``.
+        If a lock is given, the cutflows are read natively before acquiring it.
+        """
+        cutflow_path = os.path.join(
+            self.sample_path, "Output/SAF", self.dataset_name, analysis, "Cutflows"
+        )
+        use_cache = (
+            cache is not None
+            and custom_cutflow_reader is None
+            and (collection is not None or os.path.isdir(cutflow_path))
+        )
+        if use_cache:
+            cutflows = collection.regiondata if collection is not None else cutflow_path
+            content = cache.content_hash(cutflows)
+            cached_info = info_file if info_file and os.path.isfile(info_file) else None
+
+        results = {}
+        cutflow_data = None
+        for expectation_assumption in dict.fromkeys(expectation_assumptions):
+            for luminosity in dict.fromkeys(luminosities):
+                cache_key = None
+                if use_cache:
+                    cache_key = cache.key(
+                        cutflows,
+                        analysis,
+                        padtype,
+                        xsection,
+                        luminosity,
+                        expectation_assumption,
+                        cached_info,
+                        content=content,
+                    )
+                    regiondata = cache.get(cache_key)
+                    if regiondata is not None:
+                        results[(luminosity, expectation_assumption)] = regiondata
+                        continue
+
+                if (
+                    backend_lock is not None
+                    and cutflow_data is None
+                    and collection is None
+                    and custom_cutflow_reader is None
+                    and os.path.isdir(cutflow_path)
+                ):
+                    # cutflows are read natively outside of the lock, only the backend
+                    # computations are serialised
+                    collection = Collection(cutflow_path)
+
+                with backend_lock or nullcontext():
+                    session_key = (padtype, str(expectation_assumption))
+                    if session_key not in sessions:
+                        sessions[session_key] = self._recast_session(
+                            padtype, expectation_assumption, custom_cutflow_reader
+                        )
+                    run_recast, ET = sessions[session_key]
+                    lumi, regions, regiondata, covariance = self._recast_inputs(
+                        run_recast,
+                        ET,
+                        analysis,
+                        cutflow_path,
+                        luminosity,
+                        info_file,
+                        custom_cutflow_reader,
+                        collection,
+                        cutflow_data,
+                        # the simplified likelihood follows the a priori assumption
+                        ExpectationAssumption.get(expectation_assumption)
+                        == ExpectationAssumption.APRIORI,
+                    )
+                    if cutflow_data is None:
+                        cutflow_data = {
+                            reg: {key: regiondata[reg][key] for key in ["Nf", "N0"]}
+                            for reg in regions
+                        }
+
+                    regiondata = self._exclusion(
+                        run_recast,
+                        lumi,
+                        regions,
+                        regiondata,
+                        xsection,
+                        luminosity is None,
+                        covariance,
+                    )
+
+                if cache_key is not None:
+                    cache.set(cache_key, regiondata, analysis)
+                results[(luminosity, expectation_assumption)] = regiondata
+
+        return results
+
+    def prepare_exclusion(
+        self,
+        analysis: Text,
+        padtype: PADType,
+        luminosity: Optional[float] = None,
+        info_file: Optional[Text] = None,
+        custom_cutflow_reader: Optional[CustomCutFlowReader] = None,
+        expectation_assumption: Text = "apriori",
+        collection: Optional[Collection] = None,
+    ) -> PreparedExclusion:
+        """
+        Compute the cross section independent part of the exclusion limit, i.e. read the
+        info file and the cutflows. The returned object computes the upper limits and the
+        exclusion for any cross section natively, including the covariance subsets of the
+        info file, without repeating these steps. pyhf likelihoods and the likelihoods of
+        projected luminosities, configured by MadAnalysis 5, are not included.
+
+        Parameters
+        ----------
+        analysis: Text
+            For which analysis this computation to be held
+        padtype: ma5_expert.backend.PADType
+            Indicates the detector backend of the analysis
+        luminosity: Optional[float]
+            if none, default value will be used.
+        info_file: Optional[Text]
+            Optional info file path. if None it will be read from PAD.
+        custom_cutflow_reader: Callable
+            A user defined function that takes cutflow path, list of regions and region data
+            and returns updated region data.
+        expectation_assumption: Text
+            assumption on expectation value computation.
+        collection: Optional[ma5_expert.cutflow.Collection]
+            already loaded cutflow collection of the analysis.
+
+        Returns
+        -------
+        ma5_expert.pad.PreparedExclusion
+        """
+        cutflow_path = os.path.join(
+            self.sample_path, "Output/SAF", self.dataset_name, analysis, "Cutflows"
+        )
+        run_recast, ET = self._recast_session(
+            padtype, expectation_assumption, custom_cutflow_reader
+        )
+        lumi, regions, regiondata, covariance = self._recast_inputs(
+            run_recast,
+            ET,
+            analysis,
+            cutflow_path,
+            luminosity,
+            info_file,
+            custom_cutflow_reader,
+            collection,
+        )
+
+        return PreparedExclusion(analysis, lumi, regions, regiondata, run_recast, covariance)
+
+    def compute_sample_exclusion(
+        self,
+        analyses: Union[Dict[Text, PADType], Sequence[Tuple[Text, PADType]]],
+        xsection: float,
+        luminosity: Optional[float] = None,
+        expectation_assumption: Text = "apriori",
+        info_files: Optional[Dict[Text, Text]] = None,
+        cache: Optional[ExclusionCache] = None,
+        n_threads: int = 1,
+    ) -> ExclusionReport:
+        """
+        Compute exclusion limits of several analyses for this sample. Recasting sessions are
+        shared between the analyses of the same PAD type. Cutflow reading, cutflow hashing
+        and cache lookups run concurrently on ``n_threads`` threads. Everything that goes
+        through the MadAnalysis 5 backend, i.e. session setup, info file parsing and limit
+        computation, runs one analysis at a time since the backend is not thread safe.
+
+        Parameters
+        ----------
+        analyses: Union[Dict[Text, PADType], Sequence[Tuple[Text, PADType]]]
+            analyses and their detector backends
+        xsection: float
+            cross section value in pb.
+        luminosity: Optional[float]
+            if none, default value of each analysis will be used.
+        expectation_assumption: Text
+            assumption on expectation value computation.
+        info_files: Optional[Dict[Text, Text]]
+            info file path of the analyses which are not read from PAD.
+        cache: Optional[ExclusionCache]
+            results are taken from and stored in the cache, see ``compute_exclusion``.
+        n_threads: int
+            number of threads reading the cutflows and looking up the cache.
+
+        Returns
+        -------
+        ma5_expert.pad.ExclusionReport:
+            results of each analysis. Failing analyses are reported in ``errors``.
+        """
+        analyses = dict(analyses)
+        info_files = info_files or {}
+        report = ExclusionReport(self.sample_path, xsection, padtypes=analyses)
+        sessions, backend_lock = {}, threading.Lock()
+
+        def evaluate(analysis: Text) -> Dict:
+            return self._configurations(
+                analysis,
+                xsection,
+                analyses[analysis],
+                [luminosity],
+                [expectation_assumption],
+                info_files.get(analysis, None),
+                None,
+                cache,
+                None,
+                sessions=sessions,
+                backend_lock=backend_lock,
+            )[(luminosity, expectation_assumption)]
+
+        with ThreadPoolExecutor(max_workers=max(n_threads, 1)) as executor:
+            futures = {analysis: executor.submit(evaluate, analysis) for analysis in analyses}
+            for analysis, future in futures.items():
+                try:
+                    report.results[analysis] = future.result()
+                except (PADException, BackendException, InvalidSamplePath, InvalidInput) as err:
+                    log.error(f"Exclusion of {analysis} failed: {err}")
+                    report.errors[analysis] = str(err)
+
+        return report
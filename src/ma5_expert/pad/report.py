@@ -0,0 +1,89 @@
+from dataclasses import dataclass, field
+from typing import Text, Dict, Optional, Tuple
+
+from ma5_expert.backend import PADType
+
+
+def _float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return -1.0
+
+
+@dataclass
+class ExclusionReport:
+    """
+    Exclusion results of all the analyses evaluated on a sample
+
+    Parameters
+    ----------
+    sample_path: Text
+        Path to the executed sample
+    xsection: float
+        cross section value in pb.
+    padtypes: Dict[Text, PADType]
+        detector backend of each analysis
+    results: Dict[Text, Dict]
+        region data of each successfully evaluated analysis
+    errors: Dict[Text, Text]
+        error message of each failed analysis
+    """
+
+    sample_path: Text
+    xsection: float
+    padtypes: Dict[Text, PADType] = field(default_factory=dict, repr=False)
+    results: Dict[Text, Dict] = field(default_factory=dict, repr=False)
+    errors: Dict[Text, Text] = field(default_factory=dict, repr=False)
+
+    def __getitem__(self, analysis: Text) -> Dict:
+        return self.results[analysis]
+
+    def __str__(self) -> Text:
+        txt = f"Exclusion of `{self.sample_path}` at {self.xsection} pb"
+        for analysis, (region, rSR, cls) in self.summary().items():
+            txt += f"\n   * {analysis}: best region {region}, rSR = {rSR:.3f}, 1-CLs = {cls:.3f}"
+        for analysis, error in self.errors.items():
+            txt += f"\n   * {analysis}: failed, {error}"
+        return txt
+
+    def summary(self) -> Dict[Text, Tuple[Optional[Text], float, float]]:
+        """
+        Most sensitive region of each analysis, i.e. the region with the largest expected
+        ratio of the cross section to its upper limit.
+
+        Returns
+        -------
+        ``{analysis: (region, rSR, 1-CLs)}``, region is None if no region has signal.
+        """
+        summary = {}
+        for analysis, regiondata in self.results.items():
+            best = (None, -1.0, 0.0)
+            for region, data in regiondata.items():
+                if not isinstance(data, dict) or "rSR" not in data:
+                    # covariance subsets and pyhf likelihoods
+                    continue
+                rSR = _float(data["rSR"])
+                if rSR > best[1]:
+                    best = (region, rSR, _float(data.get("CLs", 0.0)))
+            summary[analysis] = best
+        return summary
+
+    @property
+    def best(self) -> Tuple[Optional[Text], Optional[Text]]:
+        """Most sensitive analysis and region"""
+        summary = {key: item for key, item in self.summary().items() if item[0] is not None}
+        if len(summary) == 0:
+            return None, None
+        analysis = max(summary, key=lambda x: summary[x][1])
+        return analysis, summary[analysis][0]
+
+    @property
+    def exclusion_cl(self) -> float:
+        """Exclusion confidence level, 1-CLs, of the most sensitive region"""
+        analysis, _ = self.best
+        return 0.0 if analysis is None else self.summary()[analysis][2]
+
+    def is_excluded(self, confidence_level: float = 0.95) -> bool:
+        """Check if the most sensitive region excludes the sample"""
+        return self.exclusion_cl >= confidence_level
@@ -0,0 +1,257 @@
+import copy
+import logging
+from dataclasses import dataclass, field
+from typing import Text, Dict, Optional, Sequence, Tuple, Any, Union
+
+import numpy as np
+
+from ma5_expert.statistics import exclusion_cl, upper_limit, SimplifiedLikelihood
+from ma5_expert.system.exceptions import PADException
+
+log = logging.getLogger("ma5_expert")
+
+
+@dataclass
+class PreparedExclusion:
+    """
+    Cross section independent part of an exclusion computation.
+
+    Info file parsing, cutflow reading and the upper limits on the signal are computed once,
+    see ``ma5_expert.pad.PADInterface.prepare_exclusion``, after which the exclusion of any
+    cross section only requires the efficiency of each region to be rescaled. Upper limits
+    and CLs values are always computed natively, hence ``evaluate``, ``exclusion_cl`` and
+    ``excluded_xsection`` agree with each other.
+
+    Parameters
+    ----------
+    analysis: Text
+        analysis name
+    lumi: float
+        luminosity in 1/fb
+    regions: Tuple[Text, ...]
+        signal region names
+    regiondata: Dict[Text, Dict[Text, float]]
+        region data including ``nobs``, ``nb``, ``deltanb``, ``Nf`` and ``N0``. Upper limits
+        already in the region data are recomputed.
+    run_recast: Optional
+        MadAnalysis 5 recasting session the region data has been prepared with. It is not
+        used for the evaluation, likelihoods configured in the session can not be evaluated
+        natively and are ignored with a warning.
+    covariance: Dict[Text, Tuple[Tuple[Text, ...], np.ndarray]]
+        background covariance matrices, ``{subset: (regions, matrix)}``, see
+        ``AnalysisInfo.covariance``. Each subset is combined through a simplified likelihood
+        and reported in the ``cov_subset`` entry of ``evaluate``.
+    """
+
+    analysis: Text
+    lumi: float
+    regions: Tuple[Text, ...]
+    regiondata: Dict[Text, Any] = field(repr=False)
+    run_recast: Optional[Any] = field(default=None, repr=False)
+    covariance: Dict[Text, Tuple[Tuple[Text, ...], np.ndarray]] = field(
+        default_factory=dict, repr=False
+    )
+    _arrays: Dict[Text, np.ndarray] = field(default_factory=dict, init=False, repr=False)
+    _combined: Dict[Text, Tuple] = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.regions = tuple(self.regions)
+        for reg in self.regions:
+            missing = [
+                key
+                for key in ["nobs", "nb", "deltanb", "Nf", "N0"]
+                if key not in self.regiondata.get(reg, {})
+            ]
+            if len(missing) > 0:
+                raise PADException(
+                    msg=f"Region {reg} of {self.analysis} is missing {', '.join(missing)}.",
+                    details={"region": reg, "missing": missing},
+                )
+        self._arrays = {
+            key: np.array(
+                [float(self.regiondata[reg][key]) for reg in self.regions], dtype=np.float64
+            )
+            for key in ["nobs", "nb", "deltanb", "Nf", "N0"]
+        }
+        with np.errstate(divide="ignore", invalid="ignore"):
+            eff = np.where(self._arrays["N0"] > 0.0, self._arrays["Nf"] / self._arrays["N0"], 0.0)
+        self._arrays["norm"] = eff * self.lumi * 1000.0
+
+        for subset, (cov_regions, _) in self.covariance.items():
+            missing = [reg for reg in cov_regions if reg not in self.regions]
+            if len(missing) > 0:
+                raise PADException(
+                    msg=f"Covariance subset {subset} of {self.analysis} has unknown regions "
+                    f"{', '.join(missing)}.",
+                    details={"subset": subset, "missing": missing},
+                )
+        if self.run_recast is not None and (
+            getattr(self.run_recast, "cov_config", {}) != {}
+            or getattr(self.run_recast, "pyhf_config", {}) != {}
+        ):
+            log.warning(
+                f"{self.analysis}: likelihoods configured in MadAnalysis 5 can not be "
+                "evaluated natively, only single regions and covariance subsets are included."
+            )
+
+    def _limits(self, tag: Text) -> np.ndarray:
+        """Upper limits of each region in pb, -1 for the regions without signal"""
+        if "s95" + tag not in self._arrays:
+            data = self._arrays
+            nobs = data["nb"] if tag == "exp" else data["nobs"]
+            # only the regions with signal have a limit
+            alive = data["norm"] > 0.0
+            s95 = np.full(len(self.regions), -1.0)
+            if np.any(alive):
+                s95[alive] = (
+                    upper_limit(nobs[alive], data["nb"][alive], data["deltanb"][alive])
+                    / data["norm"][alive]
+                )
+            self._arrays["s95" + tag] = s95
+        return self._arrays["s95" + tag]
+
+    def _combination(self, subset: Text) -> Tuple[SimplifiedLikelihood, np.ndarray, Dict]:
+        """
+        Simplified likelihood of a covariance subset, signal yield per pb of its regions and
+        its upper limits in pb, see ``ma5_expert.statistics.compute_combined_regiondata``.
+        """
+        if subset not in self._combined:
+            cov_regions, matrix = self.covariance[subset]
+            index = [self.regions.index(reg) for reg in cov_regions]
+            data = {key: self._arrays[key][index] for key in ["nobs", "nb", "norm"]}
+            model = SimplifiedLikelihood(data["nobs"], data["nb"], matrix)
+            if np.any(data["norm"] > 0.0):
+                limits = {
+                    "s95" + tag: float(model.upper_limit(data["norm"], expected=tag == "exp"))
+                    for tag in ["exp", "obs"]
+                }
+            else:
+                limits = {"s95exp": -1.0, "s95obs": -1.0}
+            self._combined[subset] = (model, data["norm"], limits)
+        return self._combined[subset]
+
+    @property
+    def efficiencies(self) -> np.ndarray:
+        """Signal efficiency of each region"""
+        return self._arrays["norm"] / (self.lumi * 1000.0)
+
+    @property
+    def best_region(self) -> Optional[Text]:
+        """
+        Most sensitive region, i.e. the region with the smallest expected upper limit. The
+        choice does not depend on the cross section.
+        """
+        s95 = self._limits("exp")
+        s95 = np.where(s95 > 0.0, s95, np.inf)
+        if len(s95) == 0 or np.all(np.isinf(s95)):
+            return None
+        return self.regions[int(np.argmin(s95))]
+
+    def _region_index(self, region: Optional[Text]) -> int:
+        region = self.best_region if region is None else region
+        if region not in self.regions:
+            raise PADException(
+                msg=f"Unknown region {region} for {self.analysis}.",
+                details={"region": region, "available_regions": self.regions},
+            )
+        return self.regions.index(region)
+
+    def exclusion_cl(
+        self, xsections: Union[float, Sequence[float]], expected: bool = False
+    ) -> np.ndarray:
+        """
+        Exclusion confidence level, ``1 - CLs``, of each region for an array of cross
+        sections, computed natively.
+
+        Parameters
+        ----------
+        xsections: Union[float, Sequence[float]]
+            cross sections in pb
+        expected: bool
+            if True, the expected exclusion is computed, i.e. ``nobs = nb``.
+
+        Returns
+        -------
+        np.ndarray:
+            exclusion confidence levels with shape ``(number of cross sections, number of
+            regions)``. Regions without signal have zero confidence level.
+        """
+        xsections = np.atleast_1d(np.asarray(xsections, dtype=np.float64))
+        data = self._arrays
+        nsignal = xsections[:, None] * data["norm"][None, :]
+        cls = exclusion_cl(
+            data["nb"] if expected else data["nobs"], data["nb"], data["deltanb"], nsignal
+        )
+        return np.where(data["norm"][None, :] > 0.0, cls, 0.0)
+
+    def excluded_xsection(
+        self,
+        confidence_level: float = 0.95,
+        expected: bool = False,
+        region: Optional[Text] = None,
+    ) -> float:
+        """
+        Cross section excluded at the given confidence level, found by root-finding on the
+        prepared region data. At 95% confidence level it matches the ``s95exp`` and
+        ``s95obs`` limits reported by ``evaluate``.
+
+        Parameters
+        ----------
+        confidence_level: float
+            confidence level of the exclusion
+        expected: bool
+            if True, the expected exclusion is computed.
+        region: Optional[Text]
+            region to be used, default the most sensitive region.
+
+        Returns
+        -------
+        float:
+            excluded cross section in pb, -1 if the region has no signal.
+        """
+        if self.best_region is None and region is None:
+            return -1.0
+        idx = self._region_index(region)
+        data = self._arrays
+        if data["norm"][idx] <= 0.0:
+            return -1.0
+        nobs = data["nb"][idx] if expected else data["nobs"][idx]
+        limit = upper_limit(nobs, data["nb"][idx], data["deltanb"][idx], confidence_level)
+        return float(limit / data["norm"][idx])
+
+    def evaluate(self, xsection: float) -> Dict:
+        """
+        Exclusion information of each region for a cross section, in the same format as
+        ``PADInterface.compute_exclusion``.
+
+        Parameters
+        ----------
+        xsection: float
+            cross section in pb
+
+        Returns
+        -------
+        Dictionary including exclusion information on each region
+        """
+        regiondata = copy.deepcopy(self.regiondata)
+        cls = self.exclusion_cl(xsection)[0]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rSR = np.where(self._limits("exp") > 0.0, xsection / self._limits("exp"), -1.0)
+        best = self.best_region
+        for idx, reg in enumerate(self.regions):
+            regiondata[reg].update(
+                {
+                    "s95exp": float(self._limits("exp")[idx]),
+                    "s95obs": float(self._limits("obs")[idx]),
+                    "rSR": float(rSR[idx]),
+                    "CLs": float(cls[idx]),
+                    "best": int(reg == best),
+                }
+            )
+        for subset in self.covariance:
+            model, nsignal, limits = self._combination(subset)
+            result = dict(limits, CLs=0.0)
+            if np.any(nsignal > 0.0):
+                result["CLs"] = float(model.exclusion_cl(nsignal * xsection))
+            regiondata.setdefault("cov_subset", {})[subset] = result
+        return regiondata
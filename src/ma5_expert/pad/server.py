@@ -0,0 +1,244 @@
+import logging
+import os
+import socket
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.connection import Listener
+from typing import Text, Dict, Optional, Union, Tuple, Any
+
+from ma5_expert.backend import BackendManager
+from .cache import ExclusionCache
+from .interface import PADInterface
+
+log = logging.getLogger("ma5_expert")
+
+Address = Union[Text, Tuple[Text, int]]
+
+# State of each worker process of the server
+_worker_cache: Optional[ExclusionCache] = None
+# Caches requested by the clients, indexed by path
+_worker_caches: Dict[Text, ExclusionCache] = {}
+# Recasting sessions of each worker, indexed by sample and dataset
+_worker_sessions: "OrderedDict[Tuple[Text, Text], Dict[Tuple[Any, Text], Tuple[Any, Any]]]" = (
+    OrderedDict()
+)
+MAX_SESSIONS = 16
+
+
+def _init_worker(
+    madanalysis_path: Optional[Text], backend_kwargs: Dict, cache_path: Optional[Text]
+):
+    """Initialise the MadAnalysis 5 backend once per worker process"""
+    global _worker_cache
+    if madanalysis_path is not None:
+        BackendManager.set_madanalysis_backend(madanalysis_path, **backend_kwargs)
+    if cache_path is not None:
+        _worker_cache = ExclusionCache(cache_path)
+
+
+def _compute_exclusion(sample_path: Text, dataset_name: Text, kwargs: Dict) -> Dict:
+    """
+    Compute the exclusion of a request. Recasting sessions are kept for the last
+    ``MAX_SESSIONS`` samples, hence repeated requests on the same sample reuse them.
+    """
+    cache = kwargs.get("cache", None)
+    if cache is None:
+        cache = _worker_cache
+    elif isinstance(cache, str):
+        if cache not in _worker_caches:
+            _worker_caches[cache] = ExclusionCache(cache)
+        cache = _worker_caches[cache]
+    sessions = _worker_sessions.setdefault((sample_path, dataset_name), {})
+    _worker_sessions.move_to_end((sample_path, dataset_name))
+    while len(_worker_sessions) > MAX_SESSIONS:
+        _worker_sessions.popitem(last=False)
+
+    luminosity = kwargs.get("luminosity", None)
+    assumption = kwargs.get("expectation_assumption", "apriori")
+    return PADInterface(sample_path, dataset_name)._configurations(
+        kwargs["analysis"],
+        kwargs["xsection"],
+        kwargs["padtype"],
+        [luminosity],
+        [assumption],
+        kwargs.get("info_file", None),
+        kwargs.get("custom_cutflow_reader", None),
+        cache,
+        kwargs.get("collection", None),
+        sessions=sessions,
+    )[(luminosity, assumption)]
+
+
+class RecastServer:
+    """
+    Long-lived local server for exclusion computations.
+
+    The server keeps a pool of worker processes, each with an initialised MadAnalysis 5
+    backend and the recasting sessions of the recently used samples, and executes
+    ``compute_exclusion`` requests coming from many client processes, see
+    ``ma5_expert.pad.RemotePADInterface``. Requests are exchanged as pickled objects, hence
+    the server is only reachable by trusted clients: Unix sockets are only accessible by
+    their owner and TCP connections are always authenticated, see ``authkey``.
+
+    Parameters
+    ----------
+    madanalysis_path: Optional[Text]
+        MadAnalysis 5 path. If None, workers are not attached to a backend and can only
+        serve cached results.
+    address: Union[Text, Tuple[Text, int]]
+        path of a Unix socket or ``(host, port)`` of a TCP socket. Port 0 picks a free port.
+    authkey: Optional[bytes]
+        secret key used to authenticate the clients. For TCP addresses a random key is
+        generated if None, it is available as ``RecastServer.authkey``.
+    max_workers: Optional[int]
+        number of worker processes, default number of CPUs.
+    cache_path: Optional[Text]
+        path of an ``ExclusionCache`` database shared by the workers.
+    **backend_kwargs:
+        options of ``BackendManager.set_madanalysis_backend``
+    """
+
+    def __init__(
+        self,
+        madanalysis_path: Optional[Text] = None,
+        address: Address = ("localhost", 0),
+        authkey: Optional[bytes] = None,
+        max_workers: Optional[int] = None,
+        cache_path: Optional[Text] = None,
+        **backend_kwargs,
+    ):
+        if not isinstance(address, str) and authkey is None:
+            authkey = os.urandom(32)
+        self._authkey = authkey
+        self._listener = Listener(address, authkey=authkey)
+        if isinstance(address, str):
+            os.chmod(self._listener.address, 0o600)
+        self._serving = False
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(madanalysis_path, backend_kwargs, cache_path),
+        )
+        self._running = False
+        self._threads = []
+
+    @property
+    def address(self) -> Address:
+        """Address of the server"""
+        return self._listener.address
+
+    @property
+    def authkey(self) -> Optional[bytes]:
+        """Secret key the clients need to connect to the server"""
+        return self._authkey
+
+    def serve_forever(self) -> None:
+        """Accept connections until the server is shut down"""
+        with self._lock:
+            listener = self._listener
+            if listener is None:
+                return
+            self._running = True
+            self._serving = True
+        log.info(f"Recast server is listening on {listener.address}")
+        try:
+            while self._running:
+                try:
+                    connection = listener.accept()
+                except Exception as err:
+                    if self._running:
+                        log.debug(f"Connection refused: {err}")
+                        continue
+                    break
+                if not self._running:
+                    # wake-up connection opened by shutdown
+                    connection.close()
+                    break
+                thread = threading.Thread(target=self._handle, args=(connection,), daemon=True)
+                thread.start()
+                self._threads = [x for x in self._threads if x.is_alive()] + [thread]
+        finally:
+            with self._lock:
+                self._serving = False
+            self._close(listener)
+            self._closed.set()
+
+    def start(self) -> threading.Thread:
+        """Serve in a background thread"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def _handle(self, connection) -> None:
+        with connection:
+            while True:
+                try:
+                    request = connection.recv()
+                except (EOFError, OSError):
+                    break
+                method = request.get("method", None)
+                try:
+                    if method == "ping":
+                        result = "pong"
+                    elif method == "compute_exclusion":
+                        future = self._executor.submit(
+                            _compute_exclusion,
+                            request["sample_path"],
+                            request["dataset_name"],
+                            request.get("kwargs", {}),
+                        )
+                        result = future.result()
+                    elif method == "shutdown":
+                        connection.send({"status": "ok", "result": None})
+                        self.shutdown()
+                        break
+                    else:
+                        raise ValueError(f"Unknown method: {method}")
+                    response = {"status": "ok", "result": result}
+                except Exception as err:
+                    response = {"status": "error", "type": type(err).__name__, "error": str(err)}
+                try:
+                    connection.send(response)
+                except (EOFError, OSError):
+                    break
+
+    @staticmethod
+    def _close(listener: Listener) -> None:
+        address = listener.address
+        listener.close()
+        if isinstance(address, str) and os.path.exists(address):
+            os.remove(address)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop accepting requests and shut down the workers"""
+        with self._lock:
+            if not self._running and self._listener is None:
+                return
+            self._running = False
+            listener, self._listener = self._listener, None
+            serving = self._serving
+        if listener is not None:
+            if serving:
+                # accept() is not interrupted by closing the listener, connect to wake it up,
+                # the serving thread closes the listener on its way out.
+                address = listener.address
+                family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+                try:
+                    with socket.socket(family) as wake_up:
+                        wake_up.connect(address)
+                    if wait:
+                        self._closed.wait()
+                except OSError as err:
+                    log.debug(f"Can not wake up the recast server: {err}")
+            else:
+                self._close(listener)
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
@@ -0,0 +1,3 @@
+from .loader import SampleCollection, AnalysisOutput
+
+__all__ = ["SampleCollection", "AnalysisOutput"]
@@ -0,0 +1,193 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Text, Optional, Sequence, MutableSequence, Iterable, Dict
+
+from ma5_expert.cutflow import Collection as CutFlowCollection
+from ma5_expert.histogram import Collection as HistogramCollection
+from ma5_expert.system.exceptions import InvalidSamplePath, InvalidInput
+from ma5_expert.tools.SafReader import SAF
+
+log = logging.getLogger("ma5_expert")
+
+
+@dataclass
+class AnalysisOutput:
+    """
+    Output of a single analysis
+
+    Parameters
+    ----------
+    name: Text
+        name of the analysis
+    path: Text
+        path to the analysis output
+    cutflows: Optional[ma5_expert.cutflow.Collection]
+        signal region collection, None if the analysis does not have cutflows
+    histograms: Optional[ma5_expert.histogram.Collection]
+        histogram collection, None if the analysis does not have histograms
+    """
+
+    name: Text
+    path: Text
+    cutflows: Optional[CutFlowCollection] = field(default=None, repr=False)
+    histograms: Optional[HistogramCollection] = field(default=None, repr=False)
+
+
+@dataclass
+class SampleCollection:
+    """
+    Collection of all the analyses executed on a sample
+
+    Parameters
+    ----------
+    sample_path: Text
+        Path to the executed sample
+    dataset_name: Text
+        name of the dataset
+    analyses: Optional[Sequence[Text]]
+        analyses to be loaded. If None, all the analyses in the dataset will be loaded.
+    xsection: Optional[float]
+        Cross-section value in pb. If None, it will be read from the sample information file.
+    lumi: Optional[float]
+        Luminosity value in 1/fb.
+    load_cutflows: bool
+        load cutflow collections
+    load_histograms: bool
+        load histogram collections
+    n_threads: int
+        number of threads to be used to load the analyses.
+    files: Optional[Dict[Text, Dict[Text, Sequence[Text]]]]
+        already indexed output files, e.g. by ``ma5_expert.scan.Catalogue``. Cutflow and
+        histogram files of each analysis given as ``{analysis: {"region": [...],
+        "histogram": [...]}}``. If given, the sample folder is not listed.
+    saf_file: Optional[Text]
+        sample information file, only used together with ``files``.
+    """
+
+    sample_path: Text
+    dataset_name: Text = "defaultset"
+    analyses: Optional[Sequence[Text]] = None
+    xsection: Optional[float] = None
+    lumi: Optional[float] = None
+    load_cutflows: bool = True
+    load_histograms: bool = True
+    n_threads: int = 1
+    files: Optional[Dict[Text, Dict[Text, Sequence[Text]]]] = field(default=None, repr=False)
+    saf_file: Optional[Text] = field(default=None, repr=False)
+    saf: Optional[SAF] = field(default=None, init=False, repr=False)
+    _analyses: Dict[Text, AnalysisOutput] = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        dataset_path = self.dataset_path
+        if self.files is not None:
+            saf_file, available = self.saf_file, list(self.files.keys())
+        else:
+            if not os.path.isdir(dataset_path):
+                raise InvalidSamplePath(
+                    msg=f"Can not find dataset {dataset_path}", path=dataset_path
+                )
+
+            # Single scan of the dataset folder: the sample information file and analysis folders
+            saf_file, available = None, []
+            with os.scandir(dataset_path) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name == f"{self.dataset_name}.saf":
+                        saf_file = entry.path
+                    elif entry.is_dir():
+                        available.append(entry.name)
+
+        if self.analyses is None:
+            analyses = sorted(available)
+        else:
+            analyses = list(self.analyses)
+            for analysis in analyses:
+                if analysis not in available:
+                    raise InvalidInput(f"Can not find analysis {analysis} in {dataset_path}")
+
+        if saf_file is not None:
+            self.saf = SAF(saf_file=saf_file, xsection=self.xsection or -1)
+            if self.xsection is None:
+                self.xsection = self.saf.xsec
+        elif self.xsection is None:
+            log.warning(f"Can not find sample information in {dataset_path}.")
+
+        if self.n_threads > 1 and len(analyses) > 1:
+            with ThreadPoolExecutor(max_workers=self.n_threads) as executor:
+                outputs = list(executor.map(self._load_analysis, analyses))
+        else:
+            outputs = [self._load_analysis(analysis) for analysis in analyses]
+
+        for output in outputs:
+            if output.cutflows is None and output.histograms is None:
+                log.debug(f"{output.name} does not include any output, skipping.")
+                continue
+            self._analyses[output.name] = output
+
+    @property
+    def dataset_path(self) -> Text:
+        """Path to the dataset output"""
+        return os.path.normpath(os.path.join(self.sample_path, "Output/SAF", self.dataset_name))
+
+    def _load_analysis(self, analysis: Text) -> AnalysisOutput:
+        """Load cutflows and histograms of a given analysis"""
+        output = AnalysisOutput(name=analysis, path=os.path.join(self.dataset_path, analysis))
+
+        xsec = self.xsection if self.xsection is not None else 0.0
+        cutflow_path = os.path.join(output.path, "Cutflows")
+        histo_file = os.path.join(output.path, "Histograms", "histos.saf")
+        if self.files is not None:
+            files = self.files[analysis]
+            region_files = list(files.get("region", []))
+            has_cutflows = len(region_files) > 0
+            has_histograms = histo_file in files.get("histogram", [])
+        else:
+            region_files = None
+            has_cutflows = os.path.isdir(cutflow_path)
+            has_histograms = os.path.isfile(histo_file)
+
+        if self.load_cutflows and has_cutflows:
+            kwargs = {"xsection": xsec, "name": analysis, "files": region_files}
+            if self.lumi is not None:
+                kwargs.update({"lumi": self.lumi})
+            output.cutflows = CutFlowCollection(cutflow_path, **kwargs)
+
+        if self.load_histograms and has_histograms:
+            kwargs = {"xsection": xsec}
+            if self.lumi is not None:
+                kwargs.update({"lumi": self.lumi})
+            output.histograms = HistogramCollection(original_file=histo_file, **kwargs)
+
+        return output
+
+    def __getitem__(self, item: Text) -> AnalysisOutput:
+        if item not in self._analyses:
+            raise InvalidInput(f"Unknown analysis : {item}")
+        return self._analyses[item]
+
+    def __contains__(self, item: Text) -> bool:
+        return item in self._analyses
+
+    def __len__(self) -> int:
+        return len(self._analyses)
+
+    @property
+    def analysis_names(self) -> MutableSequence[Text]:
+        return list(self._analyses.keys())
+
+    def keys(self) -> Iterable:
+        return self._analyses.keys()
+
+    def items(self) -> Iterable:
+        return self._analyses.items()
+
+    def __str__(self) -> Text:
+        txt = f"Sample `{self.sample_path}` ({self.dataset_name}) with {len(self)} analyses"
+        for name, output in self.items():
+            txt += (
+                f"\n   * {name}: "
+                + f"{len(output.cutflows.SRnames) if output.cutflows is not None else 0} regions, "
+                + f"{output.histograms.size if output.histograms is not None else 0} histograms"
+            )
+        return txt
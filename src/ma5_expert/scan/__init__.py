@@ -0,0 +1,6 @@
+from .catalogue import Catalogue
+from .store import ResultStore
+from .runner import ScanPoint, ScanRunner, RetryPolicy
+from .shard import ShardedScan
+
+__all__ = ["Catalogue", "ResultStore", "ScanPoint", "ScanRunner", "RetryPolicy", "ShardedScan"]
@@ -0,0 +1,372 @@
+import logging
+import os
+import sqlite3
+from typing import Text, Optional, Sequence, MutableSequence, Tuple, Dict
+
+from ma5_expert.system.exceptions import InvalidSamplePath
+
+log = logging.getLogger("ma5_expert")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY, parent TEXT, kind TEXT NOT NULL, mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS directories_parent ON directories (parent);
+CREATE TABLE IF NOT EXISTS samples (
+    path TEXT PRIMARY KEY, workspace TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS datasets (
+    path TEXT PRIMARY KEY, sample TEXT NOT NULL, name TEXT NOT NULL,
+    saf_file TEXT, size INTEGER, mtime_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS datasets_sample ON datasets (sample);
+CREATE TABLE IF NOT EXISTS analyses (
+    path TEXT PRIMARY KEY, sample TEXT NOT NULL, dataset TEXT NOT NULL, name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analyses_name ON analyses (name);
+CREATE INDEX IF NOT EXISTS analyses_sample ON analyses (sample, dataset);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, analysis TEXT NOT NULL, kind TEXT NOT NULL, name TEXT NOT NULL,
+    size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_analysis ON files (analysis, kind);
+"""
+
+# Directory kinds of a MadAnalysis 5 workspace tree
+ROOT, SAMPLE, SAF, DATASET, ANALYSIS, CUTFLOWS, HISTOGRAMS = (
+    "root",
+    "sample",
+    "saf",
+    "dataset",
+    "analysis",
+    "cutflows",
+    "histograms",
+)
+
+
+def _is_sample(path: Text) -> bool:
+    return os.path.isdir(os.path.join(path, "Output", "SAF"))
+
+
+class Catalogue:
+    """
+    SQLite index of MadAnalysis 5 output trees.
+
+    Workspaces are scanned with ``os.scandir`` and every sample, dataset, analysis, region
+    (cutflow) file and histogram file is recorded together with file sizes and modification
+    times. Subsequent scans only list directories whose modification time has changed, the
+    rest of the tree is taken from the index.
+
+    Parameters
+    ----------
+    database: Text
+        path to the SQLite database. The default is an in-memory database.
+    """
+
+    def __init__(self, database: Text = ":memory:"):
+        self.database = database
+        self._connection = sqlite3.connect(database)
+        self._connection.executescript(_SCHEMA)
+        self._stats = {}
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def scan(self, *workspaces: Text, rescan: bool = False) -> Dict[Text, int]:
+        """
+        Scan the workspaces and update the index.
+
+        Parameters
+        ----------
+        *workspaces: Text
+            Either sample folders (including ``Output/SAF``) or folders containing samples.
+        rescan: bool
+            list every directory even if its modification time did not change.
+
+        Returns
+        -------
+        Dict[Text, int]:
+            number of listed and skipped directories
+        """
+        self._stats = {"listed": 0, "skipped": 0}
+        with self._connection:
+            for workspace in workspaces:
+                workspace = os.path.abspath(workspace)
+                if not os.path.isdir(workspace):
+                    raise InvalidSamplePath(f"Can not find workspace {workspace}", workspace)
+                self._scan_dir(
+                    workspace, SAMPLE if _is_sample(workspace) else ROOT, None, workspace, rescan
+                )
+        log.debug(f"Catalogue scan: {self._stats}")
+        return dict(self._stats)
+
+    def _scan_dir(
+        self, path: Text, kind: Text, parent: Optional[Text], workspace: Text, rescan: bool
+    ) -> None:
+        cursor = self._connection.cursor()
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self._remove(path)
+            return
+
+        row = cursor.execute(
+            "SELECT mtime_ns, kind FROM directories WHERE path=?", (path,)
+        ).fetchone()
+        if row is not None and row[1] != kind:
+            # e.g. a sample whose run finished after the previous scan, creating Output/SAF
+            # does not change the modification time of the parent directory.
+            self._remove(path)
+            row = None
+        if row is not None and row[0] == mtime_ns and not rescan:
+            self._stats["skipped"] += 1
+            children = cursor.execute(
+                "SELECT path, kind FROM directories WHERE parent=?", (path,)
+            ).fetchall()
+            if kind == ROOT:
+                children = [(child, SAMPLE if _is_sample(child) else ROOT) for child, _ in children]
+        else:
+            self._stats["listed"] += 1
+            children = self._list(path, kind, workspace)
+            known = cursor.execute(
+                "SELECT path FROM directories WHERE parent=?", (path,)
+            ).fetchall()
+            current = set(x[0] for x in children)
+            for (child,) in known:
+                if child not in current:
+                    self._remove(child)
+            cursor.execute(
+                "INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?)",
+                (path, parent, kind, mtime_ns),
+            )
+
+        for child, child_kind in children:
+            self._scan_dir(child, child_kind, path, workspace, rescan)
+
+    def _list(self, path: Text, kind: Text, workspace: Text) -> MutableSequence[Tuple[Text, Text]]:
+        """List a directory, record its content and return the subdirectories to be scanned"""
+        cursor = self._connection.cursor()
+        children = []
+
+        if kind == SAMPLE:
+            cursor.execute("INSERT OR REPLACE INTO samples VALUES (?, ?)", (path, workspace))
+            saf = os.path.join(path, "Output", "SAF")
+            return [(saf, SAF)] if os.path.isdir(saf) else []
+
+        with os.scandir(path) as entries:
+            entries = [x for x in entries if not x.name.startswith(".")]
+
+        if kind == ROOT:
+            for entry in entries:
+                if entry.is_dir():
+                    children.append((entry.path, SAMPLE if _is_sample(entry.path) else ROOT))
+
+        elif kind == SAF:
+            children = [(x.path, DATASET) for x in entries if x.is_dir()]
+
+        elif kind == DATASET:
+            sample = os.path.dirname(os.path.dirname(os.path.dirname(path)))
+            name = os.path.basename(path)
+            saf_file, size, mtime_ns = None, None, None
+            for entry in entries:
+                if entry.is_file() and entry.name == f"{name}.saf":
+                    stat = entry.stat()
+                    saf_file, size, mtime_ns = entry.path, stat.st_size, stat.st_mtime_ns
+                elif entry.is_dir():
+                    children.append((entry.path, ANALYSIS))
+            cursor.execute(
+                "INSERT OR REPLACE INTO datasets VALUES (?, ?, ?, ?, ?, ?)",
+                (path, sample, name, saf_file, size, mtime_ns),
+            )
+
+        elif kind == ANALYSIS:
+            dataset = os.path.dirname(path)
+            sample = os.path.dirname(os.path.dirname(os.path.dirname(dataset)))
+            cursor.execute(
+                "INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?)",
+                (path, sample, os.path.basename(dataset), os.path.basename(path)),
+            )
+            for entry in entries:
+                if entry.is_dir() and entry.name == "Cutflows":
+                    children.append((entry.path, CUTFLOWS))
+                elif entry.is_dir() and entry.name == "Histograms":
+                    children.append((entry.path, HISTOGRAMS))
+
+        elif kind in [CUTFLOWS, HISTOGRAMS]:
+            analysis = os.path.dirname(path)
+            file_kind = "region" if kind == CUTFLOWS else "histogram"
+            cursor.execute("DELETE FROM files WHERE analysis=? AND kind=?", (analysis, file_kind))
+            rows = []
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(".saf"):
+                    stat = entry.stat()
+                    name = entry.name[:-4] if kind == CUTFLOWS else entry.name
+                    rows.append(
+                        (entry.path, analysis, file_kind, name, stat.st_size, stat.st_mtime_ns)
+                    )
+            cursor.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+        return children
+
+    def _remove(self, path: Text) -> None:
+        """Remove a directory and everything below it from the index"""
+        prefix = path + os.sep
+        for table in ["directories", "samples", "datasets", "analyses", "files"]:
+            self._connection.execute(
+                f"DELETE FROM {table} WHERE path=? OR substr(path, 1, ?)=?",
+                (path, len(prefix), prefix),
+            )
+
+    def samples(self, analysis: Optional[Text] = None) -> MutableSequence[Text]:
+        """
+        Indexed samples
+
+        Parameters
+        ----------
+        analysis: Optional[Text]
+            only return the samples which include this analysis
+
+        Returns
+        -------
+        list of sample paths
+        """
+        if analysis is None:
+            query = self._connection.execute("SELECT path FROM samples ORDER BY path")
+        else:
+            query = self._connection.execute(
+                "SELECT DISTINCT sample FROM analyses WHERE name=? ORDER BY sample", (analysis,)
+            )
+        return [x[0] for x in query]
+
+    def datasets(self, sample: Text) -> MutableSequence[Text]:
+        """Names of the datasets of a sample"""
+        query = self._connection.execute(
+            "SELECT name FROM datasets WHERE sample=? ORDER BY name", (os.path.abspath(sample),)
+        )
+        return [x[0] for x in query]
+
+    def sample_info_file(self, sample: Text, dataset: Text) -> Optional[Text]:
+        """Sample information file of a dataset"""
+        row = self._connection.execute(
+            "SELECT saf_file FROM datasets WHERE sample=? AND name=?",
+            (os.path.abspath(sample), dataset),
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def analyses(
+        self, sample: Optional[Text] = None, dataset: Optional[Text] = None
+    ) -> MutableSequence[Text]:
+        """
+        Names of the indexed analyses
+
+        Parameters
+        ----------
+        sample: Optional[Text]
+            only the analyses of this sample
+        dataset: Optional[Text]
+            only the analyses of this dataset
+        """
+        query, args = "SELECT DISTINCT name FROM analyses WHERE 1", []
+        if sample is not None:
+            query, args = query + " AND sample=?", args + [os.path.abspath(sample)]
+        if dataset is not None:
+            query, args = query + " AND dataset=?", args + [dataset]
+        return [x[0] for x in self._connection.execute(query + " ORDER BY name", args)]
+
+    def _files(
+        self, kind: Text, sample: Text, dataset: Text, analysis: Text
+    ) -> MutableSequence[Tuple[Text, Text, int, int]]:
+        path = os.path.join(os.path.abspath(sample), "Output", "SAF", dataset, analysis)
+        query = self._connection.execute(
+            "SELECT name, path, size, mtime_ns FROM files WHERE analysis=? AND kind=? "
+            "ORDER BY name",
+            (path, kind),
+        )
+        return query.fetchall()
+
+    def region_files(
+        self, sample: Text, dataset: Text, analysis: Text
+    ) -> MutableSequence[Tuple[Text, Text, int, int]]:
+        """
+        Cutflow files of an analysis
+
+        Returns
+        -------
+        list of (region name, path, size, modification time in ns)
+        """
+        return self._files("region", sample, dataset, analysis)
+
+    def histogram_files(
+        self, sample: Text, dataset: Text, analysis: Text
+    ) -> MutableSequence[Tuple[Text, Text, int, int]]:
+        """
+        Histogram files of an analysis
+
+        Returns
+        -------
+        list of (file name, path, size, modification time in ns)
+        """
+        return self._files("histogram", sample, dataset, analysis)
+
+    def regions(self, analysis: Text) -> MutableSequence[Text]:
+        """Names of all the regions indexed for an analysis"""
+        query = self._connection.execute(
+            "SELECT DISTINCT files.name FROM files JOIN analyses ON files.analysis=analyses.path "
+            "WHERE analyses.name=? AND files.kind='region' ORDER BY files.name",
+            (analysis,),
+        )
+        return [x[0] for x in query]
+
+    def load(
+        self,
+        sample: Text,
+        dataset: Text = "defaultset",
+        analyses: Optional[Sequence[Text]] = None,
+        **kwargs,
+    ):
+        """
+        Load a sample using the indexed analyses and files, the sample folder is not
+        listed again.
+
+        Parameters
+        ----------
+        sample: Text
+            sample path
+        dataset: Text
+            dataset name
+        analyses: Optional[Sequence[Text]]
+            analyses to be loaded, default all indexed analyses.
+        **kwargs:
+            see ``ma5_expert.sample.SampleCollection``
+
+        Returns
+        -------
+        ma5_expert.sample.SampleCollection
+        """
+        from ma5_expert.sample import SampleCollection
+
+        sample = os.path.abspath(sample)
+        files = {
+            analysis: {
+                "region": [x[1] for x in self.region_files(sample, dataset, analysis)],
+                "histogram": [x[1] for x in self.histogram_files(sample, dataset, analysis)],
+            }
+            for analysis in self.analyses(sample, dataset)
+        }
+        return SampleCollection(
+            sample,
+            dataset,
+            analyses=analyses,
+            files=files,
+            saf_file=self.sample_info_file(sample, dataset),
+            **kwargs,
+        )
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM samples").fetchone()[0]
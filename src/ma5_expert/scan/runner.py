@@ -0,0 +1,241 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Text, Optional, Callable, Dict, Iterable, Tuple, Type, Iterator
+
+from ma5_expert.backend import PADType
+from ma5_expert.pad import PADInterface, ExclusionCache
+
+log = logging.getLogger("ma5_expert")
+
+OK, FAILED = "ok", "failed"
+
+
+@dataclass(frozen=True)
+class ScanPoint:
+    """
+    Single exclusion computation of a scan
+
+    Parameters
+    ----------
+    sample_path: Text
+        Path to the executed sample
+    analysis: Text
+        analysis name
+    xsection: float
+        cross section value in pb.
+    padtype: PADType
+        detector backend of the analysis
+    dataset_name: Text
+        name of the dataset
+    luminosity: Optional[float]
+        luminosity in 1/fb, default luminosity of the analysis if None.
+    expectation_assumption: Text
+        assumption on expectation value computation.
+    info_file: Optional[Text]
+        info file path if it is not read from PAD.
+    """
+
+    sample_path: Text
+    analysis: Text
+    xsection: float
+    padtype: PADType = PADType.PADForSFS
+    dataset_name: Text = "defaultset"
+    luminosity: Optional[float] = None
+    expectation_assumption: Text = "apriori"
+    info_file: Optional[Text] = None
+
+    def to_dict(self) -> Dict:
+        point = asdict(self)
+        point["padtype"] = str(self.padtype)
+        return point
+
+    @classmethod
+    def from_dict(cls, point: Dict) -> "ScanPoint":
+        return cls(**dict(point, padtype=PADType(point["padtype"])))
+
+    @property
+    def key(self) -> Text:
+        """Unique identifier of the computation"""
+        return hashlib.sha1(json.dumps(self.to_dict(), sort_keys=True).encode()).hexdigest()
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Retry policy of failing scan points
+
+    Parameters
+    ----------
+    max_attempts: int
+        maximum number of attempts of a point, including the attempts of previous runs.
+    retry_on: Tuple[Type[Exception], ...]
+        exceptions to be retried, other exceptions are recorded as permanent failures.
+    backoff: float
+        waiting time in seconds before a retry, doubled after each attempt.
+    """
+
+    max_attempts: int = 3
+    retry_on: Tuple[Type[Exception], ...] = (Exception,)
+    backoff: float = 0.0
+
+
+def _compute(point: ScanPoint, cache: Optional[ExclusionCache] = None) -> Dict:
+    return PADInterface(point.sample_path, point.dataset_name).compute_exclusion(
+        point.analysis,
+        point.xsection,
+        point.padtype,
+        luminosity=point.luminosity,
+        info_file=point.info_file,
+        expectation_assumption=point.expectation_assumption,
+        cache=cache,
+    )
+
+
+class ScanRunner:
+    """
+    Checkpointed exclusion scan.
+
+    The result of each finished point is appended to a JSON-lines file and flushed to disk
+    before the next point starts, hence a scan can be interrupted at any time. When the scan
+    is restarted, completed points are skipped and failed points are retried until the
+    retry policy gives up on them.
+
+    Parameters
+    ----------
+    output: Text
+        path to the JSON-lines results file
+    retry: Optional[RetryPolicy]
+        retry policy of failing points
+    compute: Optional[Callable[[ScanPoint], Dict]]
+        function computing the region data of a point. The default is
+        ``PADInterface.compute_exclusion``.
+    cache: Optional[ExclusionCache]
+        exclusion cache used by the default compute function
+    fsync: bool
+        synchronise the results file with the disk after each point.
+    """
+
+    def __init__(
+        self,
+        output: Text,
+        retry: Optional[RetryPolicy] = None,
+        compute: Optional[Callable[[ScanPoint], Dict]] = None,
+        cache: Optional[ExclusionCache] = None,
+        fsync: bool = True,
+    ):
+        self.output = output
+        self.retry = retry or RetryPolicy()
+        self.compute = compute or (lambda point: _compute(point, cache))
+        self.fsync = fsync
+        if os.path.dirname(output) != "":
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+
+    def records(self) -> Iterator[Dict]:
+        """Iterate over the records of the results file, incomplete lines are skipped"""
+        if not os.path.isfile(self.output):
+            return
+        with open(self.output, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # interrupted while writing
+                    continue
+                if isinstance(record, dict) and "key" in record:
+                    yield record
+
+    def status(self) -> Dict[Text, Dict]:
+        """
+        Latest state of each point, ``{key: {"status": ..., "attempts": ...}}``
+        """
+        status = {}
+        for record in self.records():
+            state = status.setdefault(record["key"], {"status": FAILED, "attempts": 0})
+            if state["status"] == OK:
+                continue
+            state["status"] = record["status"]
+            state["attempts"] += 1
+            state["retry"] = record.get("retry", True)
+        return status
+
+    def results(self) -> Dict[Text, Dict]:
+        """Record of each completed point"""
+        return {record["key"]: record for record in self.records() if record["status"] == OK}
+
+    def _write(self, stream, record: Dict) -> None:
+        stream.write(json.dumps(record, default=float) + "\n")
+        stream.flush()
+        if self.fsync:
+            os.fsync(stream.fileno())
+
+    def run(self, points: Iterable[ScanPoint]) -> Dict[Text, int]:
+        """
+        Execute the scan
+
+        Parameters
+        ----------
+        points: Iterable[ScanPoint]
+            points of the scan
+
+        Returns
+        -------
+        Dict[Text, int]:
+            number of ``completed``, ``skipped`` and ``failed`` points in this run
+        """
+        status = self.status()
+        summary = {"completed": 0, "skipped": 0, "failed": 0}
+
+        with open(self.output, "a+") as stream:
+            stream.seek(0, os.SEEK_END)
+            if stream.tell() > 0:
+                stream.seek(stream.tell() - 1)
+                if stream.read(1) != "\n":
+                    # previous run was interrupted in the middle of a record
+                    stream.write("\n")
+
+            for point in points:
+                key = point.key
+                state = status.get(key, {"status": FAILED, "attempts": 0, "retry": True})
+                if (
+                    state["status"] == OK
+                    or not state["retry"]
+                    or state["attempts"] >= self.retry.max_attempts
+                ):
+                    summary["skipped"] += 1
+                    continue
+
+                attempts = state["attempts"]
+                while attempts < self.retry.max_attempts:
+                    if attempts > state["attempts"] and self.retry.backoff > 0.0:
+                        time.sleep(self.retry.backoff * 2 ** (attempts - state["attempts"] - 1))
+                    attempts += 1
+                    record = {"key": key, "point": point.to_dict(), "attempt": attempts}
+                    start = time.time()
+                    try:
+                        record["regiondata"] = self.compute(point)
+                        record["status"] = OK
+                    except Exception as err:
+                        retry = isinstance(err, self.retry.retry_on)
+                        log.warning(
+                            f"Scan point {point.sample_path}, {point.analysis} failed "
+                            f"(attempt {attempts}): {err}"
+                        )
+                        record.update({"status": FAILED, "error": f"{type(err).__name__}: {err}"})
+                        record["retry"] = retry
+                    record["time"] = time.time() - start
+                    self._write(stream, record)
+                    if record["status"] == OK or not record["retry"]:
+                        break
+
+                summary["completed" if record["status"] == OK else "failed"] += 1
+                status[key] = {
+                    "status": record["status"],
+                    "attempts": attempts,
+                    "retry": record.get("retry", True),
+                }
+
+        return summary
@@ -0,0 +1,338 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+import zlib
+from functools import partial
+from typing import Text, Optional, Callable, Dict, Sequence, MutableSequence
+
+from ma5_expert.pad import ExclusionCache
+from ma5_expert.system.exceptions import InvalidInput
+from .runner import ScanPoint, ScanRunner, RetryPolicy, _compute
+
+log = logging.getLogger("ma5_expert")
+
+
+def shard_index(point: ScanPoint, n_shards: int) -> int:
+    """Shard of a scan point, depends only on the point itself"""
+    return int(point.key, 16) % n_shards
+
+
+def _write_atomic(path: Text, content: Text) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class ShardedScan:
+    """
+    Exclusion scan split into shards which are executed by independent processes or nodes.
+
+    Workers coordinate through a shared directory only: a shard is claimed by exclusively
+    creating its claim file, its results are written by a ``ScanRunner`` and a done marker
+    is created when all the points of the shard succeeded. A shard with failed points is
+    released so that another worker or a later run retries them. Claims are refreshed
+    by a heartbeat thread while the shard runs, a claim which has not been refreshed for
+    ``lease`` seconds is considered abandoned and can be taken over by another worker,
+    which resumes from the checkpointed results.
+
+    Parameters
+    ----------
+    directory: Text
+        shared scan directory, see ``ShardedScan.create``.
+    retry: Optional[RetryPolicy]
+        retry policy of failing points
+    compute: Optional[Callable[[ScanPoint], Dict]]
+        function computing the region data of a point, see ``ScanRunner``.
+    cache: Optional[ExclusionCache]
+        exclusion cache used by the default compute function
+    lease: float
+        time in seconds after which a claim is considered abandoned.
+    """
+
+    def __init__(
+        self,
+        directory: Text,
+        retry: Optional[RetryPolicy] = None,
+        compute: Optional[Callable[[ScanPoint], Dict]] = None,
+        cache: Optional[ExclusionCache] = None,
+        lease: float = 3600.0,
+    ):
+        manifest = os.path.join(directory, "manifest.json")
+        if not os.path.isfile(manifest):
+            raise InvalidInput(f"Can not find a sharded scan in {directory}")
+        with open(manifest, "r") as f:
+            self.n_shards = int(json.load(f)["n_shards"])
+        self.directory = directory
+        self.retry = retry
+        self.compute = compute
+        self.cache = cache
+        self.lease = lease
+
+    @classmethod
+    def create(
+        cls, directory: Text, points: Sequence[ScanPoint], n_shards: int, **kwargs
+    ) -> "ShardedScan":
+        """
+        Partition the points into shards and write them to the scan directory. If the
+        directory already holds the same scan it is reused.
+
+        Parameters
+        ----------
+        directory: Text
+            shared scan directory
+        points: Sequence[ScanPoint]
+            points of the scan
+        n_shards: int
+            number of shards
+        **kwargs:
+            see ``ShardedScan``
+
+        Raises
+        ------
+        InvalidInput:
+            if the directory holds a different scan.
+        """
+        if n_shards < 1:
+            raise InvalidInput("Number of shards should be at least one.")
+        shards = [[] for _ in range(n_shards)]
+        for point in points:
+            shards[shard_index(point, n_shards)].append(point.to_dict())
+
+        for subdir in ["shards", "claims", "results", "done"]:
+            os.makedirs(os.path.join(directory, subdir), exist_ok=True)
+        manifest = json.dumps(
+            {
+                "n_shards": n_shards,
+                "keys": sorted(ScanPoint.from_dict(p).key for s in shards for p in s),
+            }
+        )
+        manifest_path = os.path.join(directory, "manifest.json")
+        if os.path.isfile(manifest_path):
+            with open(manifest_path, "r") as f:
+                if f.read() != manifest:
+                    raise InvalidInput(f"{directory} already holds a different scan.")
+        else:
+            for index, shard in enumerate(shards):
+                _write_atomic(cls._path(directory, "shards", index), json.dumps(shard))
+            # manifest is written last, a scan is valid only if all the shards exist
+            _write_atomic(manifest_path, manifest)
+        return cls(directory, **kwargs)
+
+    @staticmethod
+    def _path(directory: Text, kind: Text, index: int) -> Text:
+        extension = {"shards": "json", "claims": "claim", "results": "jsonl", "done": "done"}
+        return os.path.join(directory, kind, f"shard_{index:05d}.{extension[kind]}")
+
+    def path(self, kind: Text, index: int) -> Text:
+        """Path of the ``shards``, ``claims``, ``results`` or ``done`` file of a shard"""
+        return self._path(self.directory, kind, index)
+
+    def shard(self, index: int) -> MutableSequence[ScanPoint]:
+        """Points of a shard"""
+        with open(self.path("shards", index), "r") as f:
+            return [ScanPoint.from_dict(point) for point in json.load(f)]
+
+    def claim(self, index: int, worker: Text) -> bool:
+        """
+        Try to claim a shard
+
+        Parameters
+        ----------
+        index: int
+            shard index
+        worker: Text
+            name of the worker
+
+        Returns
+        -------
+        bool:
+            True if the shard has been claimed by this worker.
+        """
+        if os.path.exists(self.path("done", index)):
+            return False
+        claim = self.path("claims", index)
+        if not self._remove_abandoned(index, claim, worker):
+            return False
+        try:
+            descriptor = os.open(claim, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(descriptor, "w") as f:
+            f.write(json.dumps({"worker": worker, "time": time.time()}))
+        return True
+
+    @staticmethod
+    def _owner(path: Text) -> Optional[Text]:
+        """Worker of a claim, None if the claim does not exist or is being written"""
+        try:
+            with open(path, "r") as f:
+                return json.load(f).get("worker", None)
+        except (OSError, ValueError):
+            return None
+
+    def _release(self, claim: Text, worker: Text) -> None:
+        """Remove the claim of a shard if it still belongs to the worker"""
+        owner = self._owner(claim)
+        if owner != worker:
+            log.warning(f"Claim {claim} belongs to {owner}, it is not released by {worker}.")
+            return
+        try:
+            os.remove(claim)
+        except FileNotFoundError:
+            pass
+
+    def _is_stale(self, path: Text) -> bool:
+        return time.time() - os.stat(path).st_mtime > self.lease
+
+    def _remove_abandoned(self, index: int, claim: Text, worker: Text) -> bool:
+        """
+        Remove the claim of a shard if it is abandoned. Returns False if the shard is
+        claimed by a live worker.
+        """
+        try:
+            if not self._is_stale(claim):
+                return True
+        except FileNotFoundError:
+            return True
+        # Move the claim out of the way under a unique name. Another worker may have
+        # replaced the abandoned claim in the meantime, hence the moved claim is checked
+        # again and put back if it is alive.
+        moved = f"{claim}.{worker}.{uuid.uuid4().hex}.stale"
+        try:
+            os.rename(claim, moved)
+        except FileNotFoundError:
+            return True
+        try:
+            if self._is_stale(moved):
+                log.warning(f"Taking over abandoned shard {index}")
+                return True
+            try:
+                # link does not overwrite a claim created in the meantime
+                os.link(moved, claim)
+            except FileExistsError:
+                pass
+            return False
+        finally:
+            os.remove(moved)
+
+    @classmethod
+    def _heartbeat(cls, claim: Text, worker: Text, interval: float, stop: threading.Event) -> None:
+        """
+        Refresh a claim until ``stop`` is set. A claim can be missing for a moment while
+        another worker checks whether it is abandoned, the heartbeat stops only once the
+        claim belongs to another worker.
+        """
+        while not stop.wait(interval):
+            owner = cls._owner(claim)
+            if owner is None:
+                log.debug(f"Claim {claim} is missing, retrying.")
+                continue
+            if owner != worker:
+                log.warning(f"Claim {claim} has been taken over by {owner}.")
+                return
+            try:
+                os.utime(claim)
+            except FileNotFoundError:
+                continue
+
+    def work(
+        self, worker: Optional[Text] = None, max_shards: Optional[int] = None
+    ) -> MutableSequence[int]:
+        """
+        Claim and execute shards until none is left
+
+        Parameters
+        ----------
+        worker: Optional[Text]
+            name of the worker, default ``hostname:pid``.
+        max_shards: Optional[int]
+            maximum number of shards to be executed by this worker.
+
+        Returns
+        -------
+        MutableSequence[int]:
+            indices of the shards executed by this worker
+        """
+        worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+        executed = []
+        # workers start from different shards to reduce the contention on the claims
+        start = zlib.crc32(worker.encode()) % self.n_shards
+        for offset in range(self.n_shards):
+            if max_shards is not None and len(executed) >= max_shards:
+                break
+            index = (start + offset) % self.n_shards
+            if not self.claim(index, worker):
+                continue
+            claim = self.path("claims", index)
+
+            # refresh the claim so that it is not taken over while the shard runs
+            stop = threading.Event()
+            heartbeat = threading.Thread(
+                target=self._heartbeat,
+                args=(claim, worker, self.lease / 4.0, stop),
+                daemon=True,
+            )
+            heartbeat.start()
+            try:
+                runner = ScanRunner(
+                    self.path("results", index),
+                    retry=self.retry,
+                    compute=self.compute or partial(_compute, cache=self.cache),
+                )
+                summary = runner.run(self.shard(index))
+            finally:
+                stop.set()
+                heartbeat.join()
+            log.debug(f"Shard {index} executed by {worker}: {summary}")
+            if summary["failed"] == 0:
+                _write_atomic(self.path("done", index), json.dumps(dict(summary, worker=worker)))
+            else:
+                # release the shard so that the failed points are retried
+                log.warning(f"Shard {index} has {summary['failed']} failed points, releasing it.")
+                self._release(claim, worker)
+            executed.append(index)
+        return executed
+
+    def status(self) -> Dict[Text, MutableSequence[int]]:
+        """Indices of the ``pending``, ``running`` and ``done`` shards"""
+        status = {"pending": [], "running": [], "done": []}
+        for index in range(self.n_shards):
+            if os.path.exists(self.path("done", index)):
+                status["done"].append(index)
+            elif os.path.exists(self.path("claims", index)):
+                status["running"].append(index)
+            else:
+                status["pending"].append(index)
+        return status
+
+    def reduce(self, output: Optional[Text] = None) -> Dict[Text, Dict]:
+        """
+        Merge the results of all the shards
+
+        Parameters
+        ----------
+        output: Optional[Text]
+            if given, completed records are written to this JSON-lines file.
+
+        Returns
+        -------
+        Dict[Text, Dict]:
+            record of each completed point, indexed by ``ScanPoint.key``
+        """
+        results = {}
+        for index in range(self.n_shards):
+            if os.path.isfile(self.path("results", index)):
+                results.update(ScanRunner(self.path("results", index)).results())
+        if output is not None:
+            _write_atomic(
+                output,
+                "".join(json.dumps(record, default=float) + "\n" for record in results.values()),
+            )
+        return results
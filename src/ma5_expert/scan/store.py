@@ -0,0 +1,233 @@
+import logging
+import sqlite3
+from typing import Text, Optional, Sequence, Dict, Union, Iterable, Tuple
+
+import numpy as np
+
+log = logging.getLogger("ma5_expert")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cuts (
+    sample TEXT NOT NULL, analysis TEXT NOT NULL, region TEXT NOT NULL,
+    cut_index INTEGER NOT NULL, cut_name TEXT, final INTEGER NOT NULL,
+    Nentries INTEGER, sumW REAL, sumW2 REAL, sumW0 REAL, xsec REAL, lumi REAL,
+    PRIMARY KEY (sample, analysis, region, cut_index)
+);
+CREATE INDEX IF NOT EXISTS cuts_region ON cuts (analysis, region, final, cut_index);
+CREATE INDEX IF NOT EXISTS cuts_name ON cuts (analysis, region, cut_name);
+"""
+
+COLUMNS = ["Nentries", "sumW", "sumW2", "sumW0", "xsec", "lumi", "Nevents"]
+
+# expected number of events, xsec [pb] x 1000 x lumi [1/fb] x efficiency
+_NEVENTS = "(xsec * 1000.0 * {lumi} * sumW / sumW0)"
+
+
+class ResultStore:
+    """
+    SQLite store of cutflow summaries of a scan.
+
+    Every cut of every region is stored per sample and analysis with its number of entries,
+    sum of weights, sum of squared weights, cross section and luminosity, so that large
+    scans can be queried without keeping the collections in memory.
+
+    Parameters
+    ----------
+    database: Text
+        path to the SQLite database. The default is an in-memory database.
+    """
+
+    def __init__(self, database: Text = ":memory:"):
+        self.database = database
+        self._connection = sqlite3.connect(database)
+        self._connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def _rows(sample: Text, analysis: Text, collection) -> Iterable[Tuple]:
+        for region, cutflow in collection.items():
+            sumW0 = cutflow[0].sumW
+            for idx, cut in cutflow.items():
+                yield (
+                    sample,
+                    analysis,
+                    region,
+                    idx,
+                    cut.name,
+                    int(idx == len(cutflow) - 1),
+                    cut.Nentries,
+                    cut.sumW,
+                    cut.sumW2,
+                    sumW0,
+                    cut.xsec,
+                    cut.lumi,
+                )
+
+    def add_collection(self, sample: Text, analysis: Text, collection) -> None:
+        """
+        Store a cutflow collection
+
+        Parameters
+        ----------
+        sample: Text
+            sample identifier
+        analysis: Text
+            analysis name
+        collection: ma5_expert.cutflow.Collection
+            cutflow collection
+        """
+        self.add_collections([(sample, analysis, collection)])
+
+    def add_collections(self, collections: Iterable[Tuple]) -> None:
+        """
+        Store many cutflow collections in a single transaction. Previously stored cutflows
+        of the same sample and analysis are replaced.
+
+        Parameters
+        ----------
+        collections: Iterable[Tuple]
+            (sample identifier, analysis name, ma5_expert.cutflow.Collection)
+        """
+        with self._connection:
+            for sample, analysis, collection in collections:
+                # regions may have fewer cuts than before, drop the old rows entirely
+                self._connection.execute(
+                    "DELETE FROM cuts WHERE sample=? AND analysis=?", (sample, analysis)
+                )
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO cuts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._rows(sample, analysis, collection),
+                )
+
+    def add_sample(self, sample, name: Optional[Text] = None) -> None:
+        """
+        Store every cutflow collection of a sample
+
+        Parameters
+        ----------
+        sample: ma5_expert.sample.SampleCollection
+            sample to be stored
+        name: Optional[Text]
+            sample identifier, default is the sample path.
+        """
+        name = sample.sample_path if name is None else name
+        self.add_collections(
+            (name, analysis, output.cutflows)
+            for analysis, output in sample.items()
+            if output.cutflows is not None
+        )
+
+    def samples(self, analysis: Optional[Text] = None) -> np.ndarray:
+        """Stored sample identifiers"""
+        if analysis is None:
+            query = self._connection.execute("SELECT DISTINCT sample FROM cuts ORDER BY sample")
+        else:
+            query = self._connection.execute(
+                "SELECT DISTINCT sample FROM cuts WHERE analysis=? ORDER BY sample", (analysis,)
+            )
+        return np.array([x[0] for x in query], dtype=str)
+
+    def query(
+        self,
+        analysis: Text,
+        region: Text,
+        cut: Union[int, Text] = -1,
+        columns: Sequence[Text] = ("Nentries", "sumW", "sumW2", "xsec", "lumi"),
+        lumi: Optional[float] = None,
+    ) -> Dict[Text, np.ndarray]:
+        """
+        Get the values of a cut for every stored sample
+
+        Parameters
+        ----------
+        analysis: Text
+            analysis name
+        region: Text
+            region name
+        cut: Union[int, Text]
+            cut index or name, -1 refers to the final cut of the region.
+        columns: Sequence[Text]
+            columns to be returned, see ``COLUMNS``.
+        lumi: Optional[float]
+            luminosity [1/fb] for ``Nevents``, if None stored luminosity is used.
+
+        Returns
+        -------
+        Dict[Text, np.ndarray]:
+            ``sample`` and the requested columns
+        """
+        for col in columns:
+            if col not in COLUMNS:
+                raise ValueError(f"Unknown column: {col}. Available columns: {COLUMNS}")
+        selection = [
+            _NEVENTS.format(lumi="?" if lumi is not None else "lumi") if col == "Nevents" else col
+            for col in columns
+        ]
+        args = [lumi] * sum(col == "Nevents" for col in columns) if lumi is not None else []
+
+        query = f"SELECT sample, {', '.join(selection)} FROM cuts WHERE analysis=? AND region=?"
+        args += [analysis, region]
+        if isinstance(cut, str):
+            query, args = query + " AND cut_name=?", args + [cut]
+        elif cut == -1:
+            query += " AND final=1"
+        else:
+            query, args = query + " AND cut_index=?", args + [int(cut)]
+
+        rows = self._connection.execute(query + " ORDER BY sample", args).fetchall()
+        output = {"sample": np.array([x[0] for x in rows], dtype=str)}
+        for idx, col in enumerate(columns):
+            output[col] = np.array(
+                [x[idx + 1] if x[idx + 1] is not None else np.nan for x in rows],
+                dtype=np.int64 if col == "Nentries" else np.float64,
+            )
+        return output
+
+    def yields(
+        self, analysis: Text, region: Text, cut: Union[int, Text] = -1, lumi: Optional[float] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Expected number of events of a cut for every stored sample
+
+        Returns
+        -------
+        sample identifiers, number of events
+        """
+        output = self.query(analysis, region, cut, ["Nevents"], lumi)
+        return output["sample"], output["Nevents"]
+
+    def select(
+        self,
+        analysis: Text,
+        region: Text,
+        min_events: Optional[float] = None,
+        max_events: Optional[float] = None,
+        cut: Union[int, Text] = -1,
+        lumi: Optional[float] = None,
+    ) -> np.ndarray:
+        """
+        Samples where the expected number of events of a cut is within the given limits,
+        e.g. ``store.select("atlas_susy_2018_31", "SRA_M", min_events=3.)``
+
+        Returns
+        -------
+        sample identifiers
+        """
+        samples, nevents = self.yields(analysis, region, cut, lumi)
+        mask = np.ones(len(samples), dtype=bool)
+        if min_events is not None:
+            mask &= nevents > min_events
+        if max_events is not None:
+            mask &= nevents < max_events
+        return samples[mask]
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(DISTINCT sample) FROM cuts").fetchone()[0]
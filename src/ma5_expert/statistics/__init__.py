@@ -0,0 +1,11 @@
+from .counting import CLs, exclusion_cl, upper_limit, compute_regiondata
+from .simplified_likelihood import SimplifiedLikelihood, compute_combined_regiondata
+
+__all__ = [
+    "CLs",
+    "exclusion_cl",
+    "upper_limit",
+    "compute_regiondata",
+    "SimplifiedLikelihood",
+    "compute_combined_regiondata",
+]
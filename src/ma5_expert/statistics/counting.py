@@ -0,0 +1,230 @@
+import logging
+from typing import Text, Dict, Sequence, Optional, Tuple
+
+import numpy as np
+
+log = logging.getLogger("ma5_expert")
+
+ArrayLike = np.ndarray
+
+
+def _scipy_special():
+    try:
+        from scipy import special
+    except ImportError as err:
+        raise NotImplementedError("Please install scipy to enable this feature.")
+    return special
+
+
+def _background_nodes(
+    nb: ArrayLike, deltanb: ArrayLike, npoints: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Quadrature nodes for the background expectation. Background is assumed to follow a
+    Gaussian distribution truncated at zero, nodes are placed on the cumulative probability
+    scale of the truncated distribution using Gauss-Legendre quadrature.
+
+    Returns
+    -------
+    background values with an additional trailing axis of size ``npoints`` and weights
+    """
+    special = _scipy_special()
+    nb, deltanb = np.asarray(nb, dtype=np.float64), np.asarray(deltanb, dtype=np.float64)
+    x, w = np.polynomial.legendre.leggauss(npoints)
+    # probability of the background to be negative
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lower = np.where(deltanb > 0.0, special.ndtr(-nb / deltanb), 0.0)
+    lower = lower[..., np.newaxis]
+    u = lower + (1.0 - lower) * (x + 1.0) / 2.0
+    background = nb[..., np.newaxis] + deltanb[..., np.newaxis] * special.ndtri(u)
+    return np.clip(background, 0.0, None), w / 2.0
+
+
+def CLs(
+    nobs: ArrayLike,
+    nb: ArrayLike,
+    deltanb: ArrayLike,
+    nsignal: ArrayLike,
+    npoints: int = 64,
+) -> np.ndarray:
+    """
+    CLs value of a counting experiment.
+
+    The number of events is modelled by a Poisson distribution where the background
+    uncertainty is taken into account by marginalising over a Gaussian background
+    expectation, truncated at zero. The p-values are computed by counting experiments with
+    ``n <= nobs``, i.e. the limit of infinitely many toy experiments of the MadAnalysis 5
+    CLs calculator.
+
+    All the inputs are broadcast against each other, e.g. ``nsignal`` with shape
+    ``(nhypotheses, nregions)`` and region data with shape ``(nregions,)``.
+
+    Parameters
+    ----------
+    nobs: ArrayLike
+        number of observed events
+    nb: ArrayLike
+        expected number of background events
+    deltanb: ArrayLike
+        uncertainty on the number of background events
+    nsignal: ArrayLike
+        expected number of signal events
+    npoints: int
+        number of quadrature points for the background marginalisation
+
+    Returns
+    -------
+    np.ndarray:
+        CLs values
+    """
+    special = _scipy_special()
+    nobs, nb, deltanb, nsignal = np.broadcast_arrays(
+        *[np.asarray(x, dtype=np.float64) for x in [nobs, nb, deltanb, nsignal]]
+    )
+    background, weights = _background_nodes(nb, deltanb, npoints)
+    nobs = np.floor(nobs)[..., np.newaxis]
+    p_b = np.sum(special.pdtr(nobs, background) * weights, axis=-1)
+    p_sb = np.sum(special.pdtr(nobs, background + nsignal[..., np.newaxis]) * weights, axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(p_b > 0.0, np.clip(p_sb / p_b, 0.0, 1.0), 1.0)
+
+
+def exclusion_cl(
+    nobs: ArrayLike,
+    nb: ArrayLike,
+    deltanb: ArrayLike,
+    nsignal: ArrayLike,
+    npoints: int = 64,
+) -> np.ndarray:
+    """
+    Exclusion confidence level, ``1 - CLs``, which is reported as ``CLs`` by MadAnalysis 5.
+    See ``CLs`` for details.
+    """
+    return 1.0 - CLs(nobs, nb, deltanb, nsignal, npoints)
+
+
+def upper_limit(
+    nobs: ArrayLike,
+    nb: ArrayLike,
+    deltanb: ArrayLike,
+    confidence_level: float = 0.95,
+    npoints: int = 64,
+    rtol: float = 1e-6,
+) -> np.ndarray:
+    """
+    Upper limit on the number of signal events at the given confidence level, i.e. the
+    number of signal events where ``1 - CLs = confidence_level``. The root is found
+    through a vectorised bisection, hence all regions are solved at once.
+
+    Parameters
+    ----------
+    nobs: ArrayLike
+        number of observed events
+    nb: ArrayLike
+        expected number of background events
+    deltanb: ArrayLike
+        uncertainty on the number of background events
+    confidence_level: float
+        confidence level of the limit
+    npoints: int
+        number of quadrature points for the background marginalisation
+    rtol: float
+        relative tolerance of the limit
+
+    Returns
+    -------
+    np.ndarray:
+        upper limit on the number of signal events
+    """
+    nobs, nb, deltanb = np.broadcast_arrays(
+        *[np.asarray(x, dtype=np.float64) for x in [nobs, nb, deltanb]]
+    )
+    target = 1.0 - confidence_level
+
+    low = np.zeros(nobs.shape)
+    high = np.ones(nobs.shape)
+    for _ in range(200):
+        above = CLs(nobs, nb, deltanb, high, npoints) > target
+        if not np.any(above):
+            break
+        low = np.where(above, high, low)
+        high = np.where(above, 2.0 * high, high)
+
+    while np.any(high - low > rtol * high):
+        mid = (low + high) / 2.0
+        above = CLs(nobs, nb, deltanb, mid, npoints) > target
+        low, high = np.where(above, mid, low), np.where(above, high, mid)
+
+    return (low + high) / 2.0
+
+
+def compute_regiondata(
+    regiondata: Dict[Text, Dict[Text, float]],
+    xsection: float,
+    lumi: float,
+    regions: Optional[Sequence[Text]] = None,
+    observed: bool = True,
+    npoints: int = 64,
+) -> Dict[Text, Dict[Text, float]]:
+    """
+    Compute exclusion information of each signal region, following the conventions of
+    the MadAnalysis 5 recasting module.
+
+    Each region requires ``nobs``, ``nb``, ``deltanb`` from the info file and ``Nf``,
+    ``N0`` from the cutflows, see ``ma5_expert.cutflow.CutFlow.regiondata``. The following
+    entries are added to each region:
+
+    * ``s95exp``, ``s95obs``: expected and observed cross section upper limits in pb
+      (-1 if the region has no signal).
+    * ``rSR``: ratio of the cross section to the expected upper limit.
+    * ``CLs``: exclusion confidence level, ``1 - CLs``.
+    * ``best``: 1 for the most sensitive region, 0 otherwise.
+
+    Parameters
+    ----------
+    regiondata: Dict[Text, Dict[Text, float]]
+        region data
+    xsection: float
+        cross section in pb
+    lumi: float
+        luminosity in 1/fb
+    regions: Optional[Sequence[Text]]
+        regions to be computed, default all regions in ``regiondata``.
+    observed: bool
+        compute observed upper limits.
+    npoints: int
+        number of quadrature points for the background marginalisation
+
+    Returns
+    -------
+    Dict[Text, Dict[Text, float]]:
+        updated region data
+    """
+    regions = list(regiondata.keys()) if regions is None else list(regions)
+    if len(regions) == 0:
+        return regiondata
+    data = {
+        key: np.array([float(regiondata[reg][key]) for reg in regions], dtype=np.float64)
+        for key in ["nobs", "nb", "deltanb", "Nf", "N0"]
+    }
+    with np.errstate(divide="ignore", invalid="ignore"):
+        eff = np.where(data["N0"] > 0.0, data["Nf"] / data["N0"], 0.0)
+    alive = eff > 0.0
+    norm = np.where(alive, eff * lumi * 1000.0, 1.0)
+
+    s95 = {"exp": upper_limit(data["nb"], data["nb"], data["deltanb"], npoints=npoints) / norm}
+    if observed:
+        s95["obs"] = upper_limit(data["nobs"], data["nb"], data["deltanb"], npoints=npoints) / norm
+    cls = exclusion_cl(data["nobs"], data["nb"], data["deltanb"], xsection * norm, npoints)
+
+    rSR = np.where(alive, xsection / s95["exp"], -1.0)
+    best = int(np.argmax(rSR)) if np.any(alive) else -1
+
+    for idx, reg in enumerate(regions):
+        for tag, limit in s95.items():
+            regiondata[reg]["s95" + tag] = float(limit[idx]) if alive[idx] else -1.0
+        regiondata[reg]["rSR"] = float(rSR[idx])
+        regiondata[reg]["CLs"] = float(cls[idx]) if alive[idx] else 0.0
+        regiondata[reg]["best"] = int(idx == best)
+
+    return regiondata
@@ -0,0 +1,311 @@
+import logging
+from typing import Text, Dict, Sequence, Optional, Tuple
+
+import numpy as np
+
+from .counting import _scipy_special, ArrayLike
+
+log = logging.getLogger("ma5_expert")
+
+# minimum expectation allowed during the fits
+_EPS = 1e-10
+
+
+def _max_step(lam: np.ndarray, step: np.ndarray) -> np.ndarray:
+    """Largest step fraction, up to one, which keeps the expectation positive"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        limit = np.where(step < 0.0, (lam - _EPS) / -step, np.inf)
+    return np.clip(0.9 * np.min(limit, axis=-1), 0.0, 1.0)
+
+
+class SimplifiedLikelihood:
+    """
+    Simplified likelihood for correlated signal regions.
+
+    The number of events of each region follows a Poisson distribution with expectation
+    ``mu * s_i + b_i + theta_i`` where the nuisance parameters ``theta`` are constrained by
+    a multivariate Gaussian with the background covariance matrix (arXiv:1809.05548). CLs
+    values are computed with the asymptotic formulae of the ``q~mu`` test statistic
+    (arXiv:1007.1727). Nuisance parameters are profiled with a batched Newton method, hence
+    all the signal hypotheses are evaluated at once.
+
+    Parameters
+    ----------
+    nobs: ArrayLike
+        number of observed events per region
+    nb: ArrayLike
+        expected number of background events per region
+    covariance: ArrayLike
+        background covariance matrix
+    maxiter: int
+        maximum number of Newton iterations
+    tol: float
+        convergence tolerance of the fits
+    """
+
+    def __init__(
+        self,
+        nobs: ArrayLike,
+        nb: ArrayLike,
+        covariance: ArrayLike,
+        maxiter: int = 50,
+        tol: float = 1e-8,
+    ):
+        self.nobs = np.asarray(nobs, dtype=np.float64).reshape(-1)
+        self.nb = np.asarray(nb, dtype=np.float64).reshape(-1)
+        self.covariance = np.asarray(covariance, dtype=np.float64).reshape(
+            self.nb.size, self.nb.size
+        )
+        if self.nobs.shape != self.nb.shape:
+            raise ValueError("Number of observed events does not match with the background.")
+        self.inv_cov = np.linalg.inv(self.covariance)
+        self.maxiter = maxiter
+        self.tol = tol
+
+    @property
+    def nregions(self) -> int:
+        return self.nb.size
+
+    def _loglikelihood(self, nobs, expected, theta) -> np.ndarray:
+        lam = np.clip(expected + theta, _EPS, None)
+        return np.sum(nobs * np.log(lam) - lam, axis=-1) - 0.5 * np.einsum(
+            "...i,ij,...j->...", theta, self.inv_cov, theta
+        )
+
+    def _profile(self, nobs: np.ndarray, expected: np.ndarray) -> np.ndarray:
+        """
+        Maximise the likelihood with respect to the nuisance parameters for fixed signal
+        strength.
+
+        Returns
+        -------
+        maximum log-likelihood for each hypothesis
+        """
+        theta = np.zeros(expected.shape)
+        for _ in range(self.maxiter):
+            lam = expected + theta
+            ratio = nobs / lam
+            grad = ratio - 1.0 - theta @ self.inv_cov
+            hess = -self.inv_cov - ratio[..., np.newaxis] / lam[..., np.newaxis] * np.eye(
+                self.nregions
+            )
+            step = -np.linalg.solve(hess, grad[..., np.newaxis])[..., 0]
+            theta = theta + _max_step(lam, step)[..., np.newaxis] * step
+            if np.max(np.abs(step)) < self.tol:
+                break
+        return self._loglikelihood(nobs, expected, theta)
+
+    def _fit(self, nobs: np.ndarray, nsignal: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Maximise the likelihood with respect to the signal strength and the nuisance
+        parameters.
+
+        Returns
+        -------
+        best fit signal strength and maximum log-likelihood for each hypothesis
+        """
+        mu = np.zeros(nsignal.shape[:-1])
+        theta = np.zeros(nsignal.shape)
+        eye = np.eye(self.nregions)
+        for _ in range(self.maxiter):
+            lam = mu[..., np.newaxis] * nsignal + self.nb + theta
+            ratio = nobs / lam
+            grad = np.concatenate(
+                [
+                    np.sum(nsignal * (ratio - 1.0), axis=-1)[..., np.newaxis],
+                    ratio - 1.0 - theta @ self.inv_cov,
+                ],
+                axis=-1,
+            )
+            weight = ratio / lam
+            hess = np.zeros(nsignal.shape[:-1] + (self.nregions + 1, self.nregions + 1))
+            hess[..., 0, 0] = -np.sum(nsignal**2 * weight, axis=-1) - _EPS
+            hess[..., 0, 1:] = hess[..., 1:, 0] = -nsignal * weight
+            hess[..., 1:, 1:] = -self.inv_cov - weight[..., np.newaxis] * eye
+            step = -np.linalg.solve(hess, grad[..., np.newaxis])[..., 0]
+            lam_step = step[..., :1] * nsignal + step[..., 1:]
+            alpha = _max_step(lam, lam_step)
+            mu = mu + alpha * step[..., 0]
+            theta = theta + alpha[..., np.newaxis] * step[..., 1:]
+            if np.max(np.abs(step)) < self.tol:
+                break
+        expected = mu[..., np.newaxis] * nsignal + self.nb
+        return mu, self._loglikelihood(nobs, expected, theta)
+
+    def _qtilde(self, nobs: np.ndarray, nsignal: np.ndarray, mu: np.ndarray, fit) -> np.ndarray:
+        """q~mu test statistic for the tested signal strength"""
+        muhat, llhd_hat, llhd_zero = fit
+        llhd_mu = self._profile(nobs, mu[..., np.newaxis] * nsignal + self.nb)
+        llhd_ref = np.where(muhat < 0.0, llhd_zero, llhd_hat)
+        return np.where(muhat > mu, 0.0, np.clip(-2.0 * (llhd_mu - llhd_ref), 0.0, None))
+
+    def _prepare(self, nsignal: ArrayLike):
+        nsignal = np.asarray(nsignal, dtype=np.float64)
+        if nsignal.shape[-1] != self.nregions:
+            raise ValueError(
+                f"Signal yields should have {self.nregions} regions, got {nsignal.shape[-1]}"
+            )
+        nobs = np.broadcast_to(self.nobs, nsignal.shape)
+        asimov = np.broadcast_to(self.nb, nsignal.shape)
+        muhat, llhd_hat = self._fit(nobs, nsignal)
+        llhd_zero = self._profile(nobs, np.broadcast_to(self.nb, nsignal.shape))
+        # Asimov data set is generated with the background only hypothesis
+        llhd_asimov = self._loglikelihood(asimov, asimov, np.zeros(nsignal.shape))
+        zero = np.zeros(nsignal.shape[:-1])
+        return (
+            nsignal,
+            nobs,
+            asimov,
+            (muhat, llhd_hat, llhd_zero),
+            (zero, llhd_asimov, llhd_asimov),
+        )
+
+    def _cls(self, prepared, mu: np.ndarray, expected: bool) -> np.ndarray:
+        special = _scipy_special()
+        nsignal, nobs, asimov, fit, fit_asimov = prepared
+        sqrt_qA = np.sqrt(self._qtilde(asimov, nsignal, mu, fit_asimov))
+        if expected:
+            sqrt_q = sqrt_qA
+        else:
+            sqrt_q = np.sqrt(self._qtilde(nobs, nsignal, mu, fit))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            teststat = np.where(
+                sqrt_q <= sqrt_qA, sqrt_q - sqrt_qA, (sqrt_q**2 - sqrt_qA**2) / (2.0 * sqrt_qA)
+            )
+            cls = special.ndtr(-(teststat + sqrt_qA)) / special.ndtr(-teststat)
+        return np.where(sqrt_qA > 0.0, np.clip(cls, 0.0, 1.0), 1.0)
+
+    def CLs(self, nsignal: ArrayLike, mu: ArrayLike = 1.0, expected: bool = False) -> np.ndarray:
+        """
+        CLs values for an array of signal yield vectors
+
+        Parameters
+        ----------
+        nsignal: ArrayLike
+            expected number of signal events with shape ``(..., nregions)``
+        mu: ArrayLike
+            signal strength, broadcast against the leading dimensions of ``nsignal``.
+        expected: bool
+            compute expected CLs (median under background only hypothesis)
+
+        Returns
+        -------
+        np.ndarray:
+            CLs values with the leading dimensions of ``nsignal``
+        """
+        prepared = self._prepare(nsignal)
+        mu = np.broadcast_to(np.asarray(mu, dtype=np.float64), prepared[0].shape[:-1])
+        return self._cls(prepared, mu, expected)
+
+    def exclusion_cl(
+        self, nsignal: ArrayLike, mu: ArrayLike = 1.0, expected: bool = False
+    ) -> np.ndarray:
+        """Exclusion confidence level, ``1 - CLs``. See ``CLs`` for details."""
+        return 1.0 - self.CLs(nsignal, mu, expected)
+
+    def upper_limit(
+        self,
+        nsignal: ArrayLike,
+        expected: bool = False,
+        confidence_level: float = 0.95,
+        rtol: float = 1e-5,
+    ) -> np.ndarray:
+        """
+        Upper limit on the signal strength for an array of signal yield vectors
+
+        Parameters
+        ----------
+        nsignal: ArrayLike
+            expected number of signal events with shape ``(..., nregions)``
+        expected: bool
+            compute expected upper limit
+        confidence_level: float
+            confidence level of the limit
+        rtol: float
+            relative tolerance of the limit
+
+        Returns
+        -------
+        np.ndarray:
+            upper limit on the signal strength, inf if the signal is zero in all regions.
+        """
+        prepared = self._prepare(nsignal)
+        shape = prepared[0].shape[:-1]
+        empty = np.all(prepared[0] <= 0.0, axis=-1)
+        target = 1.0 - confidence_level
+
+        low, high = np.zeros(shape), np.ones(shape)
+        for _ in range(200):
+            above = (self._cls(prepared, high, expected) > target) & ~empty
+            if not np.any(above):
+                break
+            low = np.where(above, high, low)
+            high = np.where(above, 2.0 * high, high)
+
+        while np.any((high - low > rtol * high) & ~empty):
+            mid = (low + high) / 2.0
+            above = self._cls(prepared, mid, expected) > target
+            low, high = np.where(above, mid, low), np.where(above, high, mid)
+
+        return np.where(empty, np.inf, (low + high) / 2.0)
+
+
+def compute_combined_regiondata(
+    regiondata: Dict,
+    regions: Sequence[Text],
+    covariance: ArrayLike,
+    xsection: float,
+    lumi: float,
+    name: Text = "combined",
+    observed: bool = True,
+) -> Dict:
+    """
+    Compute the exclusion of a set of correlated regions, following the conventions of the
+    MadAnalysis 5 recasting module. Results are stored in ``regiondata["cov_subset"][name]``
+    with ``s95exp``, ``s95obs`` (cross section upper limits in pb, -1 if there is no
+    signal) and ``CLs`` (``1 - CLs``) entries.
+
+    Parameters
+    ----------
+    regiondata: Dict
+        region data including ``nobs``, ``nb``, ``Nf`` and ``N0`` for each region
+    regions: Sequence[Text]
+        regions to be combined, in the order of the covariance matrix
+    covariance: ArrayLike
+        background covariance matrix
+    xsection: float
+        cross section in pb
+    lumi: float
+        luminosity in 1/fb
+    name: Text
+        name of the combination
+    observed: bool
+        compute observed upper limit
+
+    Returns
+    -------
+    Dict:
+        updated region data
+    """
+    data = {
+        key: np.array([float(regiondata[reg][key]) for reg in regions], dtype=np.float64)
+        for key in ["nobs", "nb", "Nf", "N0"]
+    }
+    with np.errstate(divide="ignore", invalid="ignore"):
+        eff = np.where(data["N0"] > 0.0, data["Nf"] / data["N0"], 0.0)
+    # signal yield per pb
+    nsignal = eff * lumi * 1000.0
+
+    model = SimplifiedLikelihood(data["nobs"], data["nb"], covariance)
+    result = {}
+    tags = ["exp", "obs"] if observed else ["exp"]
+    if np.any(nsignal > 0.0):
+        for tag in tags:
+            result["s95" + tag] = float(model.upper_limit(nsignal, expected=tag == "exp"))
+        result["CLs"] = float(model.exclusion_cl(nsignal * xsection))
+    else:
+        result.update({"s95" + tag: -1.0 for tag in tags})
+        result["CLs"] = 0.0
+
+    regiondata.setdefault("cov_subset", {})[name] = result
+    return regiondata
@@ -0,0 +1,427 @@
+"""
+Merge the outputs of MadAnalysis 5 jobs which have been executed on parts of the same sample.
+
+Counters, histograms and sample information are summed as MadAnalysis 5 does when it runs
+over several event files: event weights of each file are normalised to its cross section,
+hence sums of weights are additive. Cross sections are averaged with the number of events
+as weight, see ``SAF.get_detailedXsec``.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Text, Sequence, Optional, Callable, Dict, Tuple, List
+
+import numpy as np
+
+from ma5_expert.system.exceptions import InvalidInput
+
+# Counter rows: nentries, sum of weights, sum of weights^2. Columns: positive, negative
+CUTFLOW_ROWS = 3
+
+_HISTO_STATISTICS = [
+    "nevents",
+    "sum of event-weights over events",
+    "nentries",
+    "sum of event-weights over entries",
+    "sum weights^2",
+    "sum value*weight",
+    "sum value^2*weight",
+]
+_COUNTER_ROWS = ["nentries", "sum of weights", "sum of weights^2"]
+
+
+def _values(line: Text, ncolumns: int = 2) -> List[float]:
+    return [float(x) for x in line.split("#")[0].split()[:ncolumns]]
+
+
+def _chunks(paths: Sequence[Text], nchunks: int) -> List[Sequence[Text]]:
+    """Contiguous chunks so that the partial results are combined in the input order"""
+    nchunks = max(min(nchunks, len(paths)), 1)
+    bounds = np.linspace(0, len(paths), nchunks + 1).astype(int)
+    return [paths[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def _map_reduce(
+    reader: Callable[[Sequence[Text]], object],
+    reduce: Callable[[object, object], object],
+    paths: Sequence[Text],
+    n_workers: int,
+):
+    """Read chunks of files in parallel and combine the partial sums as they arrive"""
+    paths = list(paths)
+    if len(paths) == 0:
+        raise InvalidInput("No input to be merged.")
+    if n_workers <= 1:
+        return reader(paths)
+    result = None
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        for partial in executor.map(reader, _chunks(paths, 4 * n_workers)):
+            result = partial if result is None else reduce(result, partial)
+    return result
+
+
+################
+#   Cutflows   #
+################
+
+
+def read_cutflow(path: Text) -> Tuple[List[Text], np.ndarray]:
+    """
+    Read a cutflow file
+
+    Returns
+    -------
+    counter name lines and counters with shape ``(ncounters, 3, 2)``
+    """
+    names, counters = [], []
+    with open(path, "r") as f:
+        lines = [line.rstrip("\n") for line in f]
+    for idx, line in enumerate(lines):
+        if line.startswith("<InitialCounter>") or line.startswith("<Counter>"):
+            names.append(lines[idx + 1])
+            counters.append([_values(lines[idx + 2 + row]) for row in range(CUTFLOW_ROWS)])
+    return names, np.array(counters, dtype=np.float64).reshape(-1, CUTFLOW_ROWS, 2)
+
+
+def _add_cutflows(first, second, path: Text = ""):
+    names, counters = first
+    other_names, other_counters = second
+    if [x.split("#")[0].strip() for x in names] != [x.split("#")[0].strip() for x in other_names]:
+        raise InvalidInput(f"Cutflows can not be merged, cuts do not match. {path}")
+    return names, counters + other_counters
+
+
+def _read_cutflows(paths: Sequence[Text]):
+    result = None
+    for path in paths:
+        cutflow = read_cutflow(path)
+        result = cutflow if result is None else _add_cutflows(result, cutflow, path)
+    return result
+
+
+def write_cutflow(path: Text, names: Sequence[Text], counters: np.ndarray) -> None:
+    """Write a cutflow file in MadAnalysis 5 format"""
+    txt = "<SAFheader>\n</SAFheader>\n\n"
+    for idx, (name, counter) in enumerate(zip(names, counters)):
+        tag = "InitialCounter" if idx == 0 else "Counter"
+        txt += f"<{tag}>\n{name}\n"
+        for row, label in enumerate(_COUNTER_ROWS):
+            if row == 0:
+                txt += f"{int(counter[row, 0]):<16d}{int(counter[row, 1]):<16d}# {label}\n"
+            else:
+                txt += f"{counter[row, 0]:<16.6e}{counter[row, 1]:<16.6e}# {label}\n"
+        txt += f"</{tag}>\n\n"
+    txt += "<SAFfooter>\n</SAFfooter>\n"
+    with open(path, "w") as f:
+        f.write(txt)
+
+
+def merge_cutflows(
+    paths: Sequence[Text], output: Optional[Text] = None, n_workers: int = 1
+) -> Tuple[List[Text], np.ndarray]:
+    """
+    Merge the cutflow files of a signal region
+
+    Parameters
+    ----------
+    paths: Sequence[Text]
+        cutflow files of the same signal region
+    output: Optional[Text]
+        if given, the merged cutflow is written to this file.
+    n_workers: int
+        number of processes to read the files
+
+    Returns
+    -------
+    counter name lines and counters with shape ``(ncounters, 3, 2)``
+    """
+    names, counters = _map_reduce(_read_cutflows, _add_cutflows, paths, n_workers)
+    if output is not None:
+        write_cutflow(output, names, counters)
+    return names, counters
+
+
+################
+#  Histograms  #
+################
+
+
+def read_histos(path: Text) -> List[Dict]:
+    """
+    Read a histogram file
+
+    Returns
+    -------
+    list of histograms with ``description`` lines, ``statistics`` with shape ``(7, 2)`` and
+    ``data`` with shape ``(nbins + 2, 2)`` including underflow and overflow bins.
+    """
+    histos, current, block = [], None, None
+    with open(path, "r") as f:
+        for line in f:
+            tag = line.strip()
+            if tag == "<Histo>":
+                current = {"description": [], "statistics": [], "data": []}
+            elif tag == "</Histo>":
+                current["statistics"] = np.array(current["statistics"], dtype=np.float64)
+                current["data"] = np.array(current["data"], dtype=np.float64)
+                histos.append(current)
+                current = None
+            elif current is not None:
+                if tag in ["<Description>", "<Statistics>", "<Data>"]:
+                    block = tag[1:-1].lower()
+                elif tag in ["</Description>", "</Statistics>", "</Data>"]:
+                    block = None
+                elif block == "description":
+                    current["description"].append(line.rstrip("\n"))
+                elif block is not None and tag != "":
+                    current[block].append(_values(line))
+    return histos
+
+
+def _histo_id(histo: Dict) -> Tuple[Text, ...]:
+    return tuple(
+        x.split("#")[0].strip() for x in histo["description"] if not x.strip().startswith("#")
+    )
+
+
+def _add_histos(first: List[Dict], second: List[Dict], path: Text = "") -> List[Dict]:
+    if [_histo_id(x) for x in first] != [_histo_id(x) for x in second]:
+        raise InvalidInput(f"Histograms can not be merged, definitions do not match. {path}")
+    for histo, other in zip(first, second):
+        histo["statistics"] = histo["statistics"] + other["statistics"]
+        histo["data"] = histo["data"] + other["data"]
+    return first
+
+
+def _read_histo_files(paths: Sequence[Text]):
+    result = None
+    for path in paths:
+        histos = read_histos(path)
+        result = histos if result is None else _add_histos(result, histos, path)
+    return result
+
+
+def write_histos(path: Text, histos: Sequence[Dict]) -> None:
+    """Write a histogram file in MadAnalysis 5 format"""
+    txt = "<SAFheader>\n</SAFheader>\n\n"
+    for histo in histos:
+        txt += "<Histo>\n  <Description>\n" + "\n".join(histo["description"]) + "\n"
+        txt += "  </Description>\n  <Statistics>\n"
+        for row, label in enumerate(_HISTO_STATISTICS):
+            pos, neg = histo["statistics"][row]
+            if label in ["nevents", "nentries"]:
+                txt += f"      {int(pos):<15d}{int(neg):<16d}# {label}\n"
+            else:
+                txt += f"      {pos:<15.6e}{neg:<16.6e}# {label}\n"
+        txt += "  </Statistics>\n  <Data>\n"
+        nbins = len(histo["data"]) - 2
+        for idx, (pos, neg) in enumerate(histo["data"]):
+            label = {0: "underflow", nbins + 1: "overflow"}.get(idx, f"bin {idx} / {nbins}")
+            txt += f"      {pos:<15.6e}{neg:<16.6e}# {label}\n"
+        txt += "  </Data>\n</Histo>\n\n"
+    txt += "<SAFfooter>\n</SAFfooter>\n"
+    with open(path, "w") as f:
+        f.write(txt)
+
+
+def merge_histos(
+    paths: Sequence[Text], output: Optional[Text] = None, n_workers: int = 1
+) -> List[Dict]:
+    """
+    Merge histogram files of an analysis. Bins, underflow, overflow and statistics are
+    summed.
+
+    Parameters
+    ----------
+    paths: Sequence[Text]
+        histogram files with the same histogram definitions
+    output: Optional[Text]
+        if given, the merged histograms are written to this file.
+    n_workers: int
+        number of processes to read the files
+
+    Returns
+    -------
+    merged histograms, see ``read_histos``
+    """
+    histos = _map_reduce(_read_histo_files, _add_histos, paths, n_workers)
+    if output is not None:
+        write_histos(output, histos)
+    return histos
+
+
+######################
+# Sample information #
+######################
+
+
+def read_sample_info(path: Text) -> Dict:
+    """
+    Read a sample information file
+
+    Returns
+    -------
+    dictionary with ``global`` row ``[xsec, xsec_error, nevents, sumw+, sumw-]``,
+    ``files`` lines and ``detailed`` rows with shape ``(nfiles, 5)``
+    """
+    info, section = {"global": np.zeros(5), "files": [], "detailed": []}, None
+    with open(path, "r") as f:
+        for line in f:
+            tag = line.strip()
+            if tag in ["<SampleGlobalInfo>", "<FileInfo>", "<SampleDetailedInfo>"]:
+                section = tag[1:-1]
+            elif tag.startswith("</"):
+                section = None
+            elif section is None or tag == "" or tag.startswith("#"):
+                continue
+            elif section == "SampleGlobalInfo":
+                info["global"] = np.array(_values(line, 5), dtype=np.float64)
+            elif section == "FileInfo":
+                info["files"].append(tag.split("#")[0].strip())
+            else:
+                info["detailed"].append(_values(line, 5))
+    info["detailed"] = np.array(info["detailed"], dtype=np.float64).reshape(-1, 5)
+    return info
+
+
+def _add_sample_info(first: Dict, second: Dict) -> Dict:
+    glob = np.zeros(5)
+    nevents = first["global"][2] + second["global"][2]
+    if nevents > 0.0:
+        for col in [0, 1]:
+            # event weighted average, errors are combined in quadrature
+            values = np.array([first["global"][col], second["global"][col]])
+            weights = np.array([first["global"][2], second["global"][2]])
+            if col == 0:
+                glob[col] = np.dot(values, weights) / nevents
+            else:
+                glob[col] = np.sqrt(np.dot(values**2, weights**2)) / nevents
+    glob[2:] = first["global"][2:] + second["global"][2:]
+    return {
+        "global": glob,
+        "files": first["files"] + second["files"],
+        "detailed": np.vstack([first["detailed"], second["detailed"]]),
+    }
+
+
+def _read_sample_infos(paths: Sequence[Text]):
+    result = None
+    for path in paths:
+        info = read_sample_info(path)
+        result = info if result is None else _add_sample_info(result, info)
+    return result
+
+
+def write_sample_info(path: Text, info: Dict) -> None:
+    """Write a sample information file in MadAnalysis 5 format"""
+    header = "# xsection     xsection_error nevents        sum_weight+    sum_weight-    \n"
+
+    def row(values: np.ndarray) -> Text:
+        return (
+            f"{values[0]:<15.6e}{values[1]:<15.6e}{int(values[2]):<15d}"
+            f"{values[3]:<15.6e}{values[4]:<15.6e}"
+        )
+
+    nfiles = len(info["files"])
+    txt = "<SAFheader>\n</SAFheader>\n\n<SampleGlobalInfo>\n" + header
+    txt += row(info["global"]) + "\n</SampleGlobalInfo>\n\n<FileInfo>\n"
+    for idx, name in enumerate(info["files"]):
+        txt += f"{name} # file {idx + 1} / {nfiles}\n"
+    txt += "</FileInfo>\n\n<SampleDetailedInfo>\n" + header
+    for idx, values in enumerate(info["detailed"]):
+        txt += row(values) + f" # file {idx + 1} / {len(info['detailed'])}\n"
+    txt += "</SampleDetailedInfo>\n\n<SAFfooter>\n</SAFfooter>\n"
+    with open(path, "w") as f:
+        f.write(txt)
+
+
+def merge_sample_info(
+    paths: Sequence[Text], output: Optional[Text] = None, n_workers: int = 1
+) -> Dict:
+    """
+    Merge sample information files. Number of events and sums of weights are summed, the
+    cross section is averaged with the number of events as weight.
+
+    Parameters
+    ----------
+    paths: Sequence[Text]
+        sample information files
+    output: Optional[Text]
+        if given, the merged information is written to this file.
+    n_workers: int
+        number of processes to read the files
+
+    Returns
+    -------
+    merged sample information, see ``read_sample_info``
+    """
+    info = _map_reduce(_read_sample_infos, _add_sample_info, paths, n_workers)
+    if output is not None:
+        write_sample_info(output, info)
+    return info
+
+
+#################
+# Sample output #
+#################
+
+
+def merge_outputs(
+    sample_paths: Sequence[Text],
+    output_path: Text,
+    dataset_name: Text = "defaultset",
+    n_workers: int = 1,
+) -> Text:
+    """
+    Merge the outputs of MadAnalysis 5 jobs executed on parts of a sample. The merged
+    output has the same layout as the inputs and can be loaded with
+    ``ma5_expert.sample.SampleCollection(output_path, dataset_name)``.
+
+    Parameters
+    ----------
+    sample_paths: Sequence[Text]
+        paths of the job outputs
+    output_path: Text
+        path of the merged sample
+    dataset_name: Text
+        name of the dataset
+    n_workers: int
+        number of processes to read the files
+
+    Returns
+    -------
+    Text:
+        path of the merged sample
+    """
+    datasets = [os.path.join(path, "Output", "SAF", dataset_name) for path in sample_paths]
+    for dataset in datasets:
+        if not os.path.isdir(dataset):
+            raise InvalidInput(f"Can not find dataset {dataset}")
+    output = os.path.join(output_path, "Output", "SAF", dataset_name)
+    os.makedirs(output, exist_ok=True)
+
+    info_files = [os.path.join(x, dataset_name + ".saf") for x in datasets]
+    if all(os.path.isfile(x) for x in info_files):
+        merge_sample_info(info_files, os.path.join(output, dataset_name + ".saf"), n_workers)
+
+    analyses = sorted(
+        x.name for x in os.scandir(datasets[0]) if x.is_dir() and not x.name.startswith(".")
+    )
+    for analysis in analyses:
+        for subdir in ["Cutflows", "Histograms"]:
+            source = os.path.join(datasets[0], analysis, subdir)
+            if not os.path.isdir(source):
+                continue
+            os.makedirs(os.path.join(output, analysis, subdir), exist_ok=True)
+            for name in sorted(x for x in os.listdir(source) if x.endswith(".saf")):
+                paths = [os.path.join(x, analysis, subdir, name) for x in datasets]
+                missing = [x for x in paths if not os.path.isfile(x)]
+                if len(missing) > 0:
+                    raise InvalidInput(f"Can not find {', '.join(missing)}")
+                target = os.path.join(output, analysis, subdir, name)
+                if subdir == "Cutflows":
+                    merge_cutflows(paths, target, n_workers)
+                else:
+                    merge_histos(paths, target, n_workers)
+
+    return output_path
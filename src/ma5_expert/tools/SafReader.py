@@ -6,7 +6,201 @@ Created on Thu Jan 30 11:24:20 2020
 @author: jackaraz
 """
 
-import os, copy, json
+import os, json, threading, copy
+import numpy as np
+from collections import OrderedDict
+
+SECTIONS = ("SampleGlobalInfo", "FileInfo", "SampleDetailedInfo")
+
+
+def _empty_detailed_info():
+    return {
+        "xsec": np.zeros(0, dtype=np.float64),
+        "Nevents": np.zeros(0, dtype=np.int64),
+        "sumw": np.zeros(0, dtype=np.float64),
+    }
+
+
+def _parse_rows(rows):
+    """
+    Convert sample information rows into arrays in one go. Each row is expected to have
+    ``xsection xsection_error nevents sum_weight+ sum_weight-`` columns, comments should
+    already be removed.
+    """
+    if len(rows) == 0:
+        return _empty_detailed_info()
+    table = np.array(" ".join(rows).split(), dtype=np.float64).reshape(len(rows), -1)
+    return {
+        "xsec": table[:, 0],
+        "Nevents": table[:, 2].astype(np.int64),
+        "sumw": table[:, 3] - table[:, 4],
+    }
+
+
+def parse_sample_info(saf_file, sections=SECTIONS):
+    """
+    Parse sample information file.
+
+    The file is streamed line by line and the reader stops as soon as all the requested
+    sections have been read, e.g. ``sections=["SampleGlobalInfo"]`` only reads the
+    header of the file. Detailed information rows are converted to arrays in bulk.
+
+    Parameters
+    ----------
+    saf_file : STR
+        Sample information file.
+    sections : LIST
+        Sections to be parsed. The default is all sections.
+
+    Returns
+    -------
+    dict
+    """
+    sections = [x for x in SECTIONS if x in sections]
+
+    parsed = {}
+    if "SampleGlobalInfo" in sections:
+        parsed["SampleGlobalInfo"] = {"xsec": -1, "Nevents": -1, "sumw": -1}
+    if "FileInfo" in sections:
+        parsed["FileInfo"] = []
+    if "SampleDetailedInfo" in sections:
+        parsed["SampleDetailedInfo"] = _empty_detailed_info()
+
+    remaining = set(sections)
+    current, rows = None, []
+    with open(saf_file, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("<"):
+                if current is None and line[1:-1] in remaining:
+                    current, rows = line[1:-1], []
+                elif current is not None and line == f"</{current}>":
+                    if current == "SampleGlobalInfo":
+                        glob = _parse_rows(rows[:1])
+                        if len(glob["xsec"]) > 0:
+                            parsed[current] = {
+                                "xsec": float(glob["xsec"][0]),
+                                "Nevents": int(glob["Nevents"][0]),
+                                "sumw": float(glob["sumw"][0]),
+                            }
+                    elif current == "FileInfo":
+                        parsed[current] = [x.split('"')[1] for x in rows if '"' in x]
+                    else:
+                        parsed[current] = _parse_rows(rows)
+                    remaining.discard(current)
+                    current = None
+                    if len(remaining) == 0:
+                        break
+            elif current is not None and line != "" and not line.startswith("#"):
+                if current == "FileInfo":
+                    rows.append(line)
+                else:
+                    rows.append(line.split("#")[0])
+
+    return parsed
+
+
+class SampleInfoRegistry:
+    """
+    Process-wide registry of parsed sample information files.
+
+    Entries are keyed by the resolved path of the file and validated against its
+    modification time and size, hence a file is parsed only once as long as it does not
+    change on disk. The registry keeps at most ``maxsize`` files, the least recently used
+    entry is dropped first. Cached dictionaries are shared between all the users, hence
+    they should never be modified in place.
+    """
+
+    maxsize = 128
+    hits = 0
+    misses = 0
+    _cache = OrderedDict()
+    _lock = threading.RLock()
+
+    @staticmethod
+    def get(saf_file, sections=SECTIONS):
+        """
+        Get parsed sample information. Only the requested sections are returned, each
+        caller gets its own copy of them.
+
+        Parameters
+        ----------
+        saf_file : STR
+            Sample information file.
+        sections : LIST
+            Sections that needs to be available. The default is all sections.
+
+        Returns
+        -------
+        dict
+        """
+        path = os.path.realpath(saf_file)
+        stat = os.stat(path)
+        sections = requested = set(x for x in SECTIONS if x in sections)
+        with SampleInfoRegistry._lock:
+            entry = SampleInfoRegistry._cache.get(path, None)
+            if entry is not None and entry[0] == (stat.st_mtime_ns, stat.st_size):
+                if sections.issubset(entry[1]):
+                    SampleInfoRegistry._cache.move_to_end(path)
+                    SampleInfoRegistry.hits += 1
+                    return SampleInfoRegistry._view(entry[2], requested)
+                sections = sections.union(entry[1])
+            SampleInfoRegistry.misses += 1
+
+        parsed = parse_sample_info(path, sections)
+        for item in parsed.get("SampleDetailedInfo", {}).values():
+            item.flags.writeable = False
+
+        with SampleInfoRegistry._lock:
+            SampleInfoRegistry._cache[path] = (
+                (stat.st_mtime_ns, stat.st_size),
+                frozenset(sections),
+                parsed,
+            )
+            SampleInfoRegistry._cache.move_to_end(path)
+            while len(SampleInfoRegistry._cache) > max(SampleInfoRegistry.maxsize, 0):
+                SampleInfoRegistry._cache.popitem(last=False)
+        return SampleInfoRegistry._view(parsed, requested)
+
+    @staticmethod
+    def _view(parsed, sections):
+        """
+        Requested sections of a cached entry. Sections are shallow copies, hence they can
+        be modified without affecting the registry, detailed information arrays are shared
+        and read-only.
+        """
+        return {key: copy.copy(item) for key, item in parsed.items() if key in sections}
+
+    @staticmethod
+    def invalidate(saf_file=None):
+        """
+        Remove a file from the registry. If no file is given the registry is cleared.
+        """
+        with SampleInfoRegistry._lock:
+            if saf_file is None:
+                SampleInfoRegistry._cache.clear()
+                SampleInfoRegistry.hits, SampleInfoRegistry.misses = 0, 0
+            else:
+                SampleInfoRegistry._cache.pop(os.path.realpath(saf_file), None)
+
+    @staticmethod
+    def set_maxsize(maxsize):
+        """Set maximum number of files to be kept in the registry"""
+        with SampleInfoRegistry._lock:
+            SampleInfoRegistry.maxsize = int(maxsize)
+            while len(SampleInfoRegistry._cache) > max(SampleInfoRegistry.maxsize, 0):
+                SampleInfoRegistry._cache.popitem(last=False)
+
+    @staticmethod
+    def info():
+        """Registry statistics"""
+        with SampleInfoRegistry._lock:
+            return {
+                "hits": SampleInfoRegistry.hits,
+                "misses": SampleInfoRegistry.misses,
+                "size": len(SampleInfoRegistry._cache),
+                "maxsize": SampleInfoRegistry.maxsize,
+            }
 
 
 class SAF:
@@ -19,13 +213,19 @@ class SAF:
             else:
                 raise ValueError("Can not find the SAF file!")
         if kwargs.get("load", False) == False and self.saf_file != False:
-            self.saf = self.saf_parse()
+            if kwargs.get("cache", True):
+                # parsed information is shared through the registry, do not modify in place
+                self.saf = SampleInfoRegistry.get(self.saf_file, kwargs.get("sections", SECTIONS))
+            else:
+                self.saf = self.saf_parse(sections=kwargs.get("sections", SECTIONS))
         elif kwargs.get("load", False) != False:
             self.saf = self.load(kwargs.get("load", False))
         self.saf = self.set_xsec(kwargs.get("xsection", -1))
 
     def __getattr__(self, name):
-        if name in self.saf["SampleGlobalInfo"].keys() + ["xsection"]:
+        if name.startswith("__") or name == "saf":
+            raise AttributeError(name)
+        if name in list(self.saf.get("SampleGlobalInfo", {}).keys()) + ["xsection"]:
             if name == "xsection":
                 name = "xsec"
             return self.saf["SampleGlobalInfo"][name]
@@ -40,6 +240,17 @@ class SAF:
                 saf = json.load(json_file)
         else:
             return {}
+        detailed = saf.get("SampleDetailedInfo", {})
+        if len(detailed) > 0 and all(isinstance(x, dict) for x in detailed.values()):
+            # older outputs are stored per file: {"0" : {"xsec": ..., ...}, ...}
+            detailed = {
+                key: [detailed[nfile][key] for nfile in sorted(detailed, key=int)]
+                for key in ["xsec", "Nevents", "sumw"]
+            }
+        info = _empty_detailed_info()
+        for key in info.keys():
+            info[key] = np.array(detailed.get(key, []), dtype=info[key].dtype)
+        saf["SampleDetailedInfo"] = info
         return saf
 
     def save(self, **kwargs):
@@ -47,74 +258,50 @@ class SAF:
             output = kwargs.get("output", False)
             if output == False:
                 output = self.saf_file.split(".saf")[0] + ".json"
-            out = open(output, "w")
-            out.write(json.dumps(self.saf, indent=4))
-            out.close()
-        except:
+            saf = dict(self.saf)
+            if "SampleDetailedInfo" in saf:
+                saf["SampleDetailedInfo"] = {
+                    key: item.tolist() for key, item in saf["SampleDetailedInfo"].items()
+                }
+            with open(output, "w") as out:
+                out.write(json.dumps(saf, indent=4))
+        except Exception:
             return False
         return True
 
     def saf_parse(self, **kwargs):
+        """
+        Parse sample information file. See ``parse_sample_info`` for details.
+
+        Parameters
+        ----------
+        **kwargs :
+            saf_file : STR
+                Sample information file. The default is the file of this object.
+            sections : LIST
+                Sections to be parsed. The default is all sections.
+
+        Returns
+        -------
+        dict
+        """
         saf_file = kwargs.get("saf_file", False)
         if saf_file == False:
             saf_file = self.saf_file
-        with open(saf_file) as f:
-            saf = f.readlines()
-        parsed = {
-            "SampleGlobalInfo": {"xsec": -1, "Nevents": -1, "sumw": -1},
-            "FileInfo": [],
-            "SampleDetailedInfo": {},
-        }
-        SampleGlobalInfo = [0, 0]
-        FileInfo = [0, 0]
-        SampleDetailedInfo = [0, 0]
-        for n, (line) in enumerate(saf):
-            if "<SampleGlobalInfo>" in line:
-                SampleGlobalInfo[0] = n
-            elif "</SampleGlobalInfo>" in line:
-                SampleGlobalInfo[1] = n
-            elif "<FileInfo>" in line:
-                FileInfo[0] = n
-            elif "</FileInfo>" in line:
-                FileInfo[1] = n
-            elif "<SampleDetailedInfo>" in line:
-                SampleDetailedInfo[0] = n
-            elif "</SampleDetailedInfo>" in line:
-                SampleDetailedInfo[1] = n
-        parsed["SampleGlobalInfo"] = saf[SampleGlobalInfo[0] + 2 : SampleGlobalInfo[1]]
-        parsed["FileInfo"] = saf[FileInfo[0] + 1 : FileInfo[1]]
-        SampleDetailedInfo = saf[SampleDetailedInfo[0] + 2 : SampleDetailedInfo[1]]
-
-        parsed["SampleGlobalInfo"] = {
-            "xsec": float(parsed["SampleGlobalInfo"][0].split()[0]),
-            "Nevents": int(parsed["SampleGlobalInfo"][0].split()[2]),
-            "sumw": float(parsed["SampleGlobalInfo"][0].split()[3])
-            - float(parsed["SampleGlobalInfo"][0].split()[4]),
-        }
-        parsed["FileInfo"] = [x.split(" ")[0][1:-1] for x in parsed["FileInfo"]]
-
-        for n, (line) in enumerate(SampleDetailedInfo):
-            parsed["SampleDetailedInfo"][int(n)] = {
-                "xsec": float(line.split()[0]),
-                "Nevents": int(line.split()[2]),
-                "sumw": float(line.split()[3]) - float(line.split()[4]),
-            }
-        return parsed
+        return parse_sample_info(saf_file, kwargs.get("sections", SECTIONS))
 
     def set_xsec(self, xsection):
-        saf = copy.deepcopy(self.saf)
-        if xsection > 0.0 and saf != {}:
+        saf = dict(self.saf)
+        if xsection > 0.0 and "SampleGlobalInfo" in saf:
+            saf["SampleGlobalInfo"] = dict(saf["SampleGlobalInfo"])
             saf["SampleGlobalInfo"]["xsec"] = float(xsection)
         return saf
 
     def get_detailedXsec(self):
-        xsec = 0.0
-        nevt = 0.0
-        for nfile, info in self.saf["SampleDetailedInfo"].items():
-            xsec += info["xsec"] * info["Nevents"]
-            nevt += info["Nevents"]
+        info = self.saf.get("SampleDetailedInfo", _empty_detailed_info())
+        nevt = np.sum(info["Nevents"], dtype=np.float64)
         if nevt > 0.0:
-            return round(xsec / nevt, 8)
+            return round(float(np.dot(info["xsec"], info["Nevents"]) / nevt), 8)
         else:
             return 0.0
 
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import pytest
+
+import ma5_expert as ma5
+
+sample_path = "docs/examples/mass1000005_300.0_mass1000022_60.0_mass1000023_250.0_xs_5.689"
+analysis_path = sample_path + "/Output/SAF/defaultset/atlas_susy_2018_31"
+
+
+def test_async_loading():
+    async def main():
+        async with ma5.aio.AsyncRunner(max_concurrency=2) as runner:
+            tasks = {
+                "cutflows": runner.load_cutflows(analysis_path + "/Cutflows", xsection=5.689),
+                "histograms": runner.load_histograms(analysis_path + "/Histograms/histos.saf"),
+                "sample": runner.load_sample(sample_path, lumi=139.0),
+            }
+            return {label: result async for label, result in runner.as_completed(tasks)}
+
+    results = asyncio.run(main())
+    assert len(results["cutflows"].SRnames) == 10
+    assert results["histograms"].size == 6
+    assert results["sample"].analysis_names == ["atlas_susy_2018_31"]
+
+
+def test_async_completion_order():
+    async def main():
+        runner = ma5.aio.AsyncRunner(max_concurrency=3)
+        tasks = [runner.run(time.sleep, delay) for delay in [0.3, 0.0, 0.1]]
+        order = [label async for label, _ in runner.as_completed(tasks)]
+
+        with pytest.raises(ValueError):
+            async for _ in runner.as_completed([runner.run(int, "x")]):
+                pass
+        failed = [res async for _, res in runner.as_completed([runner.run(int, "x")], True)]
+        runner.shutdown()
+        return order, failed
+
+    order, failed = asyncio.run(main())
+    assert order == [1, 2, 0]
+    assert isinstance(failed[0], ValueError)
+
+
+def test_async_cancellation():
+    async def main():
+        runner = ma5.aio.AsyncRunner(max_concurrency=1)
+        tasks = [asyncio.ensure_future(runner.run(time.sleep, 0.2)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        # the first call is running, the remaining ones wait for a free slot
+        for task in tasks[1:]:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        runner.shutdown()
+        return [task.cancelled() for task in tasks]
+
+    assert asyncio.run(main()) == [False, True, True]
@@ -0,0 +1,37 @@
+import os
+from types import SimpleNamespace
+
+from ma5_expert.backend import snapshot
+
+
+def test_configuration_snapshot(tmp_path):
+    ma5_path = str(tmp_path / "madanalysis5")
+    os.makedirs(os.path.join(ma5_path, "tools", "PAD"))
+    snapshot_path = snapshot.default_snapshot_path(ma5_path)
+    assert snapshot_path.endswith(".pkl")
+    snapshot_path = str(tmp_path / "cache" / "backend.pkl")
+
+    archi_info = SimpleNamespace(ma5dir=ma5_path, has_root=False)
+    session_info = SimpleNamespace(has_pad=True, has_padsfs=False)
+    fingerprint = snapshot.fingerprint(ma5_path, debug_mode=False)
+    assert snapshot.save_snapshot(
+        snapshot_path, fingerprint, archi_info, session_info, {"MA5_TEST": "1"}, ["/tmp"]
+    )
+
+    restored = snapshot.load_snapshot(
+        snapshot_path, snapshot.fingerprint(ma5_path, debug_mode=False)
+    )
+    assert restored["archi_info"] == vars(archi_info)
+    assert restored["session_info"] == vars(session_info)
+    assert restored["environ"] == {"MA5_TEST": "1"} and restored["syspath"] == ["/tmp"]
+
+    assert (
+        snapshot.load_snapshot(snapshot_path, snapshot.fingerprint(ma5_path, debug_mode=True))
+        is None
+    )
+    # installing a new tool invalidates the snapshot
+    os.makedirs(os.path.join(ma5_path, "tools", "PADForSFS"))
+    assert (
+        snapshot.load_snapshot(snapshot_path, snapshot.fingerprint(ma5_path, debug_mode=False))
+        is None
+    )
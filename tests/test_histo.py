@@ -1,5 +1,11 @@
+import os
+import sys
+import types
+
 import ma5_expert as ma5
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import pytest
 
 histo_file = (
     "docs/examples/mass1000005_300.0_mass1000022_60.0_mass1000023_250.0_xs_5.689/Output/"
@@ -200,3 +206,268 @@ def test_SRB_PTj1():
     assert (
         SRB_PTj1._sumValSqWeight == 8.721591e02
     ), f"Expected 8.721591e+02, got {SRB_PTj1._sumValSqWeight}"
+
+
+def _read_yoda(path):
+    """Minimal reader of YODA_HISTO1D_V2 blocks, independent of the yoda library"""
+    histos = {}
+    with open(path, "r") as f:
+        blocks = f.read().split("END YODA_HISTO1D_V2")[:-1]
+    for block in blocks:
+        lines = block.strip().split("\n")
+        assert lines[0].startswith("BEGIN YODA_HISTO1D_V2 ")
+        flows = {
+            line.split()[0]: np.array(line.split()[2:], dtype=float)
+            for line in lines
+            if line.split()[0] in ["Total", "Underflow", "Overflow"]
+        }
+        header = lines.index("# xlow\t xhigh\t sumw\t sumw2\t sumwx\t sumwx2\t numEntries")
+        table = np.loadtxt(lines[header + 1 :]).reshape(-1, 7)
+        histos[lines[0].split()[-1]] = dict(
+            flows,
+            edges=np.append(table[:, 0], table[-1, 1]),
+            xhigh=table[:, 1],
+            sumw=table[:, 2],
+            sumw2=table[:, 3],
+            numEntries=table[:, 6],
+        )
+    return histos
+
+
+def test_write_yoda(tmp_path):
+    collection = ma5.histogram.Collection(original_file=histo_file)
+    path = str(tmp_path / "histos.yoda")
+    collection.write_yoda(path)
+
+    histos = _read_yoda(path)
+    assert list(histos.keys()) == [f"/madanalysis5/{name}" for name in collection.histo_names]
+    for histo, (name, original) in zip(histos.values(), collection.items()):
+        fraction = original._normEwEntries
+        assert np.allclose(histo["edges"], original.bins)
+        assert np.allclose(histo["xhigh"][:-1], histo["edges"][1:-1])
+        assert np.allclose(histo["sumw"], original.weights * fraction, rtol=1e-6)
+        assert np.allclose(
+            histo["sumw2"], original.weights.astype(float) ** 2 * fraction, rtol=1e-6
+        )
+        assert np.allclose(histo["numEntries"], fraction, rtol=1e-6)
+        # bins are filled at their center as in to_yoda, flows are empty
+        assert np.all(histo["Underflow"] == 0.0) and np.all(histo["Overflow"] == 0.0)
+        table = np.column_stack([histo["sumw"], histo["sumw2"]])
+        assert np.allclose(histo["Total"][:2], table.sum(axis=0), rtol=1e-6)
+
+
+def test_to_yoda_read_back(tmp_path, monkeypatch):
+    """to_yoda writes the histograms and reads them back with ``yoda.read``"""
+    read = []
+
+    def fake_read(path, asdict=True):
+        read.append(path)
+        return list(_read_yoda(path).values())
+
+    monkeypatch.setitem(sys.modules, "yoda", types.SimpleNamespace(read=fake_read))
+    collection = ma5.histogram.Collection(original_file=histo_file)
+    histos = collection.to_yoda()
+    assert len(histos) == collection.size
+    assert np.allclose(histos[0]["edges"], collection[0].bins)
+    # the temporary file is removed
+    assert not os.path.exists(read[-1])
+
+    save = str(tmp_path / "histos.yoda")
+    assert len(collection.to_yoda(save)) == collection.size
+    assert read[-1] == save and os.path.isfile(save)
+
+
+def test_to_yoda():
+    pytest.importorskip("yoda")
+    collection = ma5.histogram.Collection(original_file=histo_file)
+    histos = collection.to_yoda()
+    assert [h.path() for h in histos] == [
+        f"/madanalysis5/{name}" for name in collection.histo_names
+    ]
+    for histo, (name, original) in zip(histos, collection.items()):
+        assert np.allclose(histo.xEdges(), original.bins)
+        assert np.isclose(histo.sumW(), np.sum(original.weights) * original._normEwEntries)
+
+
+def test_histogram_selection():
+    collection = ma5.histogram.Collection(original_file=histo_file, names=["SRA_.*", "SRC_MET"])
+    assert collection.histo_names == ["SRA_Meff", "SRA_Mh", "SRC_MET"]
+
+    collection = ma5.histogram.Collection(original_file=histo_file, regions="SR[BC]")
+    assert collection.histo_names == ["SRB_PTj1", "SRB_MhAvg", "SRC_MET", "SRC_Sig"]
+    # selected histograms are identical to the ones of a complete collection
+    full = ma5.histogram.Collection(original_file=histo_file)
+    assert collection["SRC_Sig"].weights.tolist() == full["SRC_Sig"].weights.tolist()
+    assert collection["SRC_Sig"]._overflow == full["SRC_Sig"]._overflow
+
+    collection = ma5.histogram.Collection(original_file=histo_file, names="SRA_.*", regions="SRB")
+    assert collection.size == 0
+
+    assert full.region_index == {
+        "SRA": ["SRA_Meff", "SRA_Mh"],
+        "SRB": ["SRB_PTj1", "SRB_MhAvg"],
+        "SRC": ["SRC_MET", "SRC_Sig"],
+    }
+    assert full.select(regions="SRB") == ["SRB_PTj1", "SRB_MhAvg"]
+    assert full.select(names=".*Mh.*") == ["SRA_Mh", "SRB_MhAvg"]
+    assert full.select(names=".*Mh.*", regions=["SRA", "SRC"]) == ["SRA_Mh"]
+    # names which are not valid regular expressions only match exactly
+    assert full.select(names=["SRA_Mh(", "SRC_.*"]) == ["SRC_MET", "SRC_Sig"]
+    full._histograms["SRA_Mh("] = full._histograms["SRA_Mh"]
+    assert full.select(names="SRA_Mh(") == ["SRA_Mh("]
+
+
+def test_lazy_collection():
+    full = ma5.histogram.Collection(original_file=histo_file)
+    lazy = ma5.histogram.Collection(original_file=histo_file, lazy=True)
+
+    assert lazy.histo_names == full.histo_names
+    assert lazy.region_index == full.region_index
+    assert all(item is None for item in lazy._histograms.values())
+
+    # only the accessed histogram is decoded
+    assert lazy["SRB_PTj1"] == full["SRB_PTj1"]
+    assert [name for name, item in lazy._histograms.items() if item is not None] == ["SRB_PTj1"]
+
+    lazy.set_weight_normalisation(1.0)
+    full.set_weight_normalisation(1.0)
+    for (name, histo), (_, reference) in zip(lazy.items(), full.items()):
+        assert histo == reference, f"{name} does not match"
+        assert histo.weights.tolist() == reference.weights.tolist()
+    assert str(lazy) == str(full)
+
+    lazy = ma5.histogram.Collection(original_file=histo_file, lazy=True, regions="SRC")
+    assert lazy.histo_names == ["SRC_MET", "SRC_Sig"]
+    assert lazy[1] == ma5.histogram.Collection(original_file=histo_file)["SRC_Sig"]
+
+
+def test_lazy_collection_threads(tmp_path):
+    lazy = ma5.histogram.Collection(original_file=histo_file, lazy=True)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        histograms = list(executor.map(lambda _: lazy["SRA_Meff"], range(32)))
+    assert all(histogram is histograms[0] for histogram in histograms)
+    assert lazy["SRA_Meff"] is histograms[0]
+
+    # blocks without description are skipped
+    with open(histo_file, "r") as f:
+        content = f.read()
+    start, end = content.index("<Description>"), content.index("</Description>")
+    broken = str(tmp_path / "histos.saf")
+    with open(broken, "w") as f:
+        f.write(content[:start] + content[end + len("</Description>") :])
+    lazy = ma5.histogram.Collection(original_file=broken, lazy=True)
+    assert lazy.histo_names == ["SRA_Mh", "SRB_PTj1", "SRB_MhAvg", "SRC_MET", "SRC_Sig"]
+    assert lazy["SRA_Mh"] == ma5.histogram.Collection(original_file=histo_file)["SRA_Mh"]
+
+
+def test_histogram_cube():
+    xsections, lumis = [1.0, 2.0, 4.0], [139.0, 139.0, 300.0]
+    collections = [
+        ma5.histogram.Collection(original_file=histo_file, xsection=xsec, lumi=lumi)
+        for xsec, lumi in zip(xsections, lumis)
+    ]
+    cube = ma5.histogram.HistogramCube.from_collections(
+        "SRA_Mh", collections, labels=["a", "b", "c"]
+    )
+    assert cube.shape == (3, 12)
+    assert np.allclose(cube.edges, collections[0]["SRA_Mh"].bins)
+    assert cube.overflow.tolist() == [1.139622e-04] * 3
+
+    for idx, collection in enumerate(collections):
+        _, _, weights = collection.lumi_histogram("SRA_Mh")
+        assert np.allclose(cube.lumi_weights[idx], weights, rtol=1e-6)
+
+    assert np.allclose(cube.shapes.sum(axis=1), 1.0)
+    assert np.allclose(cube.shape_distance(), 0.0)
+    assert np.all(cube.variances >= 0.0)
+
+    interpolated = cube.interpolate([100.0, 200.0, 300.0], [150.0, 300.0, 500.0])
+    assert np.allclose(interpolated[0], cube.lumi_weights[:2].mean(axis=0))
+    assert np.allclose(interpolated[1], cube.lumi_weights[2])
+    assert np.allclose(interpolated[2], cube.lumi_weights[2])
+
+    with pytest.raises(ma5.system.exceptions.InvalidInput):
+        ma5.histogram.HistogramCube.from_collections("SRA_Mh", [collections[0]], ["a", "b"])
+    with pytest.raises(ma5.system.exceptions.InvalidInput):
+        ma5.histogram.HistogramCube.from_collections("unknown", collections)
+
+
+def test_cut_optimisation():
+    collection = ma5.histogram.Collection(original_file=histo_file, xsection=1.0, lumi=139.0)
+    histogram = collection["SRA_Mh"]
+    total = histogram._underflow.sumW + sum(b.sumW for b in histogram._bins)
+    total += histogram._overflow.sumW
+    norm = histogram.weight_normalisation
+
+    assert histogram.prefix_sums[0] == 0.0
+    assert np.isclose(histogram.prefix_sums[-1], total)
+    assert np.isclose(histogram.integral(), total / norm)
+    assert np.isclose(
+        histogram.integral(histogram.bins[0], histogram.bins[-1]), histogram.weights.sum()
+    )
+    above, below = histogram.cumulative(above=True), histogram.cumulative()
+    assert np.allclose(above + below, total / norm)
+    assert np.isclose(above[-1], histogram._overflow.sumW / norm)
+    assert np.isclose(histogram.integral(histogram.bins[3]), above[3])
+
+    background = ma5.histogram.Collection(original_file=histo_file, xsection=1.0, lumi=139.0)
+    results = ma5.histogram.optimise_cuts(
+        collection, background, fom=lambda s, b, sys: s - b, names="SRA_Mh", kinds=["above"]
+    )
+    assert len(results) == 1 and results[0].fom == 0.0
+
+    results = ma5.histogram.optimise_cuts(
+        collection, background, fom="sig", names=["SRA_Mh", "SRA_Meff"], lumi=300.0
+    )
+    assert [x.fom for x in results] == sorted([x.fom for x in results], reverse=True)
+    for result in results:
+        assert result.kind in ("above", "below", "window")
+        events = collection[result.histogram].integral(result.low, result.high)
+        assert np.isclose(result.signal, events * 1000.0 * 300.0)
+        assert np.isclose(result.fom, result.signal / np.sqrt(result.background))
+
+    with pytest.raises(ma5.system.exceptions.InvalidInput):
+        ma5.histogram.optimise_cuts(collection, background, fom="unknown")
+
+
+def test_histogram_statistics():
+    collection = ma5.histogram.Collection(original_file=histo_file, xsection=1.0, lumi=139.0)
+    statistics = collection.statistics()
+    assert statistics["names"].tolist() == collection.histo_names
+
+    for idx, (name, histogram) in enumerate(collection.items()):
+        mean = histogram._sumValWeight / histogram._normEwEntries
+        assert np.isclose(collection.means[idx], mean)
+        assert np.isclose(
+            collection.variances[idx],
+            histogram._sumValSqWeight / histogram._normEwEntries - mean**2,
+        )
+        assert collection.variances[idx] >= 0.0
+        assert np.isclose(collection.effective_entries[idx], histogram._nEntries, rtol=1e-3)
+        assert np.isclose(
+            collection.overflow_fractions[idx],
+            histogram._overflow.sumW / histogram.prefix_sums[-1],
+        )
+
+    selected = collection.statistics(names="SRA_.*")
+    assert selected["names"].tolist() == ["SRA_Meff", "SRA_Mh"]
+    assert np.allclose(selected["mean"], collection.means[:2])
+    assert collection.statistics(names="unknown")["mean"].shape == (0,)
+
+
+def test_lazy_histogram_statistics():
+    full = ma5.histogram.Collection(original_file=histo_file).statistics()
+    lazy = ma5.histogram.Collection(original_file=histo_file, lazy=True)
+
+    statistics = lazy.statistics()
+    # statistics are read without decoding the histograms
+    assert all(item is None for item in lazy._histograms.values())
+    assert statistics["names"].tolist() == full["names"].tolist()
+    for key in ["mean", "variance", "effective_entries", "overflow_fraction"]:
+        assert np.array_equal(statistics[key], full[key], equal_nan=True)
+
+    # the statistics of all the histograms are computed once
+    lazy._sums.clear()
+    statistics["mean"][0] = -1.0
+    assert np.array_equal(lazy.means, full["mean"], equal_nan=True)
+    assert len(lazy._sums) == 0
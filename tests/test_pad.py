@@ -0,0 +1,495 @@
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import ma5_expert as ma5
+from ma5_expert.backend import PADType
+
+sample_path = "docs/examples/mass1000005_300.0_mass1000022_60.0_mass1000023_250.0_xs_5.689"
+cutflow_path = os.path.join(sample_path, "Output/SAF/defaultset/atlas_susy_2018_31/Cutflows")
+
+with open(os.path.join(sample_path, "Output/SAF/defaultset/CLs_output.json"), "r") as f:
+    reference = json.load(f)["atlas_susy_2018_31"]["regiondata"]
+
+
+def test_exclusion_cache(tmp_path):
+    cache = ma5.pad.ExclusionCache(str(tmp_path / "cache" / "exclusion.sqlite"))
+    interface = ma5.pad.PADInterface(sample_path, "defaultset")
+
+    key = cache.key(cutflow_path, "atlas_susy_2018_31", PADType.PADForSFS, 5.689)
+    assert key != cache.key(cutflow_path, "atlas_susy_2018_31", PADType.PADForSFS, 5.0)
+    assert key != cache.key(cutflow_path, "atlas_susy_2018_31", PADType.PAD, 5.689)
+    assert key != cache.key(
+        cutflow_path, "atlas_susy_2018_31", PADType.PADForSFS, 5.689, 300.0, "aposteriori"
+    )
+    assert cache.get(key) is None
+
+    cache.set(key, reference, "atlas_susy_2018_31")
+    # Cached results are returned without requiring the MadAnalysis 5 backend
+    regiondata = interface.compute_exclusion(
+        "atlas_susy_2018_31", 5.689, PADType.PADForSFS, cache=cache
+    )
+    assert regiondata == reference
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+
+    assert cache.evict(max_size=0) == 1
+    assert len(cache) == 0
+
+
+def test_collection_regiondata():
+    collection = ma5.cutflow.Collection(cutflow_path, xsection=5.689, lumi=139.0)
+    assert collection.regiondata["SRA"] == {"Nf": 1.139115e-03, "N0": 2.277976e01}
+
+    regions = [reg for reg in reference.keys() if reg != "pyhf"]
+    regiondata = {
+        reg: {key: reference[reg][key] for key in ["nobs", "nb", "deltanb"]} for reg in regions
+    }
+    regiondata = ma5.pad.interface.collection_regiondata(collection, regions, regiondata)
+    for reg in regions:
+        assert regiondata[reg]["Nf"] == reference[reg]["Nf"], f"{reg}: Nf does not match"
+        assert regiondata[reg]["N0"] == reference[reg]["N0"], f"{reg}: N0 does not match"
+
+    assert ma5.pad.interface.clean_region_name("SR-2b(high)") == "SR_2b_lp_high_rp_"
+
+
+def _write_info(path, covariance=False, pyhf=False, analysis="atlas_susy_2018_31"):
+    regions = [reg for reg in reference.keys() if reg != "pyhf"]
+    txt = f'<analysis id="{analysis}">\n  <lumi>139</lumi>\n'
+    for reg in regions:
+        subset = ' cov_subset="SRA"' if covariance and reg.startswith("SRA") else ""
+        txt += f'  <region type="signal" id="{reg}"{subset}>\n'
+        for key in ["nobs", "nb", "deltanb"]:
+            txt += f"    <{key}>{reference[reg][key]}</{key}>\n"
+        if covariance and reg.startswith("SRA"):
+            txt += f'    <covariance region="{reg}">{reference[reg]["deltanb"] ** 2}</covariance>\n'
+        txt += "  </region>\n"
+    if pyhf:
+        txt += '  <pyhf id="RegionA">\n    <name>atlas_susy_2018_31_SRA.json</name>\n'
+        txt += '    <regions>\n      <channel name="SR_meff"> SRA_L SRA_M SRA_H </channel>\n'
+        txt += "    </regions>\n  </pyhf>\n"
+    txt += "</analysis>\n"
+    with open(path, "w") as f:
+        f.write(txt)
+
+
+def test_info_file(tmp_path):
+    info_path = str(tmp_path / "atlas_susy_2018_31.info")
+    _write_info(info_path)
+
+    info = ma5.pad.parse_info_file(info_path)
+    assert info.analysis == "atlas_susy_2018_31"
+    assert info.lumi == 139.0
+    assert info.regions == tuple(reg for reg in reference.keys() if reg != "pyhf")
+    assert not info.has_covariance and not info.has_pyhf
+    regiondata = info.regiondata()
+    for reg in info.regions:
+        for key in ["nobs", "nb", "deltanb"]:
+            assert regiondata[reg][key] == reference[reg][key]
+    assert info.nb.tolist() == [reference[reg]["nb"] for reg in info.regions]
+    # memoised
+    assert ma5.pad.parse_info_file(info_path) is info
+
+    _write_info(info_path, covariance=True, pyhf=True)
+    info = ma5.pad.parse_info_file(info_path)
+    assert info.has_covariance and info.has_pyhf
+    cov_regions, matrix = info.covariance["SRA"]
+    assert cov_regions == ("SRA", "SRA_L", "SRA_M", "SRA_H")
+    assert matrix.shape == (4, 4) and matrix[1, 1] == reference["SRA_L"]["deltanb"] ** 2
+    assert info.pyhf["RegionA"]["regions"] == {"SR_meff": ["SRA_L", "SRA_M", "SRA_H"]}
+
+    assert ma5.pad.parse_info_file(info_path, "atlas_susy_2018_31") is info
+    with pytest.raises(ma5.system.exceptions.InvalidInput):
+        ma5.pad.parse_info_file(info_path, "cms_sus_19_006")
+    with open(info_path, "w") as f:
+        f.write('<detector id="atlas_susy_2018_31"><lumi>139</lumi></detector>')
+    with pytest.raises(ma5.system.exceptions.InvalidInput):
+        ma5.pad.parse_info_file(info_path)
+
+
+def test_recast_server(tmp_path):
+    cache_path = str(tmp_path / "exclusion.sqlite")
+    cache = ma5.pad.ExclusionCache(cache_path)
+    key = cache.key(cutflow_path, "atlas_susy_2018_31", PADType.PADForSFS, 5.689)
+    cache.set(key, reference, "atlas_susy_2018_31")
+
+    address = str(tmp_path / "recast.sock")
+    with ma5.pad.RecastServer(address=address, max_workers=1, cache_path=cache_path) as server:
+        server.start()
+        client = ma5.pad.RemotePADInterface(os.path.abspath(sample_path), "defaultset", address)
+        assert client.ping()
+
+        regiondata = client.compute_exclusion("atlas_susy_2018_31", 5.689, PADType.PADForSFS)
+        assert regiondata == reference
+
+        # Workers are not attached to a backend, errors are raised on the client side
+        with pytest.raises(ma5.system.exceptions.BackendException):
+            client.compute_exclusion("atlas_susy_2018_31", 1.0, PADType.PADForSFS)
+
+        # caches of the clients are opened by the workers
+        other = ma5.pad.ExclusionCache(str(tmp_path / "other.sqlite"))
+        other.set(
+            other.key(cutflow_path, "atlas_susy_2018_31", PADType.PADForSFS, 1.0),
+            reference,
+            "atlas_susy_2018_31",
+        )
+        regiondata = client.compute_exclusion(
+            "atlas_susy_2018_31", 1.0, PADType.PADForSFS, cache=other
+        )
+        assert regiondata == reference
+        with pytest.raises(ma5.system.exceptions.PADException):
+            client.compute_exclusion(
+                "atlas_susy_2018_31", 1.0, PADType.PADForSFS, cache=ma5.pad.ExclusionCache()
+            )
+    assert not os.path.exists(address)
+
+
+def test_recast_server_access(tmp_path):
+    address = str(tmp_path / "recast.sock")
+    with ma5.pad.RecastServer(address=address, max_workers=1) as server:
+        assert os.stat(address).st_mode & 0o777 == 0o600
+        assert server.authkey is None
+
+    # TCP connections are always authenticated
+    with ma5.pad.RecastServer(max_workers=1) as server:
+        server.start()
+        assert len(server.authkey) == 32
+        client = ma5.pad.RemotePADInterface(sample_path, "defaultset", server.address)
+        with pytest.raises((pickle.UnpicklingError, EOFError, OSError)):
+            client.ping()
+        client.authkey = server.authkey
+        assert client.ping()
+
+
+@pytest.mark.parametrize("authkey", [None, b"secret"])
+def test_recast_server_shutdown(tmp_path, authkey):
+    address = str(tmp_path / "recast.sock")
+    server = ma5.pad.RecastServer(address=address, authkey=authkey, max_workers=1)
+    thread = server.start()
+    client = ma5.pad.RemotePADInterface(sample_path, "defaultset", address, authkey=authkey)
+    assert client.ping()
+    client.shutdown_server()
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+    assert not os.path.exists(address)
+
+
+def test_prepared_exclusion():
+    pytest.importorskip("scipy")
+    regions = [reg for reg in reference.keys() if reg != "pyhf"]
+    regiondata = {
+        reg: {key: reference[reg][key] for key in ["nobs", "nb", "deltanb", "Nf", "N0"]}
+        for reg in regions
+    }
+    prepared = ma5.pad.PreparedExclusion("atlas_susy_2018_31", 139.0, regions, regiondata)
+    best = [reg for reg in regions if reference[reg]["best"] == 1][0]
+    assert prepared.best_region == best
+
+    results = prepared.evaluate(5.689)
+    for reg in regions:
+        for key in ["s95exp", "s95obs"]:
+            assert np.isclose(results[reg][key], float(reference[reg][key]), rtol=1e-2)
+        assert abs(results[reg]["CLs"] - reference[reg]["CLs"]) < 5e-3
+
+    xsections = np.linspace(0.01, 2.0, 50)
+    cls = prepared.exclusion_cl(xsections)
+    assert cls.shape == (50, len(regions))
+    assert np.all(np.diff(cls[:, regions.index(best)]) >= 0.0)
+
+    excluded = prepared.excluded_xsection()
+    assert np.isclose(excluded, results[best]["s95obs"])
+    assert np.isclose(prepared.exclusion_cl(excluded)[0, regions.index(best)], 0.95, atol=1e-4)
+    assert prepared.excluded_xsection(0.68) < excluded
+
+    # limits in the region data are recomputed so that evaluate agrees with excluded_xsection
+    full = {
+        reg: dict(data, s95exp=reference[reg]["s95exp"], s95obs=1.0)
+        for reg, data in regiondata.items()
+    }
+    prepared = ma5.pad.PreparedExclusion("atlas_susy_2018_31", 139.0, regions, full)
+    assert prepared.evaluate(5.689)[best]["s95obs"] == results[best]["s95obs"]
+    assert np.isclose(prepared.excluded_xsection(), excluded)
+
+
+def test_prepared_exclusion_likelihoods(tmp_path, monkeypatch, caplog):
+    pytest.importorskip("scipy")
+    info_path = str(tmp_path / "atlas_susy_2018_31.info")
+    _write_info(info_path, covariance=True)
+    backend = _FakeBackend({"atlas_susy_2018_31": info_path})
+    monkeypatch.setattr(ma5.backend.BackendManager, "MadAnalysis5", backend)
+
+    interface = ma5.pad.PADInterface(sample_path, "defaultset")
+    prepared = interface.prepare_exclusion(
+        "atlas_susy_2018_31", PADType.PADForSFS, info_file=info_path
+    )
+    assert list(prepared.covariance.keys()) == ["SRA"]
+    results = prepared.evaluate(2.0)
+    # the backend is not used to evaluate the exclusion
+    assert results["SRA"]["CLs"] != 2.0 * 139.0
+    assert np.isclose(
+        prepared.exclusion_cl(2.0)[0, prepared.regions.index("SRA")], results["SRA"]["CLs"]
+    )
+
+    expected = interface.compute_exclusion(
+        "atlas_susy_2018_31", 2.0, PADType.PADForSFS, info_file=info_path
+    )
+    assert results["cov_subset"] == expected["cov_subset"]
+
+    class _Recast:
+        cov_config, pyhf_config = {}, {"RegionA": {}}
+
+    with caplog.at_level("WARNING", logger="ma5_expert"):
+        ma5.pad.PreparedExclusion(
+            "atlas_susy_2018_31", 139.0, prepared.regions, prepared.regiondata, _Recast()
+        )
+    assert "can not be evaluated natively" in caplog.text
+
+    with pytest.raises(ma5.system.exceptions.PADException):
+        ma5.pad.PreparedExclusion(
+            "atlas_susy_2018_31",
+            139.0,
+            ["SRA"],
+            prepared.regiondata,
+            covariance={"SRA": (("SRA", "SRB"), np.eye(2))},
+        )
+
+
+def test_exclusion_configurations():
+    cache = ma5.pad.ExclusionCache()
+    interface = ma5.pad.PADInterface(sample_path, "defaultset")
+    configurations = [
+        (lumi, assumption) for lumi in [None, 300.0] for assumption in ["apriori", "aposteriori"]
+    ]
+    for idx, (lumi, assumption) in enumerate(configurations):
+        key = cache.key(
+            cutflow_path, "atlas_susy_2018_31", PADType.PADForSFS, 5.689, lumi, assumption
+        )
+        cache.set(key, {"SRA": {"CLs": float(idx)}}, "atlas_susy_2018_31")
+
+    results = interface.compute_exclusion_configurations(
+        "atlas_susy_2018_31",
+        5.689,
+        PADType.PADForSFS,
+        luminosities=[None, 300.0],
+        expectation_assumptions=["apriori", "aposteriori"],
+        cache=cache,
+    )
+    assert list(results.keys()) == sorted(configurations, key=lambda x: x[1] == "aposteriori")
+    for idx, config in enumerate(configurations):
+        assert results[config]["SRA"]["CLs"] == float(idx)
+
+    # configurations missing in the cache require the backend
+    with pytest.raises(ma5.system.exceptions.BackendException):
+        interface.compute_exclusion_configurations(
+            "atlas_susy_2018_31", 5.689, PADType.PADForSFS, luminosities=[None, 3000.0], cache=cache
+        )
+
+
+class _FakeRecast:
+    """Recasting session of a fake MadAnalysis 5 backend counting the calls"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.pad = "/nonexistent/PAD"
+        self.cov_config, self.pyhf_config = {}, {}
+
+    def check_xml_scipy_methods(self):
+        return ET
+
+    def SetCLsCalculator(self):
+        pass
+
+    def header_info_file(self, info_tree, analysis, lumi):
+        self.backend.calls["header_info_file"] += 1
+        info = ma5.pad.parse_info_file(self.backend.info_files[analysis], analysis)
+        return (info.lumi if lumi == "default" else lumi), list(info.regions), info.regiondata()
+
+    def read_cutflows(self, path, regions, regiondata):
+        self.backend.calls["read_cutflows"] += 1
+        collection = ma5.cutflow.Collection(path)
+        return ma5.pad.interface.collection_regiondata(collection, regions, regiondata)
+
+    def extract_sig_cls(self, regiondata, regions, lumi, tag):
+        with self.backend.guard():
+            for reg in regions:
+                regiondata[reg][f"s95{tag}"] = 1.0
+        return regiondata
+
+    def pyhf_sig95Wrapper(self, lumi, regiondata, tag):
+        return regiondata
+
+    def extract_cls(self, regiondata, regions, xsection, lumi):
+        with self.backend.guard():
+            for reg in regions:
+                regiondata[reg]["CLs"] = xsection * lumi
+        return regiondata
+
+
+class _FakeBackend:
+    def __init__(self, info_files):
+        self.info_files = info_files
+        self.calls = Counter()
+        self.active, self.max_active = 0, 0
+        self._lock = threading.Lock()
+
+    def get_run_recast(self, sample_path, padtype, expectation_assumption):
+        self.calls["get_run_recast"] += 1
+        return _FakeRecast(self)
+
+    def guard(self):
+        backend = self
+
+        class Guard:
+            def __enter__(self):
+                with backend._lock:
+                    backend.active += 1
+                    backend.max_active = max(backend.max_active, backend.active)
+                time.sleep(0.01)
+
+            def __exit__(self, *args):
+                with backend._lock:
+                    backend.active -= 1
+
+        return Guard()
+
+
+def test_exclusion_configurations_backend(tmp_path, monkeypatch):
+    info_path = str(tmp_path / "atlas_susy_2018_31.info")
+    _write_info(info_path)
+    backend = _FakeBackend({"atlas_susy_2018_31": info_path})
+    monkeypatch.setattr(ma5.backend.BackendManager, "MadAnalysis5", backend)
+
+    interface = ma5.pad.PADInterface(sample_path, "defaultset")
+    results = interface.compute_exclusion_configurations(
+        "atlas_susy_2018_31",
+        2.0,
+        PADType.PADForSFS,
+        luminosities=[None, 300.0],
+        expectation_assumptions=["apriori", "aposteriori"],
+        info_file=info_path,
+    )
+    assert len(results) == 4
+    # one session per assumption, cutflows are read once
+    assert backend.calls["get_run_recast"] == 2
+    assert backend.calls["read_cutflows"] == 1
+    # the default luminosity is taken from the native parser, other ones from MadAnalysis 5
+    assert backend.calls["header_info_file"] == 2
+    for (lumi, assumption), regiondata in results.items():
+        assert regiondata["SRA"]["CLs"] == 2.0 * (139.0 if lumi is None else lumi)
+        assert regiondata["SRA"]["Nf"] == reference["SRA"]["Nf"]
+        assert ("s95obs" in regiondata["SRA"]) == (lumi is None)
+
+
+def test_exclusion_covariance_backend(tmp_path, monkeypatch):
+    pytest.importorskip("scipy")
+    info_path = str(tmp_path / "atlas_susy_2018_31.info")
+    _write_info(info_path, covariance=True)
+    backend = _FakeBackend({"atlas_susy_2018_31": info_path})
+    monkeypatch.setattr(ma5.backend.BackendManager, "MadAnalysis5", backend)
+
+    results = ma5.pad.PADInterface(sample_path, "defaultset").compute_exclusion_configurations(
+        "atlas_susy_2018_31",
+        2.0,
+        PADType.PADForSFS,
+        expectation_assumptions=["apriori", "aposteriori"],
+        info_file=info_path,
+    )
+    # covariance matrices are combined natively for the a priori assumption only
+    assert backend.calls["header_info_file"] == 1
+    assert "cov_subset" not in results[(None, "aposteriori")]
+    combined = results[(None, "apriori")]["cov_subset"]["SRA"]
+
+    info = ma5.pad.parse_info_file(info_path)
+    cov_regions, matrix = info.covariance["SRA"]
+    regiondata = ma5.cutflow.Collection(cutflow_path).regiondata
+    regiondata = {
+        reg: dict(data, **regiondata[reg]) for reg, data in info.regiondata(cov_regions).items()
+    }
+    expected = ma5.statistics.compute_combined_regiondata(
+        regiondata, cov_regions, matrix, 2.0, 139.0, "SRA"
+    )["cov_subset"]["SRA"]
+    assert combined == expected
+
+
+def test_sample_exclusion_backend(tmp_path, monkeypatch):
+    sample = str(tmp_path / "sample")
+    shutil.copytree(sample_path, sample)
+    dataset = os.path.join(sample, "Output/SAF/defaultset")
+    shutil.copytree(
+        os.path.join(dataset, "atlas_susy_2018_31"), os.path.join(dataset, "atlas_copy")
+    )
+    info_files = {}
+    for analysis in ["atlas_susy_2018_31", "atlas_copy"]:
+        info_files[analysis] = str(tmp_path / f"{analysis}.info")
+        _write_info(info_files[analysis], analysis=analysis)
+    backend = _FakeBackend(info_files)
+    monkeypatch.setattr(ma5.backend.BackendManager, "MadAnalysis5", backend)
+
+    report = ma5.pad.PADInterface(sample, "defaultset").compute_sample_exclusion(
+        {analysis: PADType.PADForSFS for analysis in info_files},
+        2.0,
+        info_files=info_files,
+        n_threads=2,
+    )
+    assert report.errors == {}
+    for analysis in info_files:
+        assert report[analysis]["SRA"]["CLs"] == 2.0 * 139.0
+        assert report[analysis]["SRA"]["Nf"] == reference["SRA"]["Nf"]
+    # one shared session, cutflows are read natively and the backend runs one call at a time
+    assert backend.calls["get_run_recast"] == 1
+    assert backend.calls["read_cutflows"] == 0
+    assert backend.max_active == 1
+
+
+def test_sample_exclusion_invalid_info(tmp_path, monkeypatch):
+    sample = str(tmp_path / "sample")
+    shutil.copytree(sample_path, sample)
+    dataset = os.path.join(sample, "Output/SAF/defaultset")
+    shutil.copytree(
+        os.path.join(dataset, "atlas_susy_2018_31"), os.path.join(dataset, "atlas_copy")
+    )
+    info_files = {
+        analysis: str(tmp_path / f"{analysis}.info")
+        for analysis in ["atlas_susy_2018_31", "atlas_copy"]
+    }
+    _write_info(info_files["atlas_susy_2018_31"])
+    # info file of another analysis
+    _write_info(info_files["atlas_copy"])
+    backend = _FakeBackend(info_files)
+    monkeypatch.setattr(ma5.backend.BackendManager, "MadAnalysis5", backend)
+
+    report = ma5.pad.PADInterface(sample, "defaultset").compute_sample_exclusion(
+        {analysis: PADType.PADForSFS for analysis in info_files}, 2.0, info_files=info_files
+    )
+    assert report["atlas_susy_2018_31"]["SRA"]["CLs"] == 2.0 * 139.0
+    assert list(report.errors.keys()) == ["atlas_copy"]
+    # the MadAnalysis 5 parser has been tried after the native one
+    assert backend.calls["header_info_file"] == 1
+
+
+def test_sample_exclusion():
+    cache = ma5.pad.ExclusionCache()
+    key = cache.key(cutflow_path, "atlas_susy_2018_31", PADType.PADForSFS, 5.689)
+    cache.set(key, reference, "atlas_susy_2018_31")
+
+    interface = ma5.pad.PADInterface(sample_path, "defaultset")
+    report = interface.compute_sample_exclusion(
+        {"atlas_susy_2018_31": PADType.PADForSFS, "cms_sus_19_006": PADType.PAD},
+        5.689,
+        cache=cache,
+        n_threads=2,
+    )
+    assert report["atlas_susy_2018_31"] == reference
+    assert list(report.errors.keys()) == ["cms_sus_19_006"]
+
+    best = [reg for reg in reference.keys() if reference[reg].get("best", 0) == 1][0]
+    assert report.best == ("atlas_susy_2018_31", best)
+    assert report.exclusion_cl == reference[best]["CLs"]
+    assert report.is_excluded() == (reference[best]["CLs"] >= 0.95)
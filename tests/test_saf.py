@@ -0,0 +1,131 @@
+import os
+
+import numpy as np
+import pytest
+
+import ma5_expert as ma5
+from ma5_expert.system.exceptions import InvalidInput
+from ma5_expert.tools.SafMerger import merge_outputs, merge_sample_info, read_histos
+from ma5_expert.tools.SafReader import SAF, SampleInfoRegistry
+
+saf_file = (
+    "docs/examples/mass1000005_300.0_mass1000022_60.0_mass1000023_250.0_xs_5.689/Output/"
+    "SAF/defaultset/defaultset.saf"
+)
+
+
+def test_sample_info():
+    saf = SAF(saf_file=saf_file)
+
+    assert saf.xsec == 5.694940, f"Expected 5.694940, got {saf.xsec}"
+    assert saf.xsection == saf.get_xsec()
+    assert saf.Nevents == 200000, f"Expected 200000, got {saf.Nevents}"
+    assert len(saf.FileInfo) == 4, f"Expected 4 files, got {len(saf.FileInfo)}"
+    assert saf.FileInfo[0].endswith("run_04/tag_1_pythia8_events.hepmc.gz")
+
+    detailed = saf.SampleDetailedInfo
+    assert detailed["Nevents"].tolist() == [50000] * 4
+    assert np.allclose(detailed["xsec"], [5.695710, 5.698110, 5.688680, 5.697260])
+    expected = round((5.695710 + 5.698110 + 5.688680 + 5.697260) / 4.0, 8)
+    assert saf.get_detailedXsec() == expected, f"Expected {expected}, got {saf.get_detailedXsec()}"
+
+
+def test_sample_info_sections():
+    saf = SAF(saf_file=saf_file, sections=["SampleGlobalInfo"], xsection=2.0)
+
+    assert saf.xsec == 2.0, f"Expected 2.0, got {saf.xsec}"
+    assert "FileInfo" not in saf.saf and "SampleDetailedInfo" not in saf.saf
+    assert saf.get_detailedXsec() == 0.0
+
+
+def test_sample_info_json(tmp_path):
+    saf = SAF(saf_file=saf_file)
+    output = str(tmp_path / "defaultset.json")
+    assert saf.save(output=output)
+
+    loaded = SAF(load=output)
+    assert loaded.xsec == saf.xsec
+    assert loaded.get_detailedXsec() == saf.get_detailedXsec()
+
+
+def test_sample_info_registry():
+    SampleInfoRegistry.invalidate()
+
+    first = SAF(saf_file=saf_file, xsection=1.0)
+    second = SAF(saf_file=saf_file)
+
+    assert SampleInfoRegistry.info()["misses"] == 1
+    assert SampleInfoRegistry.info()["hits"] == 1
+    assert first.SampleDetailedInfo["xsec"] is second.SampleDetailedInfo["xsec"]
+    # cross section overwrite should not leak into the shared information
+    assert first.xsec == 1.0 and second.xsec == 5.694940
+
+    # callers can not modify the shared information
+    first.saf["SampleGlobalInfo"]["Nevents"] = -1
+    first.saf["FileInfo"].append("other.hepmc")
+    third = SAF(saf_file=saf_file)
+    assert third.Nevents == second.Nevents != -1
+    assert third.FileInfo == second.FileInfo
+    assert not third.SampleDetailedInfo["xsec"].flags.writeable
+    assert set(SAF(saf_file=saf_file, sections=["FileInfo"]).saf.keys()) == {"FileInfo"}
+
+    SampleInfoRegistry.invalidate(saf_file)
+    assert SampleInfoRegistry.info()["size"] == 0
+
+
+def test_merge_outputs(tmp_path):
+    sample_path = saf_file.split("/Output/")[0]
+    output = merge_outputs(
+        [sample_path, sample_path, sample_path], str(tmp_path / "merged"), n_workers=2
+    )
+
+    merged = ma5.sample.SampleCollection(output, "defaultset", lumi=139.0)
+    original = ma5.sample.SampleCollection(sample_path, "defaultset", lumi=139.0)
+
+    assert merged.saf.Nevents == 3 * original.saf.Nevents
+    assert np.isclose(merged.xsection, original.xsection)
+    assert len(merged.saf.FileInfo) == 12
+    assert np.isclose(merged.saf.get_detailedXsec(), original.saf.get_detailedXsec())
+
+    for region, cutflow in original["atlas_susy_2018_31"].cutflows.items():
+        other = merged["atlas_susy_2018_31"].cutflows[region]
+        assert [cut.name for cut in cutflow] == [cut.name for cut in other]
+        for cut, merged_cut in zip(cutflow, other):
+            assert merged_cut.Nentries == 3 * cut.Nentries
+            assert np.isclose(merged_cut.sumW, 3 * cut.sumW)
+            assert np.isclose(merged_cut.sumW2, 3 * cut.sumW2)
+            assert np.isclose(merged_cut.Nevents, cut.Nevents)
+
+    for name in original["atlas_susy_2018_31"].histograms.histo_names:
+        histo = original["atlas_susy_2018_31"].histograms[name]
+        other = merged["atlas_susy_2018_31"].histograms[name]
+        assert np.allclose(other.weights, histo.weights)
+        assert np.allclose(other.bins, histo.bins)
+
+    histos = "Output/SAF/defaultset/atlas_susy_2018_31/Histograms/histos.saf"
+    for histo, other in zip(
+        read_histos(os.path.join(sample_path, histos)), read_histos(os.path.join(output, histos))
+    ):
+        assert histo["description"] == other["description"]
+        assert np.allclose(other["statistics"], 3 * histo["statistics"], rtol=1e-6)
+        assert np.allclose(other["data"], 3 * histo["data"], rtol=1e-6)
+
+    with pytest.raises(InvalidInput):
+        merge_outputs([sample_path, str(tmp_path / "missing")], str(tmp_path / "other"))
+
+
+def test_merge_sample_info_order(tmp_path):
+    with open(saf_file, "r") as f:
+        content = f.read()
+    paths = []
+    for idx in range(10):
+        paths.append(str(tmp_path / f"job{idx}.saf"))
+        with open(paths[-1], "w") as f:
+            f.write(content.replace("/Events/run_", f"/Events/job{idx}_run_"))
+
+    serial = merge_sample_info(paths)
+    parallel = merge_sample_info(paths, n_workers=2)
+    assert len(serial["files"]) == 40
+    assert parallel["files"] == serial["files"]
+    assert np.array_equal(parallel["detailed"], serial["detailed"])
+    assert np.allclose(parallel["global"], serial["global"])
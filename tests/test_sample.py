@@ -0,0 +1,24 @@
+import ma5_expert as ma5
+
+sample_path = "docs/examples/mass1000005_300.0_mass1000022_60.0_mass1000023_250.0_xs_5.689"
+
+
+def test_sample_collection():
+    sample = ma5.sample.SampleCollection(sample_path, "defaultset", lumi=139.0, n_threads=2)
+
+    assert sample.analysis_names == ["atlas_susy_2018_31"]
+    assert sample.xsection == 5.694940, f"Expected 5.694940, got {sample.xsection}"
+
+    analysis = sample["atlas_susy_2018_31"]
+    assert analysis.cutflows.collection_name == "atlas_susy_2018_31"
+    assert len(analysis.cutflows.SRnames) == 10
+    assert analysis.cutflows.SRA[0].xsec == sample.xsection
+    assert analysis.histograms.size == 6
+    assert analysis.histograms.lumi == 139.0
+
+    reference = ma5.cutflow.Collection(
+        sample_path + "/Output/SAF/defaultset/atlas_susy_2018_31/Cutflows",
+        xsection=sample.xsection,
+        lumi=139.0,
+    )
+    assert analysis.cutflows.SRA.final_cut.Nevents == reference.SRA.final_cut.Nevents
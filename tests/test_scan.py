@@ -0,0 +1,277 @@
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import ma5_expert as ma5
+
+workspace = "docs/examples"
+sample_name = "mass1000005_300.0_mass1000022_60.0_mass1000023_250.0_xs_5.689"
+
+
+def test_catalogue(tmp_path):
+    root = str(tmp_path / "workspace")
+    sample_path = os.path.join(root, sample_name)
+    shutil.copytree(os.path.join(workspace, sample_name), sample_path)
+
+    with ma5.scan.Catalogue(str(tmp_path / "catalogue.sqlite")) as catalogue:
+        stats = catalogue.scan(root)
+        assert stats["skipped"] == 0
+
+        assert catalogue.samples() == [sample_path]
+        assert catalogue.samples(analysis="atlas_susy_2018_31") == [sample_path]
+        assert catalogue.datasets(sample_path) == ["defaultset"]
+        assert catalogue.analyses(sample_path, "defaultset") == ["atlas_susy_2018_31"]
+        assert catalogue.sample_info_file(sample_path, "defaultset").endswith("defaultset.saf")
+
+        regions = [
+            x[0] for x in catalogue.region_files(sample_path, "defaultset", "atlas_susy_2018_31")
+        ]
+        assert len(regions) == 10 and "SRA_M" in regions
+        histos = catalogue.histogram_files(sample_path, "defaultset", "atlas_susy_2018_31")
+        assert [x[0] for x in histos] == ["histos.saf"]
+
+        # unchanged tree should not be listed again
+        stats = catalogue.scan(root)
+        assert stats["listed"] == 0, f"Expected no listed directory, got {stats}"
+
+        cutflows = os.path.join(sample_path, "Output/SAF/defaultset/atlas_susy_2018_31/Cutflows")
+        shutil.copy(os.path.join(cutflows, "SRA.saf"), os.path.join(cutflows, "SRX.saf"))
+        os.remove(os.path.join(cutflows, "SRC_28.saf"))
+        stats = catalogue.scan(root)
+        assert stats["listed"] == 1, f"Expected one listed directory, got {stats}"
+        assert "SRX" in catalogue.regions("atlas_susy_2018_31")
+        assert "SRC_28" not in catalogue.regions("atlas_susy_2018_31")
+
+        # files are taken from the index, not from the sample folder
+        shutil.copy(os.path.join(cutflows, "SRA.saf"), os.path.join(cutflows, "SRY.saf"))
+        sample = catalogue.load(sample_path, "defaultset", lumi=139.0)
+        assert "SRX" in sample["atlas_susy_2018_31"].cutflows.SRnames
+        assert "SRY" not in sample["atlas_susy_2018_31"].cutflows.SRnames
+        assert sample["atlas_susy_2018_31"].histograms.size == 6
+
+        # a sample still running during the first scan is picked up once it is finished
+        pending = os.path.join(root, "pending")
+        os.makedirs(os.path.join(pending, "Output"))
+        catalogue.scan(root)
+        assert catalogue.samples() == [sample_path]
+        shutil.copytree(
+            os.path.join(sample_path, "Output", "SAF"), os.path.join(pending, "Output", "SAF")
+        )
+        catalogue.scan(root)
+        assert catalogue.samples() == [sample_path, pending]
+        assert catalogue.analyses(pending, "defaultset") == ["atlas_susy_2018_31"]
+
+
+def test_result_store():
+    sample_path = os.path.join(workspace, sample_name)
+    sample = ma5.sample.SampleCollection(sample_path, lumi=139.0)
+
+    with ma5.scan.ResultStore() as store:
+        store.add_sample(sample, name="point_1")
+        store.add_collection("point_2", "atlas_susy_2018_31", sample["atlas_susy_2018_31"].cutflows)
+
+        assert store.samples().tolist() == ["point_1", "point_2"]
+
+        SRA = sample["atlas_susy_2018_31"].cutflows.SRA
+        values = store.query("atlas_susy_2018_31", "SRA")
+        assert values["Nentries"].tolist() == [SRA.final_cut.Nentries] * 2
+        assert values["sumW"].tolist() == [SRA.final_cut.sumW] * 2
+
+        samples, nevents = store.yields("atlas_susy_2018_31", "SRA")
+        assert np.allclose(nevents, SRA.final_cut.Nevents)
+        assert store.query("atlas_susy_2018_31", "SRA", cut=0)["Nentries"].tolist() == [200000] * 2
+
+        assert store.select("atlas_susy_2018_31", "SRA_M", min_events=3.0).size == 2
+        assert store.select("atlas_susy_2018_31", "SRA_M", min_events=3.0, lumi=1.0).size == 0
+
+
+def test_result_store_replace(tmp_path):
+    sample_path = os.path.join(workspace, sample_name)
+    cutflows = os.path.join(sample_path, "Output/SAF/defaultset/atlas_susy_2018_31/Cutflows")
+    short = str(tmp_path / "Cutflows")
+    shutil.copytree(cutflows, short)
+    # remove the last cut of SRA
+    with open(os.path.join(short, "SRA.saf"), "r") as f:
+        content = f.read()
+    with open(os.path.join(short, "SRA.saf"), "w") as f:
+        f.write(content[: content.rindex("<Counter>")])
+
+    full = ma5.cutflow.Collection(cutflows, xsection=1.0, lumi=139.0)
+    short = ma5.cutflow.Collection(short, xsection=1.0, lumi=139.0)
+    with ma5.scan.ResultStore() as store:
+        store.add_collection("point", "atlas_susy_2018_31", full)
+        store.add_collection("point", "atlas_susy_2018_31", short)
+        values = store.query("atlas_susy_2018_31", "SRA")
+        assert values["sample"].tolist() == ["point"]
+        assert values["Nentries"].tolist() == [short.SRA.final_cut.Nentries]
+        assert store.query("atlas_susy_2018_31", "SRA", cut=len(full.SRA) - 1)["sample"].size == 0
+
+
+def test_scan_runner(tmp_path):
+    output = str(tmp_path / "scan" / "results.jsonl")
+    points = [
+        ma5.scan.ScanPoint(f"sample_{idx}", "atlas_susy_2018_31", 0.1 * (idx + 1))
+        for idx in range(4)
+    ]
+    calls = []
+
+    def compute(point):
+        calls.append(point.sample_path)
+        if point.sample_path == "sample_1" and calls.count("sample_1") < 3:
+            raise RuntimeError("node evicted")
+        if point.sample_path == "sample_3":
+            raise ValueError("bad sample")
+        return {"SRA": {"CLs": point.xsection}}
+
+    policy = ma5.scan.RetryPolicy(max_attempts=2, retry_on=(RuntimeError,))
+    runner = ma5.scan.ScanRunner(output, retry=policy, compute=compute)
+    assert runner.run(points) == {"completed": 2, "skipped": 0, "failed": 2}
+    assert calls == ["sample_0", "sample_1", "sample_1", "sample_2", "sample_3"]
+
+    # simulate a run interrupted in the middle of a record
+    with open(output, "a") as f:
+        f.write('{"key": "trunc')
+
+    ncalls = len(calls)
+    policy.max_attempts = 3
+    runner = ma5.scan.ScanRunner(output, retry=policy, compute=compute)
+    assert runner.run(points) == {"completed": 1, "skipped": 3, "failed": 0}
+    # only the retryable failure is recomputed
+    assert calls[ncalls:] == ["sample_1"]
+
+    results = runner.results()
+    assert len(results) == 3
+    assert results[points[1].key]["regiondata"] == {"SRA": {"CLs": 0.2}}
+    assert ma5.scan.ScanPoint.from_dict(results[points[1].key]["point"]) == points[1]
+    assert runner.status()[points[3].key] == {"status": "failed", "attempts": 1, "retry": False}
+
+
+def _exclusion(point):
+    return {"SRA": {"CLs": point.xsection}}
+
+
+def _worker(directory):
+    ma5.scan.ShardedScan(directory, compute=_exclusion).work()
+
+
+def test_sharded_scan(tmp_path):
+    directory = str(tmp_path / "scan")
+    points = [
+        ma5.scan.ScanPoint(f"sample_{idx}", "atlas_susy_2018_31", float(idx)) for idx in range(20)
+    ]
+    scan = ma5.scan.ShardedScan.create(directory, points, n_shards=6, compute=_exclusion)
+    assert sorted(p.key for idx in range(6) for p in scan.shard(idx)) == sorted(
+        p.key for p in points
+    )
+    # an abandoned claim is taken over
+    with open(scan.path("claims", 0), "w") as f:
+        f.write("{}")
+    os.utime(scan.path("claims", 0), (0, 0))
+
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_worker, args=(directory,)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=60)
+        assert worker.exitcode == 0
+
+    assert scan.status()["done"] == list(range(6))
+    results = scan.reduce(str(tmp_path / "results.jsonl"))
+    assert {key: item["regiondata"]["SRA"]["CLs"] for key, item in results.items()} == {
+        point.key: point.xsection for point in points
+    }
+    # every point has been computed exactly once
+    assert (
+        sum(len(list(ma5.scan.ScanRunner(scan.path("results", idx)).records())) for idx in range(6))
+        == 20
+    )
+
+    # re-creating the same scan reuses the directory, a different one is refused
+    assert ma5.scan.ShardedScan.create(directory, points, n_shards=6).n_shards == 6
+    with pytest.raises(ma5.system.exceptions.InvalidInput):
+        ma5.scan.ShardedScan.create(directory, points[:10], n_shards=6)
+
+
+def test_sharded_scan_claims(tmp_path):
+    directory = str(tmp_path / "scan")
+    points = [ma5.scan.ScanPoint(f"sample_{idx}", "atlas_susy_2018_31", 1.0) for idx in range(3)]
+    failures = {"sample_1"}
+
+    def compute(point):
+        if point.sample_path in failures:
+            failures.discard(point.sample_path)
+            raise RuntimeError("node evicted")
+        time.sleep(0.3)
+        return {"SRA": {"CLs": point.xsection}}
+
+    policy = ma5.scan.RetryPolicy(max_attempts=2, retry_on=(RuntimeError,))
+    scan = ma5.scan.ShardedScan.create(
+        directory, points, n_shards=1, compute=compute, retry=ma5.scan.RetryPolicy(1), lease=0.2
+    )
+    claim = scan.path("claims", 0)
+
+    # a live claim is kept, an abandoned one is taken over
+    with open(claim, "w") as f:
+        f.write('{"worker": "other"}')
+    assert not scan.claim(0, "me")
+    os.utime(claim, (0, 0))
+    assert scan.claim(0, "me")
+    with open(claim, "r") as f:
+        assert json.load(f)["worker"] == "me"
+    os.remove(claim)
+
+    # the claim is refreshed while a point runs longer than the lease
+    claimed = []
+    thread = threading.Thread(target=lambda: claimed.append(scan.work("first")))
+    thread.start()
+    time.sleep(0.5)
+    assert not ma5.scan.ShardedScan(directory, compute=compute, lease=0.2).claim(0, "second")
+    thread.join()
+
+    # failed points release the shard instead of marking it as done
+    assert claimed == [[0]]
+    assert scan.status() == {"pending": [0], "running": [], "done": []}
+    scan.retry = policy
+    assert scan.work("second") == [0]
+    assert scan.status()["done"] == [0]
+    assert len(scan.reduce()) == 3
+
+
+def test_sharded_scan_heartbeat(tmp_path):
+    points = [ma5.scan.ScanPoint("sample", "atlas_susy_2018_31", 1.0)]
+    scan = ma5.scan.ShardedScan.create(str(tmp_path / "scan"), points, n_shards=1)
+    claim = scan.path("claims", 0)
+    assert scan.claim(0, "me")
+
+    # the heartbeat survives a claim which is missing for a moment
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=scan._heartbeat, args=(claim, "me", 0.02, stop))
+    heartbeat.start()
+    os.rename(claim, claim + ".moved")
+    time.sleep(0.1)
+    os.rename(claim + ".moved", claim)
+    os.utime(claim, (0, 0))
+    time.sleep(0.1)
+    assert heartbeat.is_alive()
+    assert os.stat(claim).st_mtime > 0
+
+    # and stops once another worker owns the claim
+    with open(claim, "w") as f:
+        f.write('{"worker": "other"}')
+    heartbeat.join(timeout=1)
+    assert not heartbeat.is_alive()
+    stop.set()
+
+    # claims of other workers are not released, missing claims are ignored
+    scan._release(claim, "me")
+    assert os.path.exists(claim)
+    scan._release(claim, "other")
+    assert not os.path.exists(claim)
+    scan._release(claim, "other")
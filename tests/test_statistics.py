@@ -0,0 +1,130 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("scipy")
+
+from ma5_expert import statistics
+
+sample_path = "docs/examples/mass1000005_300.0_mass1000022_60.0_mass1000023_250.0_xs_5.689"
+
+with open(os.path.join(sample_path, "Output/SAF/defaultset/CLs_output.json"), "r") as f:
+    reference = json.load(f)["atlas_susy_2018_31"]["regiondata"]
+regions = [reg for reg in reference.keys() if reg != "pyhf"]
+
+
+def test_counting_regiondata():
+    """Compare against MadAnalysis 5 results, reference values are computed with toys"""
+    regiondata = {
+        reg: {key: reference[reg][key] for key in ["nobs", "nb", "deltanb", "Nf", "N0"]}
+        for reg in regions
+    }
+    regiondata = statistics.compute_regiondata(regiondata, xsection=5.689, lumi=139.0)
+
+    for reg in regions:
+        for key in ["s95exp", "s95obs"]:
+            assert np.isclose(
+                regiondata[reg][key], float(reference[reg][key]), rtol=1e-2
+            ), f"{reg}: expected {key} = {reference[reg][key]}, got {regiondata[reg][key]}"
+        assert np.isclose(
+            regiondata[reg]["CLs"], reference[reg]["CLs"], atol=5e-3
+        ), f"{reg}: expected CLs = {reference[reg]['CLs']}, got {regiondata[reg]['CLs']}"
+        assert regiondata[reg]["best"] == reference[reg]["best"]
+
+
+def test_counting_vectorised():
+    nobs = np.array([17.0, 12.0, 3.0, 2.0])
+    nb = np.array([17.1, 8.4, 5.7, 3.0])
+    deltanb = np.array([2.7795863, 1.7, 0.8, 1.5])
+
+    s95 = statistics.upper_limit(nobs, nb, deltanb)
+    assert s95.shape == (4,)
+    assert np.allclose(statistics.exclusion_cl(nobs, nb, deltanb, s95), 0.95, atol=1e-5)
+
+    nsignal = np.linspace(0.0, 20.0, 50)[:, np.newaxis] * np.ones((1, 4))
+    cls = statistics.CLs(nobs, nb, deltanb, nsignal)
+    assert cls.shape == (50, 4)
+    assert np.allclose(cls[0], 1.0)
+    assert np.all(np.diff(cls, axis=0) <= 0.0), "CLs should decrease with the signal yield"
+    for idx in range(4):
+        assert np.isclose(
+            statistics.CLs(nobs[idx], nb[idx], deltanb[idx], nsignal[7, idx]), cls[7, idx]
+        )
+
+
+def test_simplified_likelihood():
+    nobs, nb, deltanb = (
+        np.array([12.0, 3.0, 2.0]),
+        np.array([8.4, 5.7, 3.0]),
+        np.array([1.7, 0.8, 1.5]),
+    )
+    correlation = np.array([[1.0, 0.5, 0.2], [0.5, 1.0, 0.3], [0.2, 0.3, 1.0]])
+    model = statistics.SimplifiedLikelihood(nobs, nb, correlation * np.outer(deltanb, deltanb))
+
+    nsignal = np.random.default_rng(1).uniform(0.0, 5.0, size=(100, 3))
+    cls = model.CLs(nsignal)
+    assert cls.shape == (100,)
+    for idx in [0, 42, 99]:
+        assert np.isclose(model.CLs(nsignal[idx]), cls[idx])
+
+    mu95 = model.upper_limit(nsignal[:10])
+    assert np.allclose(model.CLs(nsignal[:10] * mu95[:, np.newaxis]), 0.05, atol=1e-4)
+    mu95_exp = model.upper_limit(nsignal[:10], expected=True)
+    assert np.allclose(model.CLs(nsignal[:10], mu=mu95_exp, expected=True), 0.05, atol=1e-4)
+
+    regiondata = {
+        reg: {"nobs": nobs[idx], "nb": nb[idx], "Nf": 1e-3 * (idx + 1), "N0": 1.0}
+        for idx, reg in enumerate(["SR1", "SR2", "SR3"])
+    }
+    regiondata = statistics.compute_combined_regiondata(
+        regiondata,
+        ["SR1", "SR2", "SR3"],
+        correlation * np.outer(deltanb, deltanb),
+        xsection=0.1,
+        lumi=139.0,
+    )
+    result = regiondata["cov_subset"]["combined"]
+    nsignal = np.array([1e-3, 2e-3, 3e-3]) * 139.0 * 1000.0
+    assert np.isclose(result["s95obs"], model.upper_limit(nsignal), rtol=1e-4)
+    assert np.isclose(result["CLs"], model.exclusion_cl(0.1 * nsignal))
+
+
+def test_simplified_likelihood_reference():
+    from scipy.stats import norm
+
+    # without uncertainty, q~mu of a single region has a closed form (arXiv:1007.1727)
+    nobs, nb = 12.0, 8.4
+    nsignal = np.linspace(1.0, 20.0, 10)
+    model = statistics.SimplifiedLikelihood([nobs], [nb], [[1e-8]])
+
+    def llhd(n, lam):
+        return n * np.log(lam) - lam
+
+    muhat = (nobs - nb) / nsignal
+    sqrt_q = np.sqrt(
+        np.where(muhat > 1.0, 0.0, 2.0 * (llhd(nobs, max(nobs, nb)) - llhd(nobs, nsignal + nb)))
+    )
+    sqrt_qA = np.sqrt(2.0 * (llhd(nb, nb) - llhd(nb, nsignal + nb)))
+    cls = np.where(
+        sqrt_q <= sqrt_qA,
+        norm.cdf(-sqrt_q) / norm.cdf(sqrt_qA - sqrt_q),
+        norm.cdf(-(sqrt_q**2 + sqrt_qA**2) / (2.0 * sqrt_qA))
+        / norm.cdf(-(sqrt_q**2 - sqrt_qA**2) / (2.0 * sqrt_qA)),
+    )
+    assert np.allclose(model.CLs(nsignal[:, np.newaxis]), cls, rtol=1e-6)
+
+    # single region with large yields reduces to the counting experiment
+    nobs, nb, deltanb = 390.0, 400.0, 20.0
+    model = statistics.SimplifiedLikelihood([nobs], [nb], [[deltanb**2]])
+    nsignal = np.linspace(10.0, 80.0, 8)
+    assert np.allclose(
+        model.CLs(nsignal[:, np.newaxis]),
+        statistics.CLs(nobs, nb, deltanb, nsignal),
+        rtol=0.06,
+        atol=1e-3,
+    )
+    assert np.isclose(
+        model.upper_limit([1.0]), statistics.upper_limit(nobs, nb, deltanb), rtol=0.02
+    )